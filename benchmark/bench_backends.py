@@ -0,0 +1,35 @@
+"""
+Benchmark of the parser backends: parse and extract every fixture article with the BeautifulSoup
+backend and with the lxml backend, and check that both produce the same output. Run from the
+repository root:
+
+    python -m benchmark.bench_backends
+"""
+import time
+from modules import NewsGrabber
+from benchmark.bench_extraction import load_config, load_articles
+
+
+def run(grabber, articles, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        results = [grabber.extract_soup(grabber._backend.parse(text)) for text in articles]
+    return (time.perf_counter() - start) / (rounds * len(articles)), results
+
+
+def main(rounds=20):
+    print('{0:<10} {1:>10} {2:>10} {3:>8} {4:>10}'.format('site', 'bs4', 'lxml', 'speedup', 'identical'))
+    for sitename in ('detik', 'kompas', 'liputan6'):
+        config = load_config(sitename)
+        articles = load_articles(sitename)
+        timings = {}
+        results = {}
+        for backend in ('bs4', 'lxml'):
+            config['parser'] = backend
+            timings[backend], results[backend] = run(NewsGrabber(config), articles, rounds)
+        print('{0:<10} {1:>8.3f}ms {2:>8.3f}ms {3:>7.2f}x {4:>10}'.format(
+            sitename, timings['bs4'] * 1000, timings['lxml'] * 1000, timings['bs4'] / timings['lxml'], str(results['bs4'] == results['lxml'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark of the content cleaning: the single pass TextCleaner against the three passes it replaced (kept below
+as legacy_cleaner: the remove regex, the replace regex and the collapse of the line break runs). Both give the same
+result, the benchmark counts the contents cleaned differently. The input is the article element of the fixture
+articles, as _format_content gets it. Run from the repository root:
+
+    python -m benchmark.bench_cleaning
+"""
+import re
+import time
+from modules import NewsGrabber
+from modules.extraction_plan import compile_multireplace
+from modules.text_cleaner import spc_chars
+from benchmark.bench_extraction import load_config, load_articles
+from benchmark.bench_suite import sites
+
+
+def legacy_cleaner(config):
+    """
+    Cleaning of NewsGrabber._format_content before the TextCleaner.
+    :param config dict: format rule
+    :rtype: function
+    """
+    regex = r'(?:<script(?:\s|\S)*?<\/script>)|(?:<style(?:\s|\S)*?<\/style>)|(?:<!--(?:\s|\S)*?-->)'
+    if 'regex_remove' in config:
+        regex += '|'+'|'.join(config['regex_remove'])
+    if 'replace' in config:
+        replace = dict(config['replace'])
+        replace.update(spc_chars)
+        regex += '|'+''.join(map(lambda tag: '(?!'+re.escape(tag)+')', replace))+r'(?:<\/?(?:\s|\S)*?>)'
+    else:
+        replace = dict(spc_chars)
+        regex += '|'+r'(<\/?(\s|\S)*?>)'
+    clean_regex = re.compile(regex)
+    replace_regex = compile_multireplace(replace)
+    br_run_regex = re.compile(r"(?:<br\/?>){3,}")
+
+    def clean(text):
+        text = replace_regex.sub(lambda match: replace[match.group(0)], clean_regex.sub('', text))
+        return br_run_regex.sub('<br><br>', text)
+    return clean
+
+
+def load_contents(sitename):
+    """
+    Raw html of the elements of the site cleaned by a format rule, in the fixture articles.
+    :rtype: list of (content, format rule)
+    """
+    grabber = NewsGrabber(load_config(sitename))
+    backend = grabber._backend
+    contents = []
+    for rule in grabber._plan.rules:
+        if rule.format is None or rule.format.cleaner is None:
+            continue
+        for text in load_articles(sitename):
+            tag = backend.find(grabber._find_container({(): backend.parse(text)}, rule.container), rule.selector)
+            if tag is None:
+                continue
+            for selector in rule.format.bs_remove:
+                for el in backend.find_all(tag, selector):
+                    backend.decompose(el)
+            contents.append((backend.to_string(tag), rule.format))
+    return contents
+
+
+def bench(cleaners, contents, rounds):
+    """
+    :param cleaners dict: {id of the format rule: cleaning function}
+    :rtype: float, seconds per content
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for content, rule in contents:
+            cleaners[id(rule)](content)
+    return (time.perf_counter() - start) / (rounds * len(contents))
+
+
+def main(rounds=200):
+    print('{0:<10} {1:>8} {2:>10} {3:>10} {4:>10} {5:>8}'.format('site', 'contents', 'different', 'legacy', 'cleaner', 'speedup'))
+    for sitename in sites:
+        contents = load_contents(sitename)
+        legacy = dict((id(rule), legacy_cleaner(dict(rule.options))) for _, rule in contents)
+        cleaners = dict((id(rule), rule.cleaner.clean) for _, rule in contents)
+        different = len([content for content, rule in contents if legacy[id(rule)](content) != rule.cleaner.clean(content)])
+        legacy_time = bench(legacy, contents, rounds)
+        cleaner_time = bench(cleaners, contents, rounds)
+        print('{0:<10} {1:>8} {2:>10} {3:>8.1f}us {4:>8.1f}us {5:>7.1f}x'.format(
+            sitename, len(contents), different, legacy_time * 1e6, cleaner_time * 1e6, legacy_time / cleaner_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of the date parsing: the compiled DateParser against the parser it replaced (kept below as
+legacy_date_parser), over the dates of the fixture articles and of the sites. Both give the same result,
+except for the rules declaring "date_formats" (the legacy parser ignores them, and reads the detik
+publishdate 2017/04/01 as the 4th of january). "cold" clears the result cache before every round,
+"cached" parses dates already seen, as on a listing page. Run from the repository root:
+
+    python -m benchmark.bench_dates
+"""
+import re
+import time
+from dateutil.parser import parser as dp
+from modules import NewsGrabber
+from modules.date_parser import DateParser
+from modules.extraction_plan import compile_multireplace
+from benchmark.bench_extraction import load_config, load_articles
+from benchmark.bench_suite import sites, date_samples
+
+
+def legacy_date_parser(date, config):
+    """
+    NewsGrabber._date_parser before the compiled DateParser, every call rebuilds its tables and regexes.
+    """
+    if not isinstance(date, str):
+        raise TypeError('date argument is expected to be a string')
+    month = {'january': '01', 'february': '02', 'march': '03', 'april': '04', 'may': '05', 'june': '06',
+             'july': '07', 'august': '08', 'september': '09', 'october': '10', 'november': '11', 'december': '12'}
+    shortMonth = {'jan': '01', 'feb': '02', 'mar': '03', 'apr': '04', 'jun': '06', 'jul': '07', 'aug': '08', 'ags': '08',
+                  'agu': '08', 'sep': '09', 'oct': '10', 'okt': '10', 'nov': '11', 'dec': '12', 'des': '12'}
+    bulan = {'januari': '01', 'februari': '02', 'maret': '03', 'april': '04', 'mei': '05', 'juni': '06', 'juli': '07',
+             'agustus': '08', 'september': '09', 'oktober': '10', 'nopember': '11', 'desember': '12'}
+    if 'normalize_date' not in config or config["normalize_date"]:
+        repl = {}
+        repl.update(month)
+        repl.update(shortMonth)
+        repl.update(bulan)
+        date = compile_multireplace(repl).sub(lambda match: repl[match.group(0)], date.lower())
+    if "date_regex" in config and len(config["date_regex"]) > 0:
+        reg = re.compile(config["date_regex"])
+        try:
+            matches = reg.search(date).groupdict()
+            date = '{d}/{m}/{y} {h}:{i}'.format_map(matches)
+        except Exception as e:
+            date = re.sub(r'[^0-9:\s\/\-]', '', date)
+    else:
+        date = re.sub(r'[^0-9:\s\/\-]', '', date)
+
+    try:
+        parser = dp()
+        df = True if 'day_first' not in config or config['day_first'] else False
+        dateObj = parser.parse(date, dayfirst=df)
+        return dateObj.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        return None
+
+
+def load_dates():
+    """
+    Dates of the fixture articles (extracted with the date rules of the site configs) and the sample dates.
+    :rtype: list of (date, format options)
+    """
+    dates = list(date_samples)
+    for sitename in sites:
+        grabber = NewsGrabber(load_config(sitename))
+        for rule in grabber._plan.rules:
+            if rule.format is None or rule.format.type != 'date':
+                continue
+            for text in load_articles(sitename):
+                soup = grabber._backend.parse(text)
+                tag = grabber._backend.find(grabber._find_container({(): soup}, rule.container), rule.selector)
+                if tag is not None:
+                    date = grabber._backend.get_attr(tag, rule.save_attr) if rule.save_attr else grabber._backend.get_text(tag)
+                    dates.append((date, dict(rule.format.options)))
+    return dates
+
+
+def main(rounds=200):
+    dates = load_dates()
+    parsers = dict((id(options), DateParser(options)) for _, options in dates)
+    mismatches = [(date, options) for date, options in dates if legacy_date_parser(date, options) != parsers[id(options)].parse(date)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for date, options in dates:
+            legacy_date_parser(date, options)
+    legacy = (time.perf_counter() - start) / (rounds * len(dates))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for parser in parsers.values():
+            parser.parse.cache_clear()
+        for date, options in dates:
+            parsers[id(options)].parse(date)
+    cold = (time.perf_counter() - start) / (rounds * len(dates))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for date, options in dates:
+            parsers[id(options)].parse(date)
+    cached = (time.perf_counter() - start) / (rounds * len(dates))
+
+    print('{0} dates, {1} parsed differently by the legacy parser'.format(len(dates), len(mismatches)))
+    for date, options in mismatches:
+        print('  {0!r} {1}: {2!r} != {3!r}'.format(date, options, legacy_date_parser(date, options), parsers[id(options)].parse(date)))
+    print('{0:<10} {1:>10} {2:>10} {3:>10}'.format('', 'legacy', 'cold', 'cached'))
+    print('{0:<10} {1:>8.2f}us {2:>8.2f}us {3:>8.2f}us'.format('per date', legacy * 1e6, cold * 1e6, cached * 1e6))
+    print('{0:<10} {1:>10} {2:>9.1f}x {3:>9.1f}x'.format('speedup', '', legacy / cold, legacy / cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark of the extraction stage (NewsGrabber.extract_soup) over the fixture articles.
+
+Compares the precompiled extraction plan with compiling the site config for every article,
+which is what the extraction used to do. Pages are parsed before the clock starts, so the
+columns only show the extraction itself. Run from the repository root:
+
+    python -m benchmark.bench_extraction
+"""
+import gc
+import glob
+import json
+import os
+import time
+from modules import NewsGrabber
+from modules.extraction_plan import ExtractionPlan
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixture_dir = os.path.join(root_dir, 'benchmark', 'fixtures')
+
+
+def load_config(sitename):
+    with open(os.path.join(root_dir, 'config', sitename+'.conf.json')) as conf_file:
+        return json.load(conf_file)
+
+
+def load_articles(sitename):
+    articles = []
+    for filename in sorted(glob.glob(os.path.join(fixture_dir, sitename, 'article-*.html'))):
+        with open(filename) as f:
+            articles.append(f.read())
+    return articles
+
+
+def bench(fn, soups):
+    """
+    Time fn over pre-parsed soups (extraction mutates the soup, so each run needs its own).
+    :rtype: float, seconds per article
+    """
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    for soup in soups:
+        fn(soup)
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    return elapsed / len(soups)
+
+
+def best_of(fn, parse_all, repeat):
+    return min(bench(fn, parse_all()) for _ in range(repeat))
+
+
+def main(rounds=20, repeat=5):
+    print('{0:<10} {1:>14} {2:>10} {3:>8}'.format('site', 'per-article', 'plan', 'speedup'))
+    for sitename in ('detik', 'kompas', 'liputan6'):
+        config = load_config(sitename)
+        articles = load_articles(sitename)
+        grabber = NewsGrabber(config)
+
+        def parse_all():
+            return [grabber._backend.parse(text) for _ in range(rounds) for text in articles]
+
+        slow = best_of(lambda soup: grabber.extract_soup(soup, ExtractionPlan(config['to_extract'])), parse_all, repeat)
+        fast = best_of(grabber.extract_soup, parse_all, repeat)
+        print('{0:<10} {1:>12.3f}ms {2:>8.3f}ms {3:>7.2f}x'.format(sitename, slow * 1000, fast * 1000, slow / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Offline benchmark suite of the crawl pipeline: link extraction (LinkExtractor.get_urls) and grabbing
+(NewsGrabber.process) against the local replay server, then page parsing, extraction (extract_soup),
+date parsing (_date_parser) and the json (array and JSON Lines) and parquet output providers over the recorded fixtures.
+Every benchmark reports its time per item (best of the rounds) and its peak memory (tracemalloc).
+The time is the cpu time of the process (the replay server included), wall time varies too much
+between runs on a shared machine to catch regressions.
+
+Results can be saved and later compared, the comparison fails (exit status 1) when a benchmark is slower
+or uses more memory than the saved results by more than the tolerance. Run from the repository root:
+
+    python -m benchmark.bench_suite --save benchmark/results/baseline.json
+    python -m benchmark.bench_suite --compare benchmark/results/baseline.json
+
+The saved baseline is only meaningful on the machine it was recorded on, save a new one before comparing elsewhere.
+The fixtures are recorded with benchmark.recorder.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from modules import LinkExtractor, NewsGrabber
+from output_providers import JsonProvider, ParquetProvider, parquet_provider
+from benchmark.bench_extraction import load_config, load_articles
+from benchmark.replay import ReplayServer, load_manifest
+
+sites = ('detik', 'kompas', 'liputan6')
+
+# dates as written by the sites, with the format options of their config
+date_samples = [
+    ('Kamis, 27 April 2017 18:55 WIB', {}),
+    ('Kamis 27 Apr 2017, 11:33 WIB', {}),
+    ('27/04/2017, 18:55 WIB', {}),
+    ('Rabu, 03 Mei 2017 | 09:12 WIB', {}),
+    ('Selasa, 14 Nopember 2017 07:05', {}),
+    ('2017-04-27T18:55:02+07:00', {'normalize_date': False}),
+    ('27 Agustus 2017, 21:40 WIB', {'date_regex': r'(?P<d>\d{1,2}) (?P<m>\d{2}) (?P<y>\d{4}), (?P<h>\d{2}):(?P<i>\d{2})'})
+]
+
+
+def measure(fn, setup=None, rounds=5):
+    """
+    Time fn over the rounds and measure the peak memory of one more call.
+    :param fn function: benchmarked function, takes the result of setup and returns the number of items processed
+    :param setup function: prepares the input of a call, not timed
+    :param rounds int: timed calls
+    :rtype: dict
+    """
+    timings = []
+    cpu_timings = []
+    for _ in range(rounds):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        items = fn(arg)
+        cpu_timings.append(time.process_time() - cpu_start)
+        timings.append(time.perf_counter() - start)
+
+    arg = setup() if setup is not None else None
+    gc.collect()
+    tracemalloc.start()
+    fn(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min(timings)
+    best_cpu = min(cpu_timings)
+    return {
+        'items': items,
+        'seconds': best,
+        'cpu_seconds': best_cpu,
+        'per_item_ms': best_cpu * 1000 / max(items, 1),
+        'items_per_second': items / best if best else 0,
+        'peak_kb': peak / 1024
+    }
+
+
+def bench_site(server, sitename, rounds):
+    """
+    Run every benchmark of a site.
+    :rtype: dict {benchmark name: result}
+    """
+    config = load_config(sitename)
+    start_url = load_manifest(sitename)['start_url']
+    fetcher = server.fetcher()
+    grabber = NewsGrabber(config, fetcher=fetcher)
+    articles = load_articles(sitename)
+    results = {}
+
+    links = LinkExtractor(config, start_url=start_url, fetcher=fetcher).get_urls()
+    results['links'] = measure(lambda _: len(LinkExtractor(config, start_url=start_url, fetcher=fetcher).get_urls()), rounds=rounds)
+    results['grab'] = measure(lambda _: len(grabber.process(list(links))), rounds=rounds)
+
+    # repeat the articles, a single pass is too short to time
+    pages = articles * 20
+    results['parse'] = measure(lambda _: len([grabber._backend.parse(text) for text in pages]), rounds=rounds)
+    # the extraction mutates the parsed pages, every round gets its own
+    results['extract'] = measure(
+        lambda soups: len([grabber.extract_soup(soup) for soup in soups]),
+        setup=lambda: [grabber._backend.parse(text) for text in pages], rounds=rounds)
+
+    dates = [(date, options) for date, options in date_samples] * 200
+    results['date_parser'] = measure(lambda _: len([grabber._date_parser(date, options) for date, options in dates]), rounds=rounds)
+
+    news = grabber.process(list(links)) * 50
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, sitename + '.json')
+
+        def save(_):
+            JsonProvider(path, True).save(news)
+            return len(news)
+
+        def save_batches(_):
+            provider = JsonProvider(path, True)
+            for i in range(0, len(news), 50):
+                provider.save_batch(news[i:i + 50])
+            provider.close()
+            return len(news)
+
+        def save_lines(_):
+            provider = JsonProvider(path + 'l', lines=True)
+            for i in range(0, len(news), 50):
+                provider.save_batch(news[i:i + 50])
+            provider.close()
+            return len(news)
+
+        results['json_provider'] = measure(save, rounds=rounds)
+        results['json_provider_batch'] = measure(save_batches, rounds=rounds)
+        results['jsonl_provider'] = measure(save_lines, rounds=rounds)
+
+        def save_parquet(_):
+            provider = ParquetProvider(os.path.join(tmp_dir, sitename + '.parquet'), site=sitename, noox_config=config.get('noox_config'))
+            for i in range(0, len(news), 50):
+                provider.save_batch(news[i:i + 50])
+            provider.close()
+            return len(news)
+
+        # pyarrow is optional
+        if parquet_provider.pyarrow is not None:
+            results['parquet_provider'] = measure(save_parquet, rounds=rounds)
+    fetcher.close()
+    return results
+
+
+def run(rounds=10, latency=0):
+    """
+    Run the suite over every site.
+    :param rounds int: timed rounds of each benchmark
+    :param latency float: seconds added to every replayed response
+    :rtype: dict
+    """
+    server = ReplayServer(sites, latency=latency)
+    try:
+        results = {}
+        for sitename in sites:
+            for name, result in bench_site(server, sitename, rounds).items():
+                results['{0}/{1}'.format(sitename, name)] = result
+    finally:
+        server.close()
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rounds': rounds,
+        'latency': latency,
+        'results': results
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Print the change of every benchmark from the baseline.
+    :param report dict: current results
+    :param baseline dict: saved results
+    :param tolerance float: allowed slowdown or memory growth (0.3 is 30%)
+    :rtype: list of str, the regressed benchmarks
+    """
+    regressions = []
+    print('{0:<30} {1:>12} {2:>12} {3:>8} {4:>8}'.format('benchmark', 'per-item', 'baseline', 'time', 'memory'))
+    for name, result in sorted(report['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            print('{0:<30} {1:>10.4f}ms {2:>12}'.format(name, result['per_item_ms'], 'new'))
+            continue
+        time_change = result['per_item_ms'] / base['per_item_ms'] - 1 if base['per_item_ms'] else 0
+        memory_change = result['peak_kb'] / base['peak_kb'] - 1 if base['peak_kb'] else 0
+        regressed = time_change > tolerance or memory_change > tolerance
+        if regressed:
+            regressions.append(name)
+        print('{0:<30} {1:>10.4f}ms {2:>10.4f}ms {3:>+7.0%} {4:>+7.0%}{5}'.format(
+            name, result['per_item_ms'], base['per_item_ms'], time_change, memory_change, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def print_report(report):
+    print('{0:<30} {1:>6} {2:>12} {3:>12} {4:>10}'.format('benchmark', 'items', 'per-item', 'items/s', 'peak'))
+    for name, result in sorted(report['results'].items()):
+        print('{0:<30} {1:>6} {2:>10.4f}ms {3:>12.1f} {4:>8.0f}KB'.format(
+            name, result['items'], result['per_item_ms'], result['items_per_second'], result['peak_kb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark suite of the crawl pipeline.')
+    parser.add_argument('-r', '--rounds', type=int, default=10, help='timed rounds of each benchmark (default = 10)')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every replayed response (default = 0)')
+    parser.add_argument('--save', type=str, help='save the results to this json file')
+    parser.add_argument('--compare', type=str, help='compare the results with this json file, exit status is 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed slowdown or memory growth when comparing (default = 0.3)')
+    args = parser.parse_args()
+
+    report = run(args.rounds, args.latency)
+    if args.save is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+            f.write('\n')
+    if args.compare is None:
+        print_report(report)
+        return
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print('{0} benchmark(s) regressed: {1}'.format(len(regressions), ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
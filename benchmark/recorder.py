@@ -0,0 +1,102 @@
+"""
+Record the sitemaps and articles of a site into benchmark/fixtures/<site>, replayed by benchmark.replay.
+The crawl is the same as nooxcrawler's: links are extracted from the site url, then the articles are grabbed.
+Needs network, run from the repository root:
+
+    python -m benchmark.recorder detik kompas liputan6 --limit 10
+"""
+import argparse
+import glob
+import io
+import json
+import os
+from modules import LinkExtractor, NewsGrabber, Fetcher
+from benchmark.replay import fixture_dir, replay_url
+from benchmark.bench_extraction import load_config
+
+
+class RecordingFetcher(Fetcher):
+    """
+    Fetcher saving the body of every successful response to the fixture directory of a site.
+    """
+
+    def __init__(self, directory, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        # file name prefix of the next responses, the articles are named article-<n>.html
+        self.prefix = 'page'
+        self.responses = {}
+        self._counts = {}
+
+    def get(self, url, **kwargs):
+        stream = kwargs.pop('stream', False)
+        # conditional requests would record empty 304 responses
+        kwargs.pop('headers', None)
+        resp = super().get(url, **kwargs)
+        recorded = self.responses.get(replay_url(url))
+        # an article already read while extracting the links is recorded again under the article prefix
+        if resp.status_code == 200 and (recorded is None or not recorded['file'].startswith(self.prefix + '-')):
+            self._save(url, resp)
+        if stream:
+            # the body is already read, hand it to the stream readers (e.g. SitemapReader) from memory
+            resp.raw = io.BytesIO(resp.content)
+        return resp
+
+    def save_manifest(self, start_url):
+        with open(os.path.join(self.directory, 'manifest.json'), 'w') as f:
+            json.dump({'start_url': start_url, 'responses': self.responses}, f, indent=4)
+            f.write('\n')
+
+    def _save(self, url, resp):
+        body = resp.content
+        if body[:2] == b'\x1f\x8b':
+            ext = '.xml.gz'
+        elif body.lstrip()[:5] == b'<?xml':
+            ext = '.xml'
+        else:
+            ext = '.html'
+        count = self._counts.get(self.prefix, 0)
+        self._counts[self.prefix] = count + 1
+        filename = '{0}-{1}{2}'.format(self.prefix, count, ext)
+        with open(os.path.join(self.directory, filename), 'wb') as f:
+            f.write(body)
+        if replay_url(url) in self.responses:
+            os.unlink(os.path.join(self.directory, self.responses[replay_url(url)]['file']))
+        self.responses[replay_url(url)] = {'file': filename, 'content_type': resp.headers.get('Content-Type', 'text/html')}
+
+
+def record(sitename, limit):
+    """
+    Replace the fixtures of a site with a fresh recording.
+    :param sitename str: site name
+    :param limit int: number of articles to record
+    :rtype: int, number of recorded responses
+    """
+    config = load_config(sitename)
+    directory = os.path.join(fixture_dir, sitename)
+    os.makedirs(directory, exist_ok=True)
+    for filename in glob.glob(os.path.join(directory, '*')):
+        os.unlink(filename)
+
+    fetcher = RecordingFetcher(directory)
+    try:
+        links = LinkExtractor(config, fetcher=fetcher).get_urls(max_link=limit)[:limit]
+        fetcher.prefix = 'article'
+        NewsGrabber(config, fetcher=fetcher).process(links)
+    finally:
+        fetcher.close()
+    fetcher.save_manifest(config['url'])
+    return len(fetcher.responses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record the benchmark fixtures of the sites.')
+    parser.add_argument('-l', '--limit', type=int, default=10, help='articles to record per site (default = 10)')
+    parser.add_argument('sites', nargs='+', help='sites to record')
+    args = parser.parse_args()
+    for sitename in args.sites:
+        print('Recorded {0} responses of {1}...'.format(record(sitename, args.limit), sitename))
+
+
+if __name__ == '__main__':
+    main()
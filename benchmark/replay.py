@@ -0,0 +1,111 @@
+"""
+Local stand-in for the news sites: serves the recorded responses of benchmark/fixtures, so the crawl
+benchmarks run without network. The fetcher uses the server as its http proxy, so the crawler requests
+the original urls and the site configs are used as they are.
+
+    server = ReplayServer(['detik', 'kompas', 'liputan6'])
+    fetcher = server.fetcher()
+    ...
+    server.close()
+"""
+import json
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from modules.fetcher import Fetcher
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def replay_url(url):
+    """
+    Url of a response in the manifests: https is replayed over plain http (the proxy does not tunnel tls).
+    :param url str: requested url
+    :rtype: str
+    """
+    if url.startswith('https://'):
+        url = 'http://' + url[len('https://'):]
+    # "http://detik.com" is requested as "http://detik.com/"
+    return url[:-1] if url.count('/') == 3 and url.endswith('/') else url
+
+
+def load_manifest(sitename):
+    """
+    Load the recorded responses of a site.
+    :param sitename str: site name
+    :rtype: dict {'start_url': str, 'responses': {url: {'file', 'content_type'}}}
+    """
+    with open(os.path.join(fixture_dir, sitename, 'manifest.json')) as f:
+        return json.load(f)
+
+
+class ReplayFetcher(Fetcher):
+    """
+    Fetcher sending every request to the replay server.
+    """
+
+    def get(self, url, **kwargs):
+        return super().get(replay_url(url), **kwargs)
+
+
+class ReplayServer:
+    """
+    Serve the recorded responses of the given sites from a background thread, unknown urls are 404.
+    """
+
+    def __init__(self, sitenames, host='127.0.0.1', port=0, latency=0):
+        # {url: (file path, content type)}
+        self._responses = {}
+        for sitename in sitenames:
+            for url, response in load_manifest(sitename)['responses'].items():
+                self._responses[replay_url(url)] = (os.path.join(fixture_dir, sitename, response['file']), response['content_type'])
+        # seconds added to every response, to simulate the network round trip
+        self.latency = latency
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.address = 'http://{0}:{1}'.format(*self._server.server_address)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def fetcher(self, **kwargs):
+        """
+        Create a fetcher using the server as its proxy.
+        :rtype: ReplayFetcher
+        """
+        return ReplayFetcher(proxies={'http': self.address, 'https': self.address}, retries=0, **kwargs)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class ReplayHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, nagle would delay the body by the peer's delayed ack
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                # proxied requests carry the absolute url, direct requests only the path
+                url = self.path if self.path.startswith('http://') else 'http://' + self.headers.get('Host', '') + self.path
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                response = server._responses.get(replay_url(url))
+                if response is None:
+                    self.send_error(404)
+                    return
+                with open(response[0], 'rb') as f:
+                    body = f.read()
+                self.send_response(200)
+                self.send_header('Content-Type', response[1])
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return ReplayHandler
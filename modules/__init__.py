@@ -1,2 +1,12 @@
 from modules.link_extractor import LinkExtractor
 from modules.news_grabber import NewsGrabber
+from modules.fetcher import Fetcher
+from modules.crawl_state import CrawlState
+from modules.url_dedup import UrlDedup
+from modules.seen_index import SeenIndex
+from modules.image_downloader import ImageDownloader
+from modules.work_queue import SqliteWorkQueue
+from modules.politeness import PolitenessScheduler
+from modules.metrics import Metrics, get_metrics
+from modules.response_archive import ResponseArchive, ArchiveFetcher
+from modules.near_dup_index import NearDupIndex
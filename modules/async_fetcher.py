@@ -0,0 +1,139 @@
+import time
+import asyncio
+from urllib.parse import urlparse
+from modules.fetcher import Fetcher, retry_delay
+from modules.metrics import get_metrics
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncFetcher:
+    """
+    Fetch a batch of urls concurrently using asyncio.
+    The number of requests in flight is limited both per host and globally,
+    the PolitenessScheduler (when given) spaces the requests of every host.
+    Like the Fetcher, requests are retried with backoff on 5xx responses, connection errors and timeouts,
+    and go through the proxy of their scheme when proxies are given.
+    """
+
+    # statuses retried, as by the Fetcher (429 and 503 through the scheduler when one is given)
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(self, headers=None, max_total=16, max_per_host=None, timeout=30, scheduler=None, archive=None, retries=3, backoff_factor=0.5, proxies=None):
+        if aiohttp is None:
+            raise ImportError('aiohttp is required for concurrent fetching (pip install aiohttp)')
+        if not isinstance(max_total, int) or max_total < 1:
+            raise ValueError('max_total is expected to be a positive int')
+
+        self._headers = headers if headers is not None else {}
+        self._max_total = max_total
+        # when per host limit is not supplied, a single host may use the whole global limit
+        self._max_per_host = max_per_host if max_per_host is not None else max_total
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        # {scheme: proxy url}, aiohttp only supports http proxies
+        self._proxies = proxies if proxies is not None else {}
+        self._scheduler = scheduler
+        # ResponseArchive receiving the body of every successful response
+        self._archive = archive
+        if scheduler is not None:
+            self._max_per_host = min(self._max_per_host, scheduler.max_in_flight)
+        self._session = None
+        # keep one loop for the fetcher lifetime so the connection pool is reused between batches
+        self._loop = asyncio.new_event_loop()
+
+    def fetch_all(self, urls, headers=None):
+        """
+        Fetch all given urls concurrently.
+        :param urls list: urls to fetch
+        :param headers dict: additional request headers per url {url: headers}
+        :rtype: list of (url, text, response headers) tuple in the same order as urls,
+                text is None when the request failed or the page is not modified (304)
+        """
+        return self._loop.run_until_complete(self._fetch_all(urls, headers if headers is not None else {}))
+
+    def close(self):
+        """
+        Close the underlying session and event loop.
+        """
+        if self._loop.is_closed():
+            return
+        if self._session is not None:
+            self._loop.run_until_complete(self._session.close())
+            self._session = None
+        self._loop.close()
+
+    async def _fetch_all(self, urls, headers):
+        if self._session is None:
+            # the connector enforces both the global and the per host limit
+            connector = aiohttp.TCPConnector(limit=self._max_total, limit_per_host=self._max_per_host)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=self._timeout))
+        return await asyncio.gather(*[self._fetch(url, headers.get(url)) for url in urls])
+
+    async def _fetch(self, url, headers):
+        metrics = get_metrics()
+        parsed = urlparse(url)
+        host = parsed.netloc
+        proxy = self._proxies.get(parsed.scheme)
+        attempt = 0
+        while True:
+            if self._scheduler is not None:
+                # every attempt books a slot, the scheduler backs off after a 429 or 503, and reserving
+                # the first slot of a host reads its robots.txt, keep it off the event loop
+                await asyncio.sleep(await self._loop.run_in_executor(None, self._scheduler.reserve, url))
+            try:
+                return await self._get(url, headers, proxy, host, final=attempt >= self._retries)
+            except _RetryableStatus as e:
+                if self._scheduler is None or e.status not in Fetcher.throttle_statuses:
+                    await asyncio.sleep(retry_delay(e.retry_after, self._backoff_factor, attempt))
+            except Exception:
+                if attempt >= self._retries:
+                    metrics.inc('noox_http_requests_total', host=host, status=0)
+                    return url, None, None
+                await asyncio.sleep(self._backoff_factor * 2 ** attempt)
+            attempt += 1
+
+    async def _get(self, url, headers, proxy, host, final):
+        """
+        Send a single attempt of a request.
+        :param final bool: whether this is the last attempt, a retried status is then returned instead of retried
+        :rtype: tuple of (url, text, response headers)
+        """
+        metrics = get_metrics()
+        start = time.monotonic()
+        async with self._session.get(url, headers=headers, proxy=proxy) as resp:
+            if self._scheduler is not None:
+                self._scheduler.feedback(url, resp.status, resp.headers, time.monotonic() - start)
+            metrics.inc('noox_http_requests_total', host=host, status=resp.status)
+            if resp.status in self.retry_statuses and not final:
+                metrics.observe('noox_http_request_seconds', time.monotonic() - start, host=host)
+                raise _RetryableStatus(resp.status, resp.headers.get('Retry-After'))
+            if resp.status == 304:
+                metrics.observe('noox_http_request_seconds', time.monotonic() - start, host=host)
+                return url, None, resp.headers
+            # read() caches the body, text() decodes it without reading again
+            body = await resp.read()
+            metrics.inc('noox_http_bytes_total', len(body), host=host)
+            metrics.observe('noox_http_request_seconds', time.monotonic() - start, host=host)
+            if self._archive is not None and resp.status == 200:
+                # the archive writes to disk, keep it off the event loop
+                await self._loop.run_in_executor(None, self._archive.write, url, resp.status, resp.reason, resp.headers, body)
+            return url, await resp.text(errors='replace'), resp.headers
+
+
+class _RetryableStatus(Exception):
+    """
+    Raised by an attempt answered with one of the retry_statuses.
+    """
+
+    def __init__(self, status, retry_after=None):
+        super(_RetryableStatus, self).__init__(status)
+        self.status = status
+        self.retry_after = retry_after
@@ -0,0 +1,119 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class CrawlState:
+    """
+    Persistent per url crawl state (ETag, Last-Modified, sitemap <lastmod> and content hash) stored in a SQLite file.
+    Used to send conditional requests and to skip sitemaps and articles that have not changed since the last run.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS `crawl_state` ('
+        '`url` TEXT PRIMARY KEY, '
+        '`etag` TEXT, '
+        '`last_modified` TEXT, '
+        '`lastmod` TEXT, '
+        '`content_hash` TEXT, '
+        '`checked_at` REAL)'
+    )
+
+    def __init__(self, path):
+        if not isinstance(path, str):
+            raise TypeError('path parameter is expected to be str')
+        self.path = path
+        # the link extractor worker pool may share the state, so guard the connection with a lock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(self._schema)
+        self._db.commit()
+
+    def get(self, url):
+        """
+        Return the stored state of a url.
+        :param url str: url to look up
+        :rtype: dict or None
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT `etag`, `last_modified`, `lastmod`, `content_hash` FROM `crawl_state` WHERE `url` = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'lastmod': row[2], 'content_hash': row[3]}
+
+    def conditional_headers(self, url):
+        """
+        Build If-None-Match/If-Modified-Since headers from the stored validators of a url.
+        :param url str: url to request
+        :rtype: dict
+        """
+        state = self.get(url)
+        headers = {}
+        if state is not None:
+            if state['etag']:
+                headers['If-None-Match'] = state['etag']
+            if state['last_modified']:
+                headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def is_unchanged(self, url, lastmod):
+        """
+        Check whether a url has already been crawled with the same sitemap <lastmod>.
+        :param url str: url to check
+        :param lastmod str: <lastmod> value from the sitemap
+        :rtype: bool
+        """
+        if lastmod is None:
+            return False
+        state = self.get(url)
+        return state is not None and state['lastmod'] == lastmod and state['content_hash'] is not None
+
+    def is_same_lastmod(self, url, lastmod):
+        """
+        Check whether the stored <lastmod> of a url (e.g. a sitemap listed in a sitemap index) equals the given one.
+        :param url str: url to check
+        :param lastmod str: <lastmod> value from the sitemap index
+        :rtype: bool
+        """
+        if lastmod is None:
+            return False
+        state = self.get(url)
+        return state is not None and state['lastmod'] == lastmod
+
+    def update(self, url, headers=None, lastmod=None, content_hash=None):
+        """
+        Record the validators of a successfully processed response.
+        :param url str: requested url
+        :param headers dict: response headers (ETag and Last-Modified are stored)
+        :param lastmod str: sitemap <lastmod>, kept as is when None
+        :param content_hash str: hash of the response body, kept as is when None
+        """
+        etag = None
+        last_modified = None
+        if headers is not None:
+            etag = headers.get('ETag')
+            last_modified = headers.get('Last-Modified')
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO `crawl_state` (`url`, `etag`, `last_modified`, `lastmod`, `content_hash`, `checked_at`) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(`url`) DO UPDATE SET `etag` = excluded.`etag`, `last_modified` = excluded.`last_modified`, '
+                '`lastmod` = COALESCE(excluded.`lastmod`, `lastmod`), `content_hash` = COALESCE(excluded.`content_hash`, `content_hash`), '
+                '`checked_at` = excluded.`checked_at`',
+                (url, etag, last_modified, lastmod, content_hash, time.time()))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def hash_content(text):
+        """
+        Hash a response body.
+        :param text str: response body
+        :rtype: str
+        """
+        return hashlib.md5(text.encode('utf8')).hexdigest()
@@ -0,0 +1,156 @@
+import re
+import json
+from datetime import datetime
+from functools import lru_cache
+from dateutil.parser import parser as dp
+
+# month names (english, short and indonesian) replaced by their number before parsing
+month_numbers = {
+    'january': '01',
+    'february': '02',
+    'march': '03',
+    'april': '04',
+    'may': '05',
+    'june': '06',
+    'july': '07',
+    'august': '08',
+    'september': '09',
+    'october': '10',
+    'november': '11',
+    'december': '12',
+    'jan': '01',
+    'feb': '02',
+    'mar': '03',
+    'apr': '04',
+    'jun': '06',
+    'jul': '07',
+    'aug': '08',
+    'ags': '08',
+    'agu': '08',
+    'sep': '09',
+    'oct': '10',
+    'okt': '10',
+    'nov': '11',
+    'dec': '12',
+    'des': '12',
+    'januari': '01',
+    'februari': '02',
+    'maret': '03',
+    'mei': '05',
+    'juni': '06',
+    'juli': '07',
+    'agustus': '08',
+    'oktober': '10',
+    'nopember': '11',
+    'desember': '12'
+}
+# longest names first, 'januari' is replaced as a whole instead of 'jan' + 'uari'
+month_regex = re.compile('|'.join(map(re.escape, sorted(month_numbers, key=len, reverse=True))))
+
+# everything but digits, separators and spaces is dropped before parsing
+strip_regex = re.compile(r'[^0-9:\s\/\-]')
+
+# shapes of the cleaned dates parsed without dateutil, with the same result
+# 2017/04/27 18:55(:02)
+ymd_regex = re.compile(r'\s*(\d{4})([/-])(\d{1,2})\2(\d{1,2})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*$')
+# 27 04 2017 18:55(:02), 27/04/2017 18:55, 27-04-2017  18:55
+dmy_regex = re.compile(r'\s*(\d{1,2})([/\- ])(\d{1,2})\2(\d{4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*$')
+
+output_format = '%Y-%m-%d %H:%M:%S'
+
+
+class DateParser:
+    """
+    Date parser of a "date" format rule, compiled once per site.
+    The cleaned date is parsed with the explicit "date_formats" of the rule (datetime.strptime), then with the
+    builtin numeric shapes, and with dateutil as a last resort. Results are cached on the raw string, the same
+    dates come back on every article of a listing.
+    """
+
+    def __init__(self, options, cache_size=4096):
+        self.normalize = 'normalize_date' not in options or bool(options['normalize_date'])
+        if 'date_regex' in options and len(options['date_regex']) > 0:
+            self.date_regex = re.compile(options['date_regex'])
+        else:
+            self.date_regex = None
+        self.day_first = 'day_first' not in options or bool(options['day_first'])
+        # strptime formats of the cleaned date (month names are already numbers when normalize_date is on)
+        self.formats = tuple(options.get('date_formats', ()))
+        self._dateutil = dp()
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, date):
+        """
+        Parse a date to "YYYY-mm-dd HH:MM:SS".
+        :param date str: date to parse
+        :rtype: str or None when the date cannot be parsed
+        """
+        if not isinstance(date, str):
+            raise TypeError('date argument is expected to be a string')
+        date = self.clean(date)
+        for format_ in self.formats:
+            try:
+                return datetime.strptime(date.strip(), format_).strftime(output_format)
+            except ValueError:
+                pass
+        parsed = self._parse_numeric(date)
+        if parsed is not None:
+            return parsed.strftime(output_format)
+        try:
+            return self._dateutil.parse(date, dayfirst=self.day_first).strftime(output_format)
+        except Exception as e:
+            return None
+
+    def clean(self, date):
+        """
+        Replace the month names and apply the date regex of the rule.
+        :param date str: raw date
+        :rtype: str
+        """
+        if self.normalize:
+            date = month_regex.sub(lambda match: month_numbers[match.group(0)], date.lower())
+        if self.date_regex is not None:
+            try:
+                return '{d}/{m}/{y} {h}:{i}'.format_map(self.date_regex.search(date).groupdict())
+            except Exception as e:
+                pass
+        return strip_regex.sub('', date)
+
+    def _parse_numeric(self, date):
+        """
+        Parse the numeric shapes dateutil would read the same way.
+        :param date str: cleaned date
+        :rtype: datetime or None to fall back to dateutil
+        """
+        if self.day_first:
+            # with day_first, dateutil reads 2017/04/01 as the 4th of january, only the day first shape is safe
+            match = dmy_regex.match(date)
+            if match is None:
+                return None
+            day, month, year = match.group(1, 3, 4)
+        else:
+            # and without it, 27/04/2017 is read month first unless the month is out of range
+            match = ymd_regex.match(date)
+            if match is None:
+                return None
+            year, month, day = match.group(1, 3, 4)
+        try:
+            return datetime(int(year), int(month), int(day), int(match.group(5)), int(match.group(6)), int(match.group(7) or 0))
+        except ValueError:
+            # e.g. a day first date with the day in the month position, dateutil swaps them
+            return None
+
+
+_parsers = {}
+
+
+def get_date_parser(options):
+    """
+    Return the compiled parser of a date format rule, shared by every rule with the same options.
+    :param options dict: format rule
+    :rtype: DateParser
+    """
+    key = json.dumps(dict(options), sort_keys=True)
+    if key not in _parsers:
+        _parsers[key] = DateParser(options)
+    return _parsers[key]
@@ -0,0 +1,147 @@
+import re
+from collections import namedtuple
+from types import MappingProxyType
+from modules.date_parser import get_date_parser
+from modules.text_cleaner import TextCleaner
+
+# a tag to look for, attr is None when any tag with the name matches (attr_val is a compiled regex)
+Selector = namedtuple('Selector', ['tag', 'attr', 'attr_val'])
+
+# a value to save, container is the chain of selectors (outermost first) wrapping the element
+SaveRule = namedtuple('SaveRule', ['name', 'container', 'selector', 'save_attr', 'required', 'default', 'format'])
+
+# formatting of a saved value, options is the raw format dict, cleaner the TextCleaner of the "replace" and
+# "regex_remove" keys and date_parser the compiled DateParser of a 'date' rule
+FormatRule = namedtuple('FormatRule', ['type', 'bs_remove', 'regex_capture', 'regex_capture_title', 'cleaner', 'options', 'date_parser'])
+
+
+def compile_multireplace(replacements):
+    """
+    Compile the regex used to replace every key of a replacement map in a single pass.
+    :param replacements dict: replacement dictionary {value to find: value to replace}
+    :rtype: Pattern
+    """
+    # Place longer ones first to keep shorter substrings from matching where the longer ones should take place
+    # For instance given the replacements {'ab': 'AB', 'abc': 'ABC'} against the string 'hey abc', it should produce
+    # 'hey ABC' and not 'hey ABc'
+    substrs = sorted(replacements, key=len, reverse=True)
+
+    # Create a big OR regex that matches any of the substrings to replace
+    return re.compile('|'.join(map(re.escape, substrs)))
+
+
+class ExtractionPlan:
+    """
+    Site 'to_extract' config compiled once into an immutable, flat list of save rules.
+    Regexes are precompiled and defaults are resolved, so extracting an article only executes the plan.
+    """
+
+    def __init__(self, to_extract):
+        if not isinstance(to_extract, dict):
+            raise TypeError('to_extract is expected to be dict type')
+        rules = []
+        self._compile_container(to_extract, (), rules)
+        self.rules = tuple(rules)
+        # distinct tag names referenced by the config, used to build the SoupStrainer
+        self.tags = tuple(find_item(to_extract, 'tag'))
+
+    def _compile_container(self, config, container, rules):
+        """
+        Flatten the container tree, every save rule keeps the chain of containers it lives in.
+        :param config dict: (partial) to_extract config
+        :param container tuple: selectors of the enclosing containers
+        :param rules list: compiled rules (pass by reference)
+        """
+        for el in config:
+            # when 'save' key is found, compile the extraction targets
+            if el == 'save':
+                if isinstance(config[el], list):
+                    for toSave in config[el]:
+                        rules.append(self._compile_save(toSave, container))
+                if isinstance(config[el], dict):
+                    rules.append(self._compile_save(config[el], container))
+            elif 'container' in el:
+                # '*container*' key (img_container, title_container, etc.) is a wrapper of its save rules
+                if not isinstance(config[el], dict):
+                    raise TypeError('In key: "{0}"; key content is expected to be dict type. (*container* is considered as wrapper tag)'.format(el))
+                self._compile_container(config[el], container + (self._compile_selector(config[el]),), rules)
+
+    def _compile_selector(self, config):
+        if 'attr' in config and config['attr'] is not None:
+            return Selector(config['tag'], config['attr'], re.compile(config['attr_val']))
+        return Selector(config['tag'], None, None)
+
+    def _compile_save(self, config, container):
+        if not isinstance(config, dict):
+            raise TypeError('config parameter is expected to be type of dict')
+        if 'default' in config and len(config['default']) > 0:
+            default = config['default']
+        else:
+            default = None
+        if 'format' in config and config['format'] is not None:
+            format_ = self._compile_format(config['format'])
+        else:
+            format_ = None
+        return SaveRule(
+            name=config['as'],
+            container=container,
+            selector=self._compile_selector(config),
+            save_attr=config.get('save_attr'),
+            required='required' not in config or bool(config['required']),
+            default=default,
+            format=format_)
+
+    def _compile_format(self, config):
+        bs_remove = []
+        for def_ in config.get('bs_remove', []):
+            if 'attr' in def_:
+                if len(def_['attr_val']) < 1:
+                    raise ValueError('attr_val is empty')
+                bs_remove.append(Selector(def_['tag'], def_['attr'], re.compile(def_['attr_val'])))
+            else:
+                bs_remove.append(Selector(def_['tag'], None, None))
+
+        if 'regex_capture' in config and len(config['regex_capture']) > 0:
+            regex_capture = re.compile(config['regex_capture'])
+        else:
+            regex_capture = None
+
+        if 'regex_remove' in config or 'replace' in config:
+            cleaner = TextCleaner(config.get('regex_remove', ()), config.get('replace'))
+        else:
+            cleaner = None
+
+        return FormatRule(
+            type=config.get('type'),
+            bs_remove=tuple(bs_remove),
+            regex_capture=regex_capture,
+            regex_capture_title=bool(config.get('regex_capture_title', False)),
+            cleaner=cleaner,
+            options=MappingProxyType(dict(config)),
+            date_parser=get_date_parser(config) if config.get('type') == 'date' else None)
+
+
+def find_item(obj, key):
+    """
+    Recursively find the value certain key inside a dict. Returned value will be distinct.
+    :param obj dict: dictionary to iterate
+    :param key str: key to find
+    :rtype: list
+    """
+    ret = []
+    if isinstance(obj, dict):
+        if key in obj:
+            ret.append(obj[key])
+        for i, d in obj.items():
+            item = find_item(d, key)
+            if len(item) > 0:
+                ret = [v for v in item if v not in ret] + ret
+        return ret
+    elif isinstance(obj, list):
+        for d in obj:
+            item = find_item(d, key)
+            if len(item) > 0:
+                ret = [v for v in item if v not in ret] + ret
+        return ret
+    else:
+        return ret
@@ -0,0 +1,185 @@
+import time
+import threading
+import importlib.util
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from modules.metrics import get_metrics
+
+# urllib3 decodes br responses when brotli is installed
+_accept_encoding = 'gzip, deflate, br' if importlib.util.find_spec('brotli') is not None else 'gzip, deflate'
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) Chrome/23.0.1271.64 Safari/537.11',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
+    'Accept-Encoding': _accept_encoding,
+    'Accept-Language': 'en-US,en;q=0.8',
+    'Connection': 'keep-alive'
+}
+
+
+def retry_delay(retry_after, backoff_factor, attempt):
+    """
+    Seconds to wait before retrying a throttled request that was not given a scheduler.
+    :param retry_after str: Retry-After header, only the seconds form is honoured
+    :param backoff_factor float: backoff of the retries
+    :param attempt int: attempts already made, from 0
+    :rtype: float
+    """
+    if retry_after is not None and retry_after.strip().isdigit():
+        return float(retry_after)
+    return backoff_factor * 2 ** attempt
+
+
+class Fetcher:
+    """
+    Shared HTTP layer. Keeps one pooled keep-alive session per host, asks for compressed responses and
+    retries with backoff on 5xx responses, connection errors and timeouts.
+    Requests go through the PolitenessScheduler when one is given.
+    """
+
+    # retried by get() itself rather than by the session, every attempt goes through the scheduler, which backs off
+    # on them (the session would send the retries without it)
+    throttle_statuses = (429, 503)
+
+    def __init__(self, pool_size=10, retries=3, backoff_factor=0.5, timeout=30, headers=None, scheduler=None, proxies=None, archive=None):
+        if not isinstance(pool_size, int) or pool_size < 1:
+            raise ValueError('pool_size is expected to be a positive int')
+
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers is not None:
+            self.headers.update(headers)
+
+        self.scheduler = scheduler
+        if scheduler is not None and scheduler.fetcher is None:
+            # the scheduler reads robots.txt with the sessions of this fetcher
+            scheduler.fetcher = self
+        # {scheme: proxy url}, e.g. the replay server of the benchmarks
+        self.proxies = proxies
+        # ResponseArchive receiving the body of every successful non streamed response
+        self.archive = archive
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, scheduled=True, archive=True, **kwargs):
+        """
+        Send a GET request using the session of the url host.
+        :param url str: url to retrieve
+        :param scheduled bool: whether the request waits for the scheduler, robots.txt is read by the scheduler itself
+        :param archive bool: whether a successful response is archived, the replay extracts every archived page
+        :rtype: requests.models.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        scheduler = self.scheduler if scheduled else None
+        attempt = 0
+        while True:
+            resp = self._send(url, scheduler, kwargs)
+            if resp.status_code not in self.throttle_statuses or attempt >= self.retries:
+                break
+            resp.close()
+            if scheduler is None:
+                time.sleep(retry_delay(resp.headers.get('Retry-After'), self.backoff_factor, attempt))
+            attempt += 1
+        if archive and self.archive is not None and resp.status_code == 200 and not kwargs.get('stream', False):
+            self.archive.write_response(url, resp)
+        return resp
+
+    def _send(self, url, scheduler, kwargs):
+        """
+        Send a single attempt of a request, waiting for the scheduler when one is given.
+        :rtype: requests.models.Response
+        """
+        if scheduler is not None:
+            scheduler.acquire(url)
+        resp = None
+        start = time.monotonic()
+        try:
+            resp = self.session(url).get(url, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            if scheduler is not None:
+                if resp is not None:
+                    scheduler.release(url, resp.status_code, resp.headers, elapsed)
+                else:
+                    scheduler.release(url)
+            self._record(url, resp, elapsed, kwargs.get('stream', False))
+        return resp
+
+    def session(self, url):
+        """
+        Return the pooled session for the url host, create it when it does not exist yet.
+        :param url str: url whose host session is wanted
+        :rtype: requests.Session
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._create_session()
+            return self._sessions[host]
+
+    def _record(self, url, resp, elapsed, stream):
+        """
+        Record the metrics of a request.
+        """
+        metrics = get_metrics()
+        host = urlparse(url).netloc
+        metrics.inc('noox_http_requests_total', host=host, status=resp.status_code if resp is not None else 0)
+        metrics.observe('noox_http_request_seconds', elapsed, host=host)
+        if resp is not None:
+            # the body of a streamed response is not read yet, rely on its Content-Length
+            size = resp.headers.get('Content-Length') if stream else len(resp.content)
+            if size is not None:
+                metrics.inc('noox_http_bytes_total', int(size), host=host)
+
+    def close(self):
+        """
+        Close every session and its connection pool, and the response archive.
+        """
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def _create_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(500, 502, 504),
+            # a Retry-After would retry the throttle_statuses too, get() honours it
+            respect_retry_after_header=False,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.headers.update(self.headers)
+        if self.proxies is not None:
+            session.proxies.update(self.proxies)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+
+_default_fetcher = None
+
+
+def get_default_fetcher():
+    """
+    Return the fetcher shared by every component that is not given its own.
+    :rtype: Fetcher
+    """
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = Fetcher()
+    return _default_fetcher
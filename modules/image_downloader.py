@@ -0,0 +1,125 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.fetcher import get_default_fetcher
+
+
+class ImageDownloader:
+    """
+    Download images in the background with a bounded number of concurrent requests.
+    Every image is streamed to a temporary file and renamed into place, so a failed download never leaves a partial file.
+    Image content is stored once under the content-addressed store directory, the requested files are hard links to it.
+    """
+
+    _chunk_size = 64 * 1024
+
+    def __init__(self, store_dir, fetcher=None, concurrency=4, max_pending=None):
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise ValueError('concurrency is expected to be a positive int')
+        self._store_dir = store_dir
+        self._fetcher = fetcher if fetcher is not None else get_default_fetcher()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # submit() blocks when this many images are waiting, so a big save does not queue every image at once
+        self._slots = threading.Semaphore(max_pending if max_pending is not None else concurrency * 4)
+        self._lock = threading.Lock()
+        self._futures = []
+        # number of images downloaded, skipped (file exists), deduplicated (same content already stored) and failed
+        self.downloaded = 0
+        self.skipped = 0
+        self.deduplicated = 0
+        self.failed = 0
+
+    def submit(self, url, path):
+        """
+        Queue the download of an image, nothing is downloaded when path already exists.
+        :param url str: image url
+        :param path str: file to save the image to
+        """
+        if os.path.exists(path):
+            with self._lock:
+                self.skipped += 1
+            return
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._download, url, path)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        with self._lock:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(future)
+
+    def wait(self):
+        """
+        Wait until every queued image is downloaded, a failed download does not stop the wait for the others.
+        """
+        with self._lock:
+            futures = self._futures
+            self._futures = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print('Unable to download an image cause: {0}'.format(str(e)))
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+    def _download(self, url, path):
+        directory = os.path.dirname(path) or '.'
+        tmp_path = None
+        try:
+            # a missing or unwritable image directory fails the download like any other error
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+            md5 = hashlib.md5()
+            with os.fdopen(fd, 'wb') as file:
+                with self._fetcher.get(url, stream=True) as img:
+                    img.raise_for_status()
+                    for chunk in img.iter_content(self._chunk_size):
+                        md5.update(chunk)
+                        file.write(chunk)
+            stored = self._store(tmp_path, md5.hexdigest(), os.path.splitext(path)[1])
+            self._link(stored, path)
+        except Exception as e:
+            print('Unable to download "{0}" cause: {1}'.format(url, str(e)))
+            with self._lock:
+                self.failed += 1
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _store(self, tmp_path, content_hash, ext):
+        """
+        Move a downloaded file into the content-addressed store, unless the same content is already there.
+        :param tmp_path str: downloaded temporary file
+        :param content_hash str: md5 of the content
+        :param ext str: file extension
+        :rtype: str, path of the stored content
+        """
+        os.makedirs(self._store_dir, exist_ok=True)
+        stored = os.path.join(self._store_dir, content_hash + ext)
+        with self._lock:
+            if os.path.exists(stored):
+                os.unlink(tmp_path)
+                self.deduplicated += 1
+            else:
+                os.replace(tmp_path, stored)
+                self.downloaded += 1
+        return stored
+
+    def _link(self, stored, path):
+        """
+        Atomically make path a hard link to the stored content (a copy when hard links are not supported).
+        """
+        tmp_path = path + '.part'
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        try:
+            os.link(stored, tmp_path)
+        except OSError:
+            shutil.copyfile(stored, tmp_path)
+        os.replace(tmp_path, path)
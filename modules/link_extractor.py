@@ -1,29 +1,35 @@
-import requests
 import re
 from urllib.parse import urlparse
 from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup, SoupStrainer
+from modules.fetcher import get_default_fetcher
+from modules.metrics import get_metrics
+from modules.sitemap_reader import SitemapReader
 
 
 class LinkExtractor:
 
-    _header = {
-        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) Chrome/23.0.1271.64 Safari/537.11',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-        'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
-        'Accept-Encoding': 'none',
-        'Accept-Language': 'en-US,en;q=0.8',
-        'Connection': 'keep-alive'
-    }
-
-    _edges = deque()
-
-    _links = []
-
-    _config = {}
-
-    def __init__(self, config, start_url=None, debug=False, verbose=False):
-        self._config.update(config)
+    def __init__(self, config, start_url=None, debug=False, verbose=False, concurrency=1, fetcher=None, state=None, seen=None):
+        # per instance, a long running process crawls several sites and the same site again
+        self._edges = deque()
+        self._links = []
+        self._config = dict(config)
+        self._concurrency = concurrency
+        self._fetcher = fetcher if fetcher is not None else get_default_fetcher()
+        self._state = state
+        # urls already stored (e.g. a SeenIndex), they are neither extracted nor crawled
+        self._seen = seen
+        # number of links skipped because they are already stored
+        self.seen_skipped = 0
+        # sitemap <lastmod> of the extracted links and of the pending sitemap edges
+        self.lastmods = {}
+        self._edge_lastmods = {}
+        # completely read edges, saved to the crawl state by commit_edges()
+        self._read_edges = []
+        # urls the crawl starts from, always requested in full
+        self._start_urls = set()
         self._is_debug = debug
         self._is_verbose = verbose
         self.__verboseprint = print if self._is_verbose or self._is_debug else lambda *a, **k: None
@@ -38,12 +44,26 @@ class LinkExtractor:
         :param max_link int: max link to extract
         :rtype: list
         """
+        for _ in self.iter_urls(crawl_depth_override, max_link):
+            pass
+        return self._links
+
+    def iter_urls(self, crawl_depth_override=None, max_link=None):
+        """
+        Begin crawling the target website and yield the links as soon as they are extracted.
+        The links are still collected, get_urls() returns them all once the crawl is done.
+
+        :param crawl_depth_override int: maximum crawl depth, default is from config
+        :param max_link int: max link to extract
+        :rtype: generator of str
+        """
         # check whether the config has been initialized
         if self._config == {}:
             raise RuntimeError('Config is not defined.')
         # if the edge is empty, we take the starter url from the config
         if len(self._edges) < 1:
             self._edges.append(self._config['url'])
+        self._start_urls = set(self._edges)
         # if crawl_depth_override is supplied, use it instead of config
         if isinstance(crawl_depth_override, int):
             max_depth = crawl_depth_override
@@ -53,73 +73,220 @@ class LinkExtractor:
         # the config should remain as is, so we copy the url regex from config to local variable
         regex = re.compile(self._config['url_regex'])
 
-        depth = 0
         links_np = set()
+        if self._concurrency > 1:
+            yield from self._iter_urls_concurrent(max_depth, max_link, regex, links_np)
+            return
+
+        depth = 0
         while self._edges and (not max_link or len(self._links) < max_link):
             edge = self._edges.popleft()
             self.__verboseprint('Retrieving data from "'+edge+'"')
-            page = requests.get(edge, headers=self._header, timeout=5)
-            # if we got a sitemap index, add these sitemaps to our edge list
-            if self._is_sitemap_index(page) and depth == 0:
-                self.__verboseprint('Got sitemap index...')
-                if 'sitemapindex_regex' in self._config and len(self._config['sitemapindex_regex']) > 0:
-                    sitemapIndexRegex = re.compile(self._config['sitemapindex_regex'])
-                else:
-                    sitemapIndexRegex = re.compile('.*')
-                for loc in BeautifulSoup(page.text, 'lxml-xml', parse_only=SoupStrainer('loc')):
-                    url = loc.get_text().strip()
-                    if sitemapIndexRegex.match(url):
-                        self._edges.append(url)
-            else:
-                # if we got a sitemap, add the locs to the our links list
-                if self._is_sitemap(page):
-                    self.__verboseprint('Got sitemap...')
-                    for loc in BeautifulSoup(page.text, 'lxml-xml', parse_only=SoupStrainer('loc')):
-                        url = self._trim_url_query(loc.get_text().strip())
-                        url_np = re.sub(r'https?://', '', url)
-                        if regex.match(url) and url_np not in links_np:
-                            self._links.append(url)
-                            links_np.add(url_np)
-                            if depth < max_depth:
-                                self._edges.append(url)
-                else:
-                    # if we got a html page, extract the a tag with href matching with regex
-                    soup = BeautifulSoup(page.text, 'lxml', parse_only=SoupStrainer('a', attrs={'href': regex}))
-                    for tag in soup.find_all('a'):
-                        url = self._trim_url_query(tag['href'])
-                        url_np = re.sub(r'https?://', '', url)
-                        if url_np not in links_np:
-                            self._links.append(url)
-                            links_np.add(url_np)
-                            if depth < max_depth:
-                                self._edges.append(url)
+            page = self._fetcher.get(edge, timeout=5, stream=True, headers=self._conditional_headers(edge))
+            try:
+                kind, urls = self._read_page(page, regex)
+                complete = yield from self._collect_links(kind, urls, depth, max_depth, max_link, regex, links_np, self._edges)
+            finally:
+                # the consumer may stop before the page is completely read
+                page.close()
+            self._record_edge(edge, page, kind, complete)
             depth += 1
 
-        return self._links
+    def _iter_urls_concurrent(self, max_depth, max_link, regex, links_np):
+        """
+        Crawl the frontier one BFS level at a time, fetching every edge of a level in parallel.
+        Pages are processed in the order of the edges, which is the order the serial crawl pops them, and the depth
+        given to a page is counted the same way (one more for every retrieved edge), so both crawls extract the same links.
+
+        :param max_depth int: maximum crawl depth
+        :param max_link int: max link to extract
+        :param regex Pattern: compiled url regex
+        :param links_np set: extracted links without protocol
+        :rtype: generator of str
+        """
+        level = list(self._edges)
+        self._edges.clear()
+        depth = 0
+        level_depth = 0
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            while level and (not max_link or len(self._links) < max_link):
+                self.__verboseprint('Retrieving {0} page(s) at level {1}...'.format(len(level), level_depth))
+                next_level = []
+                # no page of the level yields more links than are still needed
+                cap = max_link - len(self._links) if max_link else None
+                futures = [executor.submit(self._fetch_edge, edge, regex, cap) for edge in level]
+                consumed = 0
+                try:
+                    for edge, future in zip(level, futures):
+                        if max_link and len(self._links) >= max_link:
+                            # the cutoff is reached, the remaining pages of this level are not needed
+                            break
+                        consumed += 1
+                        page, kind, head, rest = future.result()
+                        try:
+                            # the links filtered out (e.g. already seen) are replaced by reading the rest of the page
+                            complete = yield from self._collect_links(kind, chain(head, rest), depth, max_depth, max_link, regex, links_np, next_level)
+                        finally:
+                            page.close()
+                        self._record_edge(edge, page, kind, complete)
+                        depth += 1
+                finally:
+                    # also reached when the consumer stops early, the pages already fetched are closed
+                    for pending in futures[consumed:]:
+                        if not pending.cancel():
+                            try:
+                                pending.result()[0].close()
+                            except Exception:
+                                pass
+                level = next_level
+                level_depth += 1
+        # keep the uncrawled edges, just like the serial crawl does
+        self._edges.extend(level)
+
+    def _fetch_edge(self, edge, regex, cap=None):
+        """
+        Retrieve a single edge of the frontier and read up to cap of its urls (run by the worker pool).
+        The page stays open when it has more urls, the caller reads them only if it still needs links, then closes it.
 
-    def _is_sitemap_index(self, page):
+        :param edge str: url to retrieve
+        :param regex Pattern: compiled url regex
+        :param cap int: max urls to read, default is every url
+        :rtype: tuple of (response, page kind, list of the first (url, lastmod), iterator of the other (url, lastmod))
         """
-        Check whether the given Response object is a sitemap index or not.
+        self.__verboseprint('Retrieving data from "'+edge+'"')
+        page = self._fetcher.get(edge, timeout=5, stream=True, headers=self._conditional_headers(edge))
+        try:
+            kind, urls = self._read_page(page, regex)
+            head = list(islice(urls, cap)) if cap is not None else list(urls)
+        except Exception:
+            page.close()
+            raise
+        if cap is None or len(head) < cap:
+            # the page is completely read
+            page.close()
+        return page, kind, head, urls
 
-        @param page: requests.models.Response object
-        @return: boolean
+    def _conditional_headers(self, edge):
         """
-        if page.__class__.__name__ != 'Response':
-            raise ValueError('The supplied argument is not a requests.models.Response instance.')
-        soup = BeautifulSoup(page.text, 'lxml-xml', parse_only=SoupStrainer('sitemapindex'))
-        return str(soup.find('sitemapindex')) != 'None'
+        Return If-None-Match/If-Modified-Since headers for an edge when the crawl state is enabled.
+        The start urls are requested in full: the sitemaps they list may change while they do not.
 
-    def _is_sitemap(self, page):
+        :param edge str: url to retrieve
+        :rtype: dict
+        """
+        if self._state is None or edge in self._start_urls:
+            return {}
+        return self._state.conditional_headers(edge)
+
+    def commit_edges(self):
+        """
+        Save the validators of the completely read edges to the crawl state, so they are skipped on the next run
+        when they have not changed. To be called once the extracted links are grabbed (or queued): an edge saved
+        before its links are would be skipped with them when the crawl stops early.
         """
-        Check whether the given Response object is a sitemap or not.
+        if self._state is not None:
+            for edge, headers, lastmod in self._read_edges:
+                self._state.update(edge, headers, lastmod=lastmod)
+        self._read_edges = []
 
-        @param page: requests.models.Response object
-        @return: boolean
+    def _record_edge(self, edge, page, kind, complete):
         """
-        if page.__class__.__name__ != 'Response':
-            raise ValueError('The supplied argument is not a requests.models.Response instance.')
-        soup = BeautifulSoup(page.text, 'lxml-xml', parse_only=SoupStrainer('urlset'))
-        return str(soup.find('urlset')) != 'None'
+        Keep the validators of a completely read edge until commit_edges().
+        The validators of the start urls and of the sitemap indexes are not kept: a not modified sitemap index would
+        hide the changes of its sitemaps (e.g. an index without <lastmod>).
+
+        :param edge str: retrieved url
+        :param page Response: response of the edge
+        :param kind str: page kind returned by _read_page
+        :param complete bool: whether every url of the page has been read
+        """
+        lastmod = self._edge_lastmods.pop(edge, None)
+        if self._state is not None and complete and kind != 'sitemapindex' and edge not in self._start_urls:
+            self._read_edges.append((edge, page.headers, lastmod))
+
+    def _read_page(self, page, regex):
+        """
+        Read the locs of a sitemap (or sitemap index) incrementally, or the matching hrefs of a html page.
+
+        :param page Response: streamed response
+        :param regex Pattern: compiled url regex
+        :rtype: tuple of (page kind: 'sitemapindex', 'urlset', 'html' or None when not modified, iterator of (url, lastmod))
+        """
+        if page.status_code == 304:
+            return None, iter(())
+        reader = SitemapReader.from_response(page)
+        if reader.kind is not None:
+            return reader.kind, iter(reader)
+        # if we got a html page, extract the a tag with href matching with regex
+        soup = BeautifulSoup(reader.read(), 'lxml', parse_only=SoupStrainer('a', attrs={'href': regex}))
+        return 'html', ((tag['href'], None) for tag in soup.find_all('a'))
+
+    def _collect_links(self, kind, urls, depth, max_depth, max_link, regex, links_np, edges):
+        """
+        Add the urls read from a page to the links, yielding each new link, and append the newly found edges.
+
+        :param kind str: page kind returned by _read_page
+        :param urls iterator: (url, lastmod) read from the page
+        :param depth int: depth of the page
+        :param max_depth int: maximum crawl depth
+        :param max_link int: max link to extract
+        :param regex Pattern: compiled url regex
+        :param links_np set: extracted links without protocol
+        :param edges deque|list: where to put the new edges
+        :rtype: generator of str, returns whether every url of the page has been read
+        """
+        metrics = get_metrics()
+        site = self._config.get('sitename')
+        metrics.inc('noox_pages_crawled_total', site=site)
+        if kind is None:
+            self.__verboseprint('Not modified since the last crawl...')
+            return False
+
+        if kind == 'sitemapindex':
+            # if we got a sitemap index, add these sitemaps to our edge list
+            if depth > 0:
+                return True
+            self.__verboseprint('Got sitemap index...')
+            if 'sitemapindex_regex' in self._config and len(self._config['sitemapindex_regex']) > 0:
+                sitemapIndexRegex = re.compile(self._config['sitemapindex_regex'])
+            else:
+                sitemapIndexRegex = re.compile('.*')
+            for url, lastmod in urls:
+                if not sitemapIndexRegex.match(url):
+                    continue
+                if self._state is not None and self._state.is_same_lastmod(url, lastmod):
+                    # the sitemap has not changed since the last crawl
+                    self.__verboseprint('Skipping unchanged sitemap "'+url+'"')
+                    continue
+                edges.append(url)
+                self._edge_lastmods[url] = lastmod
+            return True
+
+        if kind == 'urlset':
+            self.__verboseprint('Got sitemap...')
+        for url, lastmod in urls:
+            url = self._trim_url_query(url)
+            url_np = re.sub(r'https?://', '', url)
+            if (kind == 'html' or regex.match(url)) and url_np not in links_np:
+                links_np.add(url_np)
+                if self._seen is not None and url in self._seen:
+                    self.seen_skipped += 1
+                    metrics.inc('noox_dedup_skipped_total', source='seen_index')
+                    continue
+                if self._state is not None and self._state.is_unchanged(url, lastmod):
+                    # already crawled and the sitemap says it has not been modified since
+                    continue
+                self._links.append(url)
+                metrics.inc('noox_links_total', site=site)
+                if lastmod is not None:
+                    self.lastmods[url] = lastmod
+                if depth < max_depth:
+                    edges.append(url)
+                yield url
+                # stop reading the sitemap once we have enough links
+                if kind == 'urlset' and max_link and len(self._links) >= max_link:
+                    return False
+        return True
 
     def _trim_url_query(self, url: str):
         """
@@ -0,0 +1,228 @@
+import json
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# upper bounds (seconds) of the latency histogram buckets
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# help text of the metrics, shown by the prometheus endpoint
+descriptions = {
+    'noox_http_requests_total': 'HTTP responses by host and status (status 0 when the request failed).',
+    'noox_http_request_seconds': 'HTTP response time by host.',
+    'noox_http_bytes_total': 'Bytes downloaded by host.',
+    'noox_pages_crawled_total': 'Pages read while scanning for links.',
+    'noox_links_total': 'New links found while scanning.',
+    'noox_dedup_checked_total': 'Links checked against the stored news.',
+    'noox_dedup_skipped_total': 'Links skipped because the news is already stored, by source.',
+    'noox_news_total': 'Pages grabbed by result (extracted, failed, unchanged, fetch_error).',
+    'noox_stage_seconds': 'Time spent per stage of the news extraction (format is part of extract).',
+    'noox_extraction_failures_total': 'Pages without a required element, by element and reason.',
+    'noox_near_duplicates_total': 'News not output because their content is a near-duplicate of a saved news.',
+    'noox_output_seconds': 'Time spent saving a batch, by output provider.',
+    'noox_output_items_total': 'News saved, by output provider.',
+    'noox_output_retries_total': 'Batches saved again after an error, by output provider.',
+    'noox_output_dropped_total': 'News an output provider failed to save, by output provider.'
+}
+
+
+class Metrics:
+    """
+    Thread safe registry of labelled counters and latency histograms.
+    Exposed in the prometheus text format or as json.
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # {name: {labels tuple: value}}
+        self._counters = {}
+        # {name: {labels tuple: [bucket counts..., count, sum]}}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter.
+        :param name str: metric name
+        :param value int: increment
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a duration in a histogram.
+        :param name str: metric name
+        :param seconds float: observed duration
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = [0] * (len(self.buckets) + 2)
+            values = series[key]
+            values[bisect.bisect_left(self.buckets, seconds)] += 1
+            values[-2] += 1
+            values[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Record the duration of the block in a histogram.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self, reset=False):
+        """
+        Copy of the recorded values, used to send the metrics of a worker process to its parent.
+        :param reset bool: clear the recorded values
+        :rtype: tuple of (counters, histograms)
+        """
+        with self._lock:
+            snapshot = (
+                dict((name, dict(series)) for name, series in self._counters.items()),
+                dict((name, dict((key, list(values)) for key, values in series.items())) for name, series in self._histograms.items()))
+            if reset:
+                self._counters = {}
+                self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        Add the values of a snapshot (see snapshot()).
+        """
+        counters, histograms = snapshot
+        with self._lock:
+            for name, series in counters.items():
+                own = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    own[key] = own.get(key, 0) + value
+            for name, series in histograms.items():
+                own = self._histograms.setdefault(name, {})
+                for key, values in series.items():
+                    if key not in own:
+                        own[key] = [0] * len(values)
+                    own[key] = [a + b for a, b in zip(own[key], values)]
+
+    def to_prometheus(self):
+        """
+        Render the metrics in the prometheus text exposition format.
+        :rtype: str
+        """
+        counters, histograms = self.snapshot()
+        lines = []
+        for name in sorted(counters):
+            lines.append('# HELP {0} {1}'.format(name, descriptions.get(name, name)))
+            lines.append('# TYPE {0} counter'.format(name))
+            for key, value in sorted(counters[name].items()):
+                lines.append('{0}{1} {2}'.format(name, self._labels(key), self._number(value)))
+        for name in sorted(histograms):
+            lines.append('# HELP {0} {1}'.format(name, descriptions.get(name, name)))
+            lines.append('# TYPE {0} histogram'.format(name))
+            for key, values in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), values[:-2]):
+                    cumulative += count
+                    lines.append('{0}_bucket{1} {2}'.format(name, self._labels(key + (('le', str(bound)),)), cumulative))
+                lines.append('{0}_count{1} {2}'.format(name, self._labels(key), values[-2]))
+                lines.append('{0}_sum{1} {2}'.format(name, self._labels(key), self._number(values[-1])))
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        """
+        Metrics as a json serializable dict, histograms are summarized (count, sum, mean and bucket counts).
+        :rtype: dict
+        """
+        counters, histograms = self.snapshot()
+        ret = {'time': time.time(), 'counters': {}, 'histograms': {}}
+        for name, series in counters.items():
+            ret['counters'][name] = [dict(key, value=value) for key, value in sorted(series.items())]
+        for name, series in histograms.items():
+            ret['histograms'][name] = [
+                dict(key, count=values[-2], sum=values[-1], mean=values[-1] / values[-2] if values[-2] else 0,
+                     buckets=dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], values[:-2])))
+                for key, values in sorted(series.items())]
+        return ret
+
+    def dump_json(self, path):
+        """
+        Write the metrics to a json file (through a temporary file, readers never see a partial file).
+        :param path str: output file
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host='0.0.0.0'):
+        """
+        Serve the metrics in the prometheus text format from a background thread.
+        :param port int: port to listen on
+        :param host str: address to listen on
+        :rtype: ThreadingHTTPServer
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def dump_periodically(self, path, interval, stop):
+        """
+        Write the metrics to a json file every interval seconds from a background thread, and once more when stop is set.
+        :param path str: output file
+        :param interval float: seconds between dumps
+        :param stop threading.Event: stops the dumps
+        :rtype: threading.Thread
+        """
+        def dump():
+            while not stop.wait(interval):
+                self.dump_json(path)
+            self.dump_json(path)
+
+        thread = threading.Thread(target=dump, daemon=True)
+        thread.start()
+        return thread
+
+    def _labels(self, key):
+        if not key:
+            return ''
+        return '{' + ','.join('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in key) + '}'
+
+    def _number(self, value):
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+_default_metrics = None
+
+
+def get_metrics():
+    """
+    Return the metrics registry of the process.
+    :rtype: Metrics
+    """
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = Metrics()
+    return _default_metrics
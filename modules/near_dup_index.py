@@ -0,0 +1,253 @@
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from hashlib import blake2b
+from modules.metrics import get_metrics
+
+# the content is compared on its words, without the tags kept by the format rules
+tag_regex = re.compile(r'<[^>]*>')
+word_regex = re.compile(r'\w+')
+
+# _bit_tables[bit] translates a byte to 1 when the bit is set, else to 0
+_bit_tables = [bytes(byte >> bit & 1 for byte in range(256)) for bit in range(8)]
+
+
+def simhash(text, shingle_size=3):
+    """
+    Compute the 64 bits SimHash of a text, over the hashes of its word shingles.
+    Texts sharing most of their shingles get fingerprints differing by a few bits.
+    :param text str: text or html content
+    :param shingle_size int: words per shingle (at most 8)
+    :rtype: int or None when the text has no words
+    """
+    words = word_regex.findall(tag_regex.sub(' ', text).lower())
+    if not words:
+        return None
+    hashes = b''.join(map(_word_digest, words))
+
+    # the hash of a shingle is the xor of its word hashes, rotated by their position in the shingle,
+    # computed for all the shingles at once on the concatenated hashes
+    shingle_size = min(shingle_size, len(words))
+    shingles = len(words) - shingle_size + 1
+    combined = 0
+    for i in range(shingle_size):
+        combined ^= int.from_bytes(_rotate(hashes, shingle_size - 1 - i)[i * 8:(i + shingles) * 8], 'little')
+    digests = combined.to_bytes(shingles * 8, 'little')
+
+    fingerprint = 0
+    for bit in range(8):
+        selected = digests.translate(_bit_tables[bit])
+        for position in range(8):
+            # the bit is set when most of the shingle hashes have it
+            if selected[position::8].count(1) * 2 > shingles:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+# the same words come back in every article, the cache is shared by the threads of the daemon
+@lru_cache(maxsize=1 << 18)
+def _word_digest(word):
+    return blake2b(word.encode('utf8'), digest_size=8).digest()
+
+
+def _rotate(hashes, count):
+    """
+    Rotate every 8 bytes hash of a concatenation by count bytes.
+    :param hashes bytes: concatenated hashes
+    :param count int: bytes to rotate
+    :rtype: bytearray
+    """
+    rotated = bytearray(len(hashes))
+    for position in range(8):
+        rotated[(position + count) % 8::8] = hashes[position::8]
+    return rotated
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class NearDupIndex:
+    """
+    Persistent index of the SimHash fingerprints of the extracted news, stored in a SQLite file.
+    News whose content is within max_distance bits of a news stored under another url (e.g. a syndicated story on
+    several subdomains) are near-duplicates, they are dropped from the output and linked to the first url.
+    The fingerprint is split in max_distance + 1 bands, 2 fingerprints within max_distance bits have at least one
+    identical band, so only the fingerprints sharing a band are compared. Fewer bits per band (a larger distance)
+    means more candidates to compare, the band count is fixed when the index is created.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS `fingerprints` ('
+        '`url` TEXT PRIMARY KEY, '
+        '`fingerprint` INTEGER NOT NULL, '
+        '`added_at` REAL NOT NULL)'
+    )
+
+    _bands_schema = (
+        'CREATE TABLE IF NOT EXISTS `bands` ('
+        '`band` INTEGER NOT NULL, '
+        '`value` INTEGER NOT NULL, '
+        '`url` TEXT NOT NULL, '
+        'PRIMARY KEY (`band`, `value`, `url`)) WITHOUT ROWID'
+    )
+
+    _duplicates_schema = (
+        'CREATE TABLE IF NOT EXISTS `duplicates` ('
+        '`url` TEXT PRIMARY KEY, '
+        '`duplicate_of` TEXT NOT NULL, '
+        '`distance` INTEGER NOT NULL, '
+        '`found_at` REAL NOT NULL)'
+    )
+
+    def __init__(self, path, max_distance=3):
+        if not isinstance(path, str):
+            raise TypeError('path parameter is expected to be str')
+        if not isinstance(max_distance, int) or not 0 <= max_distance < 16:
+            raise ValueError('max_distance is expected to be an int from 0 to 15')
+        self.path = path
+        self.max_distance = max_distance
+        # (shift, mask) of every band
+        bands = max_distance + 1
+        bounds = [64 * band // bands for band in range(bands + 1)]
+        self._bands = tuple((bounds[band], (1 << (bounds[band + 1] - bounds[band])) - 1) for band in range(bands))
+        self._candidates_sql = (
+            'SELECT DISTINCT `fingerprints`.`url`, `fingerprint` FROM `bands` JOIN `fingerprints` ON `fingerprints`.`url` = `bands`.`url` WHERE '
+            + ' OR '.join(['(`band` = ? AND `value` = ?)'] * bands))
+        # run() of a daemon site is called from its own thread
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(self._schema)
+        self._db.execute(self._bands_schema)
+        self._db.execute(self._duplicates_schema)
+        # the band count of the stored fingerprints
+        created_with = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if created_with == 0:
+            self._db.execute('PRAGMA user_version = {0}'.format(bands))
+        elif created_with != bands:
+            self._db.close()
+            raise ValueError('{0} was created with a max_distance of {1}'.format(path, created_with - 1))
+        self._db.commit()
+        # fingerprints of the news yielded by filter() until add() indexes them {url: fingerprint}
+        self._unsaved = {}
+        # number of news checked and found to be near-duplicates
+        self.checked = 0
+        self.duplicates = 0
+
+    def filter(self, news, site=None, on_duplicate=None):
+        """
+        Yield the news that are not near-duplicates of a saved news, nor of a news yielded before and not saved yet.
+        The yielded news are indexed by add() once the output saved them.
+        :param news iterable: extracted news
+        :param site str: site name of the metrics
+        :param on_duplicate function: called with every dropped news duplicating a saved news
+        :rtype: generator of dict
+        """
+        metrics = get_metrics()
+        for item in news:
+            original, saved = self._check(item['url'], item.get('content'))
+            if original is None:
+                yield item
+                continue
+            metrics.inc('noox_near_duplicates_total', site=site)
+            # the original of an unsaved duplicate may still be dropped by the output, the duplicate is checked
+            # again on the next crawl
+            if saved and on_duplicate is not None:
+                on_duplicate(item)
+
+    def check(self, url, content):
+        """
+        Look for a near-duplicate of a news, a news without one waits for add() to be indexed.
+        :param url str: news url
+        :param content str: news content
+        :rtype: str or None, url of the news it duplicates
+        """
+        return self._check(url, content)[0]
+
+    def add(self, urls):
+        """
+        Index the fingerprints of the checked news the output saved, they are compared with the next news.
+        :param urls list: urls of the saved news
+        """
+        with self._lock:
+            for url in urls:
+                fingerprint = self._unsaved.pop(url, None)
+                if fingerprint is None:
+                    continue
+                # the bands of a url extracted again are replaced
+                previous = self._db.execute('SELECT `fingerprint` FROM `fingerprints` WHERE `url` = ?', (url,)).fetchone()
+                if previous is not None:
+                    self._db.executemany('DELETE FROM `bands` WHERE `band` = ? AND `value` = ? AND `url` = ?', [band + (url,) for band in self._split(previous[0])])
+                # sqlite integers are signed
+                self._db.execute(
+                    'INSERT OR REPLACE INTO `fingerprints` (`url`, `fingerprint`, `added_at`) VALUES (?, ?, ?)',
+                    (url, fingerprint - (1 << 64) if fingerprint >> 63 else fingerprint, time.time()))
+                self._db.executemany('INSERT INTO `bands` (`band`, `value`, `url`) VALUES (?, ?, ?)', [band + (url,) for band in self._split(fingerprint)])
+            # the crawlers of the daemon and the queue workers have their own index on the same file, commit right
+            # away so the write lock is never held across batches
+            self._db.commit()
+
+    def discard(self):
+        """
+        Forget the fingerprints of the checked news that were not saved, they do not suppress their near-duplicates.
+        """
+        with self._lock:
+            self._unsaved.clear()
+
+    def _check(self, url, content):
+        """
+        :rtype: tuple of (url of the news it duplicates or None, whether that news is saved)
+        """
+        if not isinstance(content, str):
+            return None, False
+        fingerprint = simhash(content)
+        if fingerprint is None:
+            return None, False
+        bands = self._split(fingerprint)
+        with self._lock:
+            self.checked += 1
+            candidates = self._db.execute(self._candidates_sql, [value for band in bands for value in band]).fetchall()
+            original = None
+            for candidate_url, candidate in candidates:
+                distance = hamming_distance(fingerprint, candidate & 0xFFFFFFFFFFFFFFFF)
+                # the same url extracted again (e.g. an updated article) is not a duplicate
+                if candidate_url != url and distance <= self.max_distance and (original is None or distance < original[1]):
+                    original = (candidate_url, distance)
+            if original is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO `duplicates` (`url`, `duplicate_of`, `distance`, `found_at`) VALUES (?, ?, ?, ?)',
+                    (url, original[0], original[1], time.time()))
+                self._db.commit()
+                self.duplicates += 1
+                return original[0], True
+            # the news waiting for the output are few, they are compared one by one
+            for candidate_url, candidate in self._unsaved.items():
+                if candidate_url != url and hamming_distance(fingerprint, candidate) <= self.max_distance:
+                    self.duplicates += 1
+                    return candidate_url, False
+            self._unsaved[url] = fingerprint
+        return None, False
+
+    def duplicate_of(self, url):
+        """
+        Return the url of the news a near-duplicate was linked to.
+        :param url str: url of the dropped news
+        :rtype: str or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT `duplicate_of` FROM `duplicates` WHERE `url` = ?', (url,)).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _split(self, fingerprint):
+        """
+        :rtype: list of (band, value)
+        """
+        fingerprint &= 0xFFFFFFFFFFFFFFFF
+        return [(band, (fingerprint >> shift) & mask) for band, (shift, mask) in enumerate(self._bands)]
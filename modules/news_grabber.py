@@ -1,398 +1,448 @@
 import re
-import requests
-from bs4 import BeautifulSoup, SoupStrainer
+import multiprocessing
 from urllib.parse import urlparse
-from dateutil.parser import parser as dp
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from modules.async_fetcher import AsyncFetcher
+from modules.fetcher import get_default_fetcher
+from modules.extraction_plan import ExtractionPlan
+from modules.date_parser import get_date_parser
+from modules.parser_backends import get_backend
+from modules.metrics import get_metrics
 
 
 class NewsGrabber:
 
-    _header = {
-                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) Chrome/23.0.1271.64 Safari/537.11',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
-                'Accept-Encoding': 'none',
-                'Accept-Language': 'en-US,en;q =0.8',
-                'Connection': 'keep-alive'
-            }
-
     __verboseprint = None
 
-    def __init__(self, config, debug=False, verbose=False):
+    def __init__(self, config, debug=False, verbose=False, concurrency=1, host_concurrency=None, fetcher=None, state=None, workers=1, parse_in_worker=False, defer_state=False):
         self._config = config
+        self._fetcher = fetcher if fetcher is not None else get_default_fetcher()
+        self._state = state
+        # keep the crawl state of the extracted news until commit_state(), once they are saved by the output
+        self._defer_state = defer_state
+        self._unsaved_state = {}
         self._is_debug = debug
         self._is_verbose = verbose
         self.__cur_url = None
+        # why the last required element was not extracted, see noox_extraction_failures_total
+        self._failure_reason = None
+        self._metrics = get_metrics()
+        self._concurrency = concurrency
+        self._host_concurrency = host_concurrency
+        self._async_fetcher = None
+        # number of extraction worker processes, pages are parsed in the calling process when 1
+        # unless parse_in_worker is set (e.g. the sites of the daemon, which share the calling process)
+        self._workers = workers
+        self._parse_in_worker = parse_in_worker
+        # the worker processes and the async fetcher are kept between the calls of iter_process(), see close()
+        self._executor = None
+        # keep enough urls in the buffer to saturate the concurrent fetcher
+        self._buffer_size = max(20, concurrency)
+        # number of urls read from the input of process() and of pages that could not be retrieved
+        self.url_count = 0
+        self.fetch_errors = 0
+        # urls of the pages that could not be retrieved, e.g. to lease them again
+        self.failed_urls = []
         self.__verboseprint = print if self._is_verbose or self._is_debug else lambda *a, **k: None
 
-        # to optimize the BeautifulSoup, tell the BeautifulSoup only to parse certain elements
-        self.__soup_strainer = SoupStrainer(self._find_item(self._config['to_extract'], 'tag'))
+        # compile the site config once, the extraction of each article only executes the plan
+        self._plan = ExtractionPlan(self._config['to_extract'])
+
+        # html parser backend of the site ('bs4' or 'lxml'), both produce the same output
+        self._backend = get_backend(self._config.get('parser', 'bs4'), self._plan)
 
-    def process(self, url_list, url_check_callback=None, url_check_trim_protocol=True):
+    def process(self, url_list, url_check_callback=None, url_check_trim_protocol=True, lastmods=None):
         """
         Extract the content of the pages from given urls.
         :param url_list list: url to extract
         :param url_check_callback function: callback to remove url from list
+        :param lastmods dict: sitemap <lastmod> of the urls, saved to the crawl state
         :rtype: list
         """
         # check if url_list is an instance of list
         if not isinstance(url_list, list):
             raise TypeError('url_list is expected to be an instance of list')
-        # use deque for better performance
-        urls = deque(url_list)
-        ret = []
-        while urls:
-            # empty the buffer for each iteration
-            buffer_ = []
-
-            # we need to check whether the news article is already in database or not
-            while urls and len(buffer_) < 20:
-                # fill the buffer to 10 (pass by reference)
-                self._fill_buffer(buffer_, urls)
-
-                if callable(url_check_callback):
-                    # retrieve urls already in database
-                    toRemove = url_check_callback(buffer_)
-                    # we select url that is not in database yet
-                    if url_check_trim_protocol:
-                        buffer_ = [url for url in buffer_ if re.sub(r'https?://', '', url) not in toRemove]
-                    else:
-                        buffer_ = [url for url in buffer_ if url not in toRemove]
-
-            # after the buffer is full and the news is not in the database, retrieve the data
-            for self.__cur_url in buffer_:
-                self.__verboseprint('Extracting: "{0}"'.format(self.__cur_url))
-                try:
-                    req_data = requests.get(self.__cur_url, self._header)
-                except Exception as e:
-                    continue
-
-                # find tag
-                soup = BeautifulSoup(req_data.text, 'lxml', parse_only=self.__soup_strainer)
-
-                data = self.extract_soup(soup, self._config['to_extract'])
-
-                if data == 61:
-                    # if required data is not found, don't put it to the result
-                    if self._is_debug:
-                        raise ValueError('[DEBUG] returned data is {0}, expected dict type'.format(data))
-                    else:
+        return list(self.iter_process(url_list, url_check_callback, url_check_trim_protocol, lastmods))
+
+    def iter_process(self, urls, url_check_callback=None, url_check_trim_protocol=True, lastmods=None):
+        """
+        Extract the content of the pages from given urls, yielding each article as soon as it is extracted.
+        Urls are consumed a buffer at a time, so urls may be a generator still discovering links.
+        :param urls iterable: url to extract
+        :param url_check_callback function: callback to remove url from list
+        :param lastmods dict: sitemap <lastmod> of the urls, saved to the crawl state (may be filled while iterating)
+        :rtype: generator of dict
+        """
+        if lastmods is None:
+            lastmods = {}
+        urls = iter(urls)
+        exhausted = False
+        executor = None
+        # pages handed to the extraction workers (url, future, headers, content hash), in fetch order
+        pending = deque()
+        if self._workers > 1 or self._parse_in_worker:
+            if self._executor is None:
+                # every worker compiles the site config once, see _init_worker
+                self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=_worker_context(), initializer=_init_worker, initargs=(self._config, self._is_debug, self._is_verbose))
+            executor = self._executor
+        try:
+            while not exhausted:
+                # empty the buffer for each iteration
+                buffer_ = []
+
+                # we need to check whether the news article is already in database or not
+                while not exhausted and len(buffer_) < self._buffer_size:
+                    # fill the buffer (pass by reference)
+                    exhausted = self._fill_buffer(buffer_, urls)
+
+                    if callable(url_check_callback) and buffer_:
+                        # retrieve urls already in database
+                        toRemove = url_check_callback(buffer_)
+                        # we select url that is not in database yet
+                        if url_check_trim_protocol:
+                            buffer_ = [url for url in buffer_ if re.sub(r'https?://', '', url) not in toRemove]
+                        else:
+                            buffer_ = [url for url in buffer_ if url not in toRemove]
+
+                # after the buffer is full and the news is not in the database, retrieve the data
+                for self.__cur_url, text, headers in self._fetch_buffer(buffer_):
+                    if text is None:
+                        # no headers when the request failed, a 304 otherwise
+                        if headers is None:
+                            self.fetch_errors += 1
+                            self.failed_urls.append(self.__cur_url)
+                        self._count_result('fetch_error' if headers is None else 'unchanged')
+                        continue
+                    content_hash = None
+                    if self._state is not None:
+                        content_hash = self._state.hash_content(text)
+                        state = self._state.get(self.__cur_url)
+                        if state is not None and state['content_hash'] == content_hash:
+                            # the page is the same as the last crawl, only refresh its validators
+                            self.__verboseprint('Unchanged: "{0}"'.format(self.__cur_url))
+                            self._state.update(self.__cur_url, headers, lastmod=lastmods.get(self.__cur_url))
+                            self._count_result('unchanged')
+                            continue
+
+                    if executor is None:
+                        data = self._complete(self.__cur_url, self.extract_page(self.__cur_url, text), headers, lastmods, content_hash)
+                        if data is not None:
+                            yield data
                         continue
-                data.update({'url': self.__cur_url})
-                ret.append(data)
-        return ret
 
-    def extract_soup(self, soup, config):
+                    # hand the page to the extraction workers and keep on downloading
+                    pending.append((self.__cur_url, executor.submit(_extract_worker, self.__cur_url, text), headers, content_hash))
+                    # bound the pages waiting for a worker, the oldest one is most likely done by now
+                    while len(pending) > self._workers * 2:
+                        data = self._complete_pending(pending, lastmods)
+                        if data is not None:
+                            yield data
+
+            while pending:
+                data = self._complete_pending(pending, lastmods)
+                if data is not None:
+                    yield data
+        except BrokenProcessPool:
+            # a worker process died, the next call starts new ones
+            self._executor.shutdown()
+            self._executor = None
+            raise
+        finally:
+            for _, future, _, _ in pending:
+                future.cancel()
+
+    def close(self):
+        """
+        Stop the extraction worker processes and close the async fetcher.
         """
-        Extract a content from soup object recursively. The function will assume key with string 'container' is a wrapper object of extraction target data.
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._async_fetcher is not None:
+            self._async_fetcher.close()
+            self._async_fetcher = None
+
+    def extract_page(self, url, text):
+        """
+        Parse a page with the parser backend and extract its content.
+        :param url str: url of the page
+        :param text str: page content
+        :rtype: dict, 61 if required data is not found
+        """
+        self.__cur_url = url
+        self.__verboseprint('Extracting: "{0}"'.format(url))
+
+        site = self._config['sitename']
+        # find tag
+        with self._metrics.timer('noox_stage_seconds', site=site, stage='parse'):
+            soup = self._backend.parse(text)
+
+        with self._metrics.timer('noox_stage_seconds', site=site, stage='extract'):
+            return self.extract_soup(soup)
+
+    def _complete(self, url, data, headers, lastmods, content_hash):
+        """
+        Finish the extraction of a page: add its url and save its state.
+        :param url str: url of the page
+        :param data dict: extracted content, 61 if required data is not found
+        :param headers dict: response headers
+        :param lastmods dict: sitemap <lastmod> of the urls
+        :param content_hash str: hash of the page content
+        :rtype: dict or None
+        """
+        if data == 61:
+            # if required data is not found, don't put it to the result
+            self._count_result('failed')
+            if self._is_debug:
+                raise ValueError('[DEBUG] returned data is {0}, expected dict type'.format(data))
+            return None
+        data.update({'url': url})
+        self._count_result('extracted')
+        if self._state is not None:
+            if self._defer_state:
+                self._unsaved_state[url] = (headers, lastmods.get(url), content_hash)
+            else:
+                self._state.update(url, headers, lastmod=lastmods.get(url), content_hash=content_hash)
+        return data
+
+    def commit_state(self, urls):
+        """
+        Save the crawl state of extracted news (with defer_state), once the output saved them: a news whose state
+        is saved is not grabbed again until it changes.
+        :param urls list: urls of the saved news
+        """
+        for url in urls:
+            state = self._unsaved_state.pop(url, None)
+            if state is not None:
+                self._state.update(url, state[0], lastmod=state[1], content_hash=state[2])
+
+    def discard_state(self):
+        """
+        Forget the crawl state of the extracted news that were not saved, they are grabbed again on the next crawl.
+        """
+        self._unsaved_state.clear()
+
+    def _complete_pending(self, pending, lastmods):
+        """
+        Wait for the oldest page handed to the extraction workers and finish its extraction.
+        :param pending deque: pages handed to the workers
+        :param lastmods dict: sitemap <lastmod> of the urls
+        :rtype: dict or None
+        """
+        url, future, headers, content_hash = pending.popleft()
+        data, metrics = future.result()
+        # the worker metrics are recorded in its own process
+        self._metrics.merge(metrics)
+        return self._complete(url, data, headers, lastmods, content_hash)
+
+    def _count_result(self, result):
+        """
+        Count a grabbed page in noox_news_total.
+        :param result str: extracted, failed, unchanged or fetch_error
+        """
+        self._metrics.inc('noox_news_total', site=self._config['sitename'], result=result)
+
+    def _fetch_buffer(self, buffer_):
+        """
+        Retrieve the pages in the buffer, concurrently when concurrency is more than one.
+        :param buffer_ list: urls to retrieve
+        :rtype: generator of (url, text, headers) tuple, text is None when the request failed or the page is not modified
+        """
+        if self._state is not None:
+            # ask the server to skip the body of the pages that have not changed since the last crawl
+            cond_headers = dict((url, self._state.conditional_headers(url)) for url in buffer_)
+        else:
+            cond_headers = {}
+
+        if self._concurrency > 1:
+            if self._async_fetcher is None:
+                # same timeout, retries and proxies as the shared fetcher
+                self._async_fetcher = AsyncFetcher(
+                    self._fetcher.headers, max_total=self._concurrency, max_per_host=self._host_concurrency, timeout=self._fetcher.timeout,
+                    scheduler=self._fetcher.scheduler, archive=self._fetcher.archive, retries=self._fetcher.retries,
+                    backoff_factor=self._fetcher.backoff_factor, proxies=self._fetcher.proxies)
+            yield from self._async_fetcher.fetch_all(buffer_, cond_headers)
+            return
+
+        for url in buffer_:
+            try:
+                req_data = self._fetcher.get(url, headers=cond_headers.get(url))
+            except Exception as e:
+                yield url, None, None
+                continue
+            if req_data.status_code == 304:
+                yield url, None, req_data.headers
+                continue
+            yield url, req_data.text, req_data.headers
+
+    def extract_soup(self, soup, plan=None):
+        """
+        Extract a content from soup object by executing the extraction plan (compiled from the 'to_extract' config).
         note that 61 is treated as fatal error. Number 61 is based on C errno.h. Number 61 will be returned if required data is not found or failed to extract.
 
-        :param soup BeautifulSoup: soup to iterate
-        :param config dict: list of item to extract and its wrapper
+        :param soup BeautifulSoup|ElementTree: document parsed by the parser backend
+        :param plan ExtractionPlan: plan to execute, default is the plan of the site config (a 'to_extract' dict is compiled on the fly)
         :rtype: dict
         """
+        if plan is None:
+            plan = self._plan
+        elif isinstance(plan, dict):
+            plan = ExtractionPlan(plan)
+
         data = {}
-        for el in config:
-            # when 'save' key is found, attempt to extract the content
-            if el == 'save':
-                if isinstance(config[el], list):
-                    # if there are several elements to extract inside a wrapper, iterate each extraction target
-                    for toSave in config[el]:
-                        # pass the wrapper and element extraction config
-                        contents = self._get_content(soup, toSave)
-                        if contents == 61:
-                            # if the required element is not found, immediately return 61 value
-                            print('[WARNING] url: "{0}" does not have required element: "{1}"'.format(self.__cur_url, toSave['as']))
-                            return 61
-                        if contents is None:
-                            if 'default' in toSave and len(toSave['default']) > 0:
-                                # if the content is not required ('required': false) and default value is supplied, we use the supplied default value
-                                self.__verboseprint('[INFO] url: "{0}", element: "{1}" is using default value: "{2}"'.format(self.__cur_url, toSave['as'], toSave['default']))
-                                contents = toSave['default']
-                            else:
-                                self.__verboseprint('[INFO] url: "{0}", element: "{1}" value is none'.format(self.__cur_url, toSave['as']))
-                        data.update({toSave['as']: contents})
-                if isinstance(config[el], dict):
-                    contents = self._get_content(soup, config[el])
-                    if contents == 61:
-                        print('[WARNING] url: "{0}" does not have required element: "{1}"'.format(self.__cur_url, config[el]['as']))
-                        return 61
-                    if contents is None:
-                        if 'default' in config[el] and len(config[el]['default']) > 0:
-                            self.__verboseprint('[INFO] url: "{0}", element: "{1}" is using default value: "{2}"'.format(self.__cur_url, config[el]['as'], config[el]['default']))
-                            contents = config[el]['default']
-                        else:
-                            self.__verboseprint('[INFO] url: "{0}", element: "{1}" value is none'.format(self.__cur_url, config[el]['as']))
-                    data.update({config[el]['as']: contents})
-            elif 'container' in el:
-                # if we found a '*container*' key (img_container, title_container, etc.), explore the container
-                if not isinstance(config[el], dict):
-                    raise TypeError('In key: "{0}"; key content is expected to be dict type. (*container* is considered as wrapper tag)')
-
-                if 'attr' in config[el] and config[el]['attr'] is not None:
-                    bsTag = soup.find(config[el]["tag"], {config[el]["attr"]: re.compile(config[el]["attr_val"])})
+        # containers are looked up once per article, keyed by their selector chain
+        containers = {(): soup}
+        for rule in plan.rules:
+            bsTag = self._find_container(containers, rule.container)
+            contents = self._get_content(bsTag, rule)
+            if contents == 61:
+                # if the required element is not found, immediately return 61 value
+                print('[WARNING] url: "{0}" does not have required element: "{1}"'.format(self.__cur_url, rule.name))
+                self._metrics.inc('noox_extraction_failures_total', site=self._config['sitename'], field=rule.name, reason=self._failure_reason)
+                return 61
+            if contents is None:
+                if rule.default is not None:
+                    # if the content is not required ('required': false) and default value is supplied, we use the supplied default value
+                    self.__verboseprint('[INFO] url: "{0}", element: "{1}" is using default value: "{2}"'.format(self.__cur_url, rule.name, rule.default))
+                    contents = rule.default
                 else:
-                    bsTag = soup.find(config[el]["tag"])
-
-                # pass the new wrapper and partial configuration to the function
-                datas = self.extract_soup(bsTag, config[el])
-                if datas == 61:
-                    return 61
-                data.update(datas)
+                    self.__verboseprint('[INFO] url: "{0}", element: "{1}" value is none'.format(self.__cur_url, rule.name))
+            data[rule.name] = contents
         return data
 
-    def _get_content(self, bsTag, config):
+    def _find_container(self, containers, chain):
+        """
+        Find the wrapper tag of a save rule, reusing the containers already found.
+        :param containers dict: found containers {selector chain: tag}
+        :param chain tuple: selectors of the containers, outermost first
+        :rtype: Tag
         """
-        Save an element inside a BeautifulSoup tag object.
-        :param bsTag Tag: BeautifulSoup tag object
-        :param config dict: definition of element to save (with its formatting, if exist)
+        if chain not in containers:
+            parent = self._find_container(containers, chain[:-1])
+            containers[chain] = None if parent is None else self._backend.find(parent, chain[-1])
+        return containers[chain]
+
+    def _get_content(self, bsTag, rule):
+        """
+        Save an element inside a tag object.
+        :param bsTag Tag: tag object of the parser backend
+        :param rule SaveRule: definition of element to save (with its formatting, if exist)
         :rtype: str
         """
         ret = None
+        self._failure_reason = None
         if bsTag is None:
-            if 'required' not in config or config['required']:
+            if rule.required:
                 # the container does not exist in the first place
                 # ENODATA value
                 print('[ERROR] container does not exist')
+                self._failure_reason = 'container_missing'
                 return 61
             else:
                 return None
-        if isinstance(config, dict):
-            # find the tag from the soup
-            if 'attr' in config and config['attr'] is not None:
-                tag = bsTag.find(config["tag"], {config["attr"]: re.compile(config["attr_val"])})
-            else:
-                tag = bsTag.find(config["tag"])
-
-            if 'save_attr' in config:
-                # save attribute value instead of tag content
-                if tag is None or not tag.has_attr(config['save_attr']):
-                    if 'required' not in config or config['required']:
-                        # required is not defined or element is required
-                        # ENODATA value
-                        return 61
-                    return ret
-                if 'format' in config and config['format'] is not None:
-                    ret = self._format_content(tag, config['format'], save_attr=config['save_attr'])
-                else:
-                    ret = tag[config['save_attr']]
+        # find the tag from the soup
+        tag = self._backend.find(bsTag, rule.selector)
+
+        if rule.save_attr is not None:
+            # save attribute value instead of tag content
+            if tag is None or not self._backend.has_attr(tag, rule.save_attr):
+                if rule.required:
+                    # required is not defined or element is required
+                    # ENODATA value
+                    self._failure_reason = 'element_missing' if tag is None else 'attribute_missing'
+                    return 61
+                return ret
+            if rule.format is not None:
+                with self._metrics.timer('noox_stage_seconds', site=self._config['sitename'], stage='format'):
+                    ret = self._format_content(tag, rule.format, save_attr=rule.save_attr)
             else:
-                if tag is None:
-                    if 'required' not in config or config['required']:
-                        # ENODATA value
-                        return 61
-                    return ret
-                if 'format' in config and config['format'] is not None:
-                    ret = self._format_content(tag, config['format'])
-                else:
-                    ret = tag.get_text()
+                ret = self._backend.get_attr(tag, rule.save_attr)
         else:
-            raise TypeError('config parameter is expected to be type of dict')
+            if tag is None:
+                if rule.required:
+                    # ENODATA value
+                    self._failure_reason = 'element_missing'
+                    return 61
+                return ret
+            if rule.format is not None:
+                with self._metrics.timer('noox_stage_seconds', site=self._config['sitename'], stage='format'):
+                    ret = self._format_content(tag, rule.format)
+            else:
+                ret = self._backend.get_text(tag)
 
         if not isinstance(ret, str) or len(ret) < 1:
-            if 'required' not in config or config['required']:
+            if rule.required:
+                if self._failure_reason is None:
+                    self._failure_reason = 'empty_value'
                 return 61
             else:
                 return None
         return ret
 
-    def _format_content(self, bsTag, config, save_attr=None):
+    def _format_content(self, bsTag, rule, save_attr=None):
         """
-        Format the extracted content according to the config.
-        :param bsTag Tag: BeautifulSoup tag object
-        :param config dict: formatting configuration
+        Format the extracted content according to the compiled format rule.
+        :param bsTag Tag: tag object of the parser backend
+        :param rule FormatRule: formatting rule
         :param save_attr str: extract the target element attribute instead of content
         :rtype: str
         """
-        if 'type' in config and config['type'] == 'title':
-            return bsTag[save_attr].title() if isinstance(save_attr, str) else bsTag.get_text().title()
-        elif 'type' in config and config['type'] == 'date':
-            return self._date_parser(bsTag[save_attr] if isinstance(save_attr, str) else bsTag.get_text(), config)
-        elif 'type' in config and config['type'] == 'get_text':
-            return bsTag.get_text()
-
-        if "bs_remove" in config and len(config["bs_remove"]) > 0:
-            # it is possible to only use bs_remove in format dict
-            for def_ in config["bs_remove"]:
-                if 'attr' in def_:
-                    if len(def_['attr_val']) < 1:
-                        raise ValueError('attr_val is empty')
-                    elements = bsTag.find_all(def_['tag'], {def_['attr']: re.compile(def_['attr_val'])})
-                else:
-                    elements = bsTag.find_all(def_['tag'])
-                for el in elements:
-                    el.decompose()
-
-        if "regex_capture" in config and len(config["regex_capture"]) > 0:
+        backend = self._backend
+        if rule.type == 'title':
+            return backend.get_attr(bsTag, save_attr).title() if isinstance(save_attr, str) else backend.get_text(bsTag).title()
+        elif rule.type == 'date':
+            return rule.date_parser.parse(backend.get_attr(bsTag, save_attr) if isinstance(save_attr, str) else backend.get_text(bsTag))
+        elif rule.type == 'get_text':
+            return backend.get_text(bsTag)
+
+        # it is possible to only use bs_remove in format dict
+        for selector in rule.bs_remove:
+            for el in backend.find_all(bsTag, selector):
+                backend.decompose(el)
+
+        if rule.regex_capture is not None:
             # this function only capture first capture group in the regex
-            text = bsTag[save_attr] if isinstance(save_attr, str) else bsTag.get_text()
-            cap_regex = re.compile(config["regex_capture"])
-            cap = cap_regex.search(text).group(1)
+            text = backend.get_attr(bsTag, save_attr) if isinstance(save_attr, str) else backend.get_text(bsTag)
+            cap = rule.regex_capture.search(text).group(1)
             # if the extracted content is title, return the string with capitalized first char in each word
-            return cap if "regex_capture_title" not in config or not config['regex_capture_title'] else cap.title()
+            return cap.title() if rule.regex_capture_title else cap
 
-        if 'regex_remove' in config or 'replace' in config:
+        if rule.cleaner is not None:
             # when entering this, the function will process raw tag content (with html tags)
-            regex = r'(?:<script(?:\s|\S)*?<\/script>)|(?:<style(?:\s|\S)*?<\/style>)|(?:<!--(?:\s|\S)*?-->)'
-
-            spc_chars = {"\n": "", "\t": "", "\r": "", "\r\n": ""}
-            # if regex to remove tag is not empty, add it to the base regex with | (or) separator.
-            if "regex_remove" in config:
-                regex += '|'+'|'.join(config["regex_remove"])
-
-            # if regex to replace tag is not empty, add it to the exception list.
-            if "replace" in config:
-                config["replace"].update(spc_chars)
-                regex += '|'+''.join(map(lambda tag: '(?!'+re.escape(tag)+')', config["replace"]))+r'(?:<\/?(?:\s|\S)*?>)'
-            else:
-                regex += '|'+r'(<\/?(\s|\S)*?>)'
-            fin_regex = re.compile(regex)
-
-            cleantext = re.sub(fin_regex, '', str(bsTag))
-
-            if "replace" in config:
-                fin_text = self._multireplace(cleantext, config["replace"])
-            else:
-                fin_text = self._multireplace(cleantext, spc_chars)
-
-            fin_text = re.sub(r"(?:<br\/?>){3,}", '<br><br>', fin_text)
-            if 'type' in config and config['type'] == 'article' and len(fin_text) < 400:
+            fin_text = rule.cleaner.clean(backend.to_string(bsTag))
+            if rule.type == 'article' and len(fin_text) < 400:
                 print('[WARNING] url: "{0}" article is less than 250 characters'.format(self.__cur_url))
+                self._failure_reason = 'article_too_short'
                 return 61
             return fin_text
-        return str(bsTag)
+        return backend.to_string(bsTag)
 
     def _fill_buffer(self, buffer_, urls):
         """
         Fill buffer from pool of urls.
         :param buffer_ list: buffer to fill
-        :param urls deque: pool of urls
+        :param urls iterator: pool of urls
+        :rtype: bool, whether the pool is exhausted
         """
-        while urls and len(buffer_) < 20:
-            url = urls.popleft()
+        while len(buffer_) < self._buffer_size:
+            url = next(urls, None)
+            if url is None:
+                return True
+            self.url_count += 1
             if self._config['sitename'] == self._get_domain_name(url):
                 buffer_ += [url]
+        return False
 
     def _date_parser(self, date, config):
         """
         Attempt to parse a date from a given string.
         :param date str: date to parse
+        :param config dict: format rule of the date
         :rtype: str
         """
-        if not isinstance(date, str):
-            raise TypeError('date argument is expected to be a string')
-        month = {
-            'january': '01',
-            'february': '02',
-            'march': '03',
-            'april': '04',
-            'may': '05',
-            'june': '06',
-            'july': '07',
-            'august': '08',
-            'september': '09',
-            'october': '10',
-            'november': '11',
-            'december': '12'
-        }
-        shortMonth = {
-            'jan': '01',
-            'feb': '02',
-            'mar': '03',
-            'apr': '04',
-            'jun': '06',
-            'jul': '07',
-            'aug': '08',
-            'ags': '08',
-            'agu': '08',
-            'sep': '09',
-            'oct': '10',
-            'okt': '10',
-            'nov': '11',
-            'dec': '12',
-            'des': '12'
-        }
-        bulan = {
-            'januari': '01',
-            'februari': '02',
-            'maret': '03',
-            'april': '04',
-            'mei': '05',
-            'juni': '06',
-            'juli': '07',
-            'agustus': '08',
-            'september': '09',
-            'oktober': '10',
-            'nopember': '11',
-            'desember': '12'
-        }
-        if 'normalize_date' not in config or config["normalize_date"]:
-            repl = {}
-            repl.update(month)
-            repl.update(shortMonth)
-            repl.update(bulan)
-            date = self._multireplace(date.lower(), repl)
-        if "date_regex" in config and len(config["date_regex"]) > 0:
-            reg = re.compile(config["date_regex"])
-            try:
-                matches = reg.search(date).groupdict()
-                date = '{d}/{m}/{y} {h}:{i}'.format_map(matches)
-            except Exception as e:
-                date = re.sub(r'[^0-9:\s\/\-]', '', date)
-        else:
-            date = re.sub(r'[^0-9:\s\/\-]', '', date)
-
-        try:
-            parser = dp()
-            df = True if 'day_first' not in config or config['day_first'] else False
-            dateObj = parser.parse(date, dayfirst=df)
-            return dateObj.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception as e:
-            return None
-
-    def _find_item(self, obj, key):
-        """
-        Recursively find the value certain key inside a dict. Returned value will be distinct.
-        :param obj dict: dictionary to iterate
-        :param key str: key to find
-        :rtype: list
-        """
-        ret = []
-        if isinstance(obj, dict):
-            if key in obj:
-                ret.append(obj[key])
-            for i, d in obj.items():
-                item = self._find_item(d, key)
-                if len(item) > 0:
-                    ret = [v for v in item if v not in ret] + ret
-            return ret
-        elif isinstance(obj, list):
-            for d in obj:
-                item = self._find_item(d, key)
-                if len(item) > 0:
-                    ret = [v for v in item if v not in ret] + ret
-            return ret
-        else:
-            return ret
-
-    def _multireplace(self, string, replacements):
-        """
-        Given a string and a replacement map, it returns the replaced string.
-        :param str string: string to execute replacements on
-        :param dict replacements: replacement dictionary {value to find: value to replace}
-        :rtype: str
-        """
-        # Place longer ones first to keep shorter substrings from matching where the longer ones should take place
-        # For instance given the replacements {'ab': 'AB', 'abc': 'ABC'} against the string 'hey abc', it should produce
-        # 'hey ABC' and not 'hey ABc'
-        substrs = sorted(replacements, key=len, reverse=True)
-
-        # Create a big OR regex that matches any of the substrings to replace
-        regexp = re.compile('|'.join(map(re.escape, substrs)))
-
-        # For each match, look up the new string in the replacements
-        return regexp.sub(lambda match: replacements[match.group(0)], string)
+        return get_date_parser(config).parse(date)
 
     def _get_domain_name(self, url):
         """
@@ -402,3 +452,40 @@ class NewsGrabber:
         """
         url_parts = urlparse(url).hostname.split('.')
         return url_parts[1 if len(url_parts) == 3 else 0]
+
+
+# grabber of an extraction worker process
+_worker_grabber = None
+
+
+def _worker_context():
+    """
+    Start method of the extraction workers. The pool may be started while other threads run (the sites of the daemon,
+    the output providers, the metrics server), a forked worker could inherit a lock one of them holds.
+    :rtype: multiprocessing context
+    """
+    return multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+def _init_worker(config, debug, verbose):
+    """
+    Initialize an extraction worker process, the site config is compiled once per worker.
+    :param config dict: site config
+    :param debug bool: debug mode
+    :param verbose bool: message verbosity
+    """
+    global _worker_grabber
+    # a worker only reports the metrics of its own pages
+    get_metrics().snapshot(reset=True)
+    _worker_grabber = NewsGrabber(config, debug=debug, verbose=verbose)
+
+
+def _extract_worker(url, text):
+    """
+    Extract a page in an extraction worker process.
+    :param url str: url of the page
+    :param text str: page content
+    :rtype: tuple of (dict, 61 if required data is not found, metrics recorded since the last page)
+    """
+    data = _worker_grabber.extract_page(url, text)
+    return data, get_metrics().snapshot(reset=True)
@@ -0,0 +1,261 @@
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
+
+
+class BeautifulSoupBackend:
+    """
+    Parser backend built on BeautifulSoup (with the lxml tree builder), the reference implementation.
+    """
+
+    name = 'bs4'
+
+    def __init__(self, plan):
+        # to optimize the BeautifulSoup, tell the BeautifulSoup only to parse certain elements
+        self._soup_strainer = SoupStrainer(list(plan.tags))
+
+    def parse(self, text):
+        return BeautifulSoup(text, 'lxml', parse_only=self._soup_strainer)
+
+    def find(self, node, selector):
+        if selector.attr is not None:
+            return node.find(selector.tag, {selector.attr: selector.attr_val})
+        return node.find(selector.tag)
+
+    def find_all(self, node, selector):
+        if selector.attr is not None:
+            return node.find_all(selector.tag, {selector.attr: selector.attr_val})
+        return node.find_all(selector.tag)
+
+    def has_attr(self, node, attr):
+        return node.has_attr(attr)
+
+    def get_attr(self, node, attr):
+        return node[attr]
+
+    def get_text(self, node):
+        return node.get_text()
+
+    def decompose(self, node):
+        node.decompose()
+
+    def to_string(self, node):
+        return str(node)
+
+
+class LxmlBackend:
+    """
+    Parser backend working directly on the lxml.html tree, without building a BeautifulSoup tree.
+    Matching, get_text() and serialization follow BeautifulSoup rules (multi-valued class attribute,
+    alphabetically sorted attributes, minimal entity substitution, <br/> void elements, whitespace-only
+    strings collapsed, script, style and template strings left out of the text) so the output is the same as
+    BeautifulSoupBackend.
+    The only known difference: a valueless boolean attribute (<input disabled>) is serialized as
+    disabled="disabled" instead of disabled="".
+    """
+
+    name = 'lxml'
+
+    # attributes BeautifulSoup treats as whitespace separated lists
+    _cdata_list_attributes = {
+        '*': ('class', 'accesskey', 'dropzone'),
+        'a': ('rel', 'rev'),
+        'link': ('rel', 'rev'),
+        'td': ('headers',),
+        'th': ('headers',),
+        'form': ('accept-charset',),
+        'object': ('archive',),
+        'area': ('rel',),
+        'icon': ('sizes',),
+        'iframe': ('sandbox',),
+        'output': ('for',)
+    }
+
+    _void_elements = frozenset([
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta', 'param',
+        'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer'])
+
+    # strings inside these tags are neither part of get_text() nor entity substituted
+    _raw_text_elements = frozenset(['script', 'style'])
+
+    # the whole subtree of these tags is left out of get_text(), only get_text() of the tag itself returns it
+    _text_excluded_elements = frozenset(['script', 'style', 'template'])
+
+    # whitespace-only strings outside these tags are collapsed to a single newline or space
+    _preserve_whitespace_elements = frozenset(['pre', 'textarea'])
+
+    _ascii_spaces = '\x20\x0a\x09\x0c\x0d'
+
+    _nonwhitespace_regex = re.compile(r'\S+')
+
+    # tag of the placeholder left by decompose(), never serialized
+    _removed_tag = 'noox-removed'
+
+    def __init__(self, plan):
+        self._parser = etree.HTMLParser(encoding='utf-8')
+
+    def parse(self, text):
+        # feed bytes, lxml refuses unicode strings holding an encoding declaration
+        root = etree.fromstring(text.encode('utf-8'), self._parser)
+        if root is None:
+            root = etree.Element('html')
+        return root.getroottree()
+
+    def find(self, node, selector):
+        for el in self._iter(node, selector.tag):
+            if selector.attr is None or self._attr_matches(el, selector.attr, selector.attr_val):
+                return el
+        return None
+
+    def find_all(self, node, selector):
+        return [el for el in self._iter(node, selector.tag) if selector.attr is None or self._attr_matches(el, selector.attr, selector.attr_val)]
+
+    def has_attr(self, node, attr):
+        return attr in node.attrib
+
+    def get_attr(self, node, attr):
+        value = node.get(attr)
+        if self._is_cdata_list(node.tag, attr):
+            return self._nonwhitespace_regex.findall(value)
+        return value
+
+    def get_text(self, node):
+        preserve = self._is_preserved(node)
+        if node.tag in self._raw_text_elements:
+            return self._string(node.text, preserve) if node.text else ''
+        if node.tag != 'template':
+            for ancestor in node.iterancestors('template'):
+                # like BeautifulSoup, the strings of a template are only part of the text of the template
+                return ''
+        parts = []
+        self._collect_text(node, parts, preserve, node.tag != 'template')
+        return ''.join(parts)
+
+    def decompose(self, node):
+        parent = node.getparent()
+        if parent is None:
+            return
+        # lxml keeps the text following an element as its tail, replace the element with an empty
+        # placeholder so the strings around it stay separated like they are in BeautifulSoup
+        placeholder = etree.Element(self._removed_tag)
+        placeholder.tail = node.tail
+        parent.replace(node, placeholder)
+
+    def to_string(self, node):
+        parts = []
+        self._serialize(node, parts, self._is_preserved(node))
+        return ''.join(parts)
+
+    def _iter(self, node, tag):
+        if isinstance(node, etree._ElementTree):
+            # the document itself, its root element may match too
+            return node.iter(tag)
+        return node.iterdescendants(tag)
+
+    def _is_cdata_list(self, tag, attr):
+        return attr in self._cdata_list_attributes['*'] or attr in self._cdata_list_attributes.get(tag, ())
+
+    def _attr_matches(self, el, attr, regex):
+        value = el.get(attr)
+        if value is None:
+            return False
+        if not self._is_cdata_list(el.tag, attr):
+            return regex.search(value) is not None
+        values = self._nonwhitespace_regex.findall(value)
+        for item in values:
+            if regex.search(item) is not None:
+                return True
+        # like BeautifulSoup, try again with the whole list as a single string
+        return len(values) != 1 and regex.search(' '.join(values)) is not None
+
+    def _is_preserved(self, node):
+        """
+        Whether the strings of the node are inside a whitespace preserving tag (pre, textarea).
+        """
+        if node.tag in self._preserve_whitespace_elements:
+            return True
+        for ancestor in node.iterancestors():
+            if ancestor.tag in self._preserve_whitespace_elements:
+                return True
+        return False
+
+    def _string(self, text, preserve):
+        """
+        Collapse a whitespace-only string like BeautifulSoup does while building its tree.
+        """
+        if not preserve and not text.strip(self._ascii_spaces):
+            return '\n' if '\n' in text else ' '
+        return text
+
+    def _collect_text(self, node, parts, preserve, exclude=True):
+        """
+        :param exclude bool: whether the subtrees of the _text_excluded_elements are skipped
+        """
+        if node.text:
+            parts.append(self._string(node.text, preserve))
+        for child in node:
+            if isinstance(child.tag, str) and not (exclude and child.tag in self._text_excluded_elements):
+                self._collect_text(child, parts, preserve or child.tag in self._preserve_whitespace_elements, exclude)
+            if child.tail:
+                parts.append(self._string(child.tail, preserve))
+
+    def _serialize(self, node, parts, preserve):
+        tag = node.tag
+        if tag is etree.Comment:
+            parts.append('<!--' + (node.text or '') + '-->')
+            return
+        if tag is etree.PI:
+            parts.append('<?' + node.target + (' ' + node.text if node.text else '') + '>')
+            return
+        if not isinstance(tag, str) or tag == self._removed_tag:
+            return
+
+        parts.append('<' + tag)
+        for attr in sorted(node.attrib.keys()):
+            value = node.attrib[attr]
+            if self._is_cdata_list(tag, attr):
+                value = ' '.join(self._nonwhitespace_regex.findall(value))
+            parts.append(' ' + attr + '=' + self._quote(self._escape(value)))
+
+        if tag in self._void_elements and not node.text and len(node) == 0:
+            parts.append('/>')
+            return
+        parts.append('>')
+
+        raw = tag in self._raw_text_elements
+        if node.text:
+            text = self._string(node.text, preserve)
+            parts.append(text if raw else self._escape(text))
+        for child in node:
+            self._serialize(child, parts, preserve or child.tag in self._preserve_whitespace_elements)
+            if child.tail:
+                parts.append(self._escape(self._string(child.tail, preserve)))
+        parts.append('</' + tag + '>')
+
+    def _escape(self, text):
+        return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+    def _quote(self, value):
+        if '"' in value:
+            if "'" in value:
+                return '"' + value.replace('"', '&quot;') + '"'
+            return "'" + value + "'"
+        return '"' + value + '"'
+
+
+backends = {
+    'bs4': BeautifulSoupBackend,
+    'lxml': LxmlBackend
+}
+
+
+def get_backend(name, plan):
+    """
+    Create the parser backend of a site config.
+    :param name str: backend name ('bs4' or 'lxml')
+    :param plan ExtractionPlan: compiled extraction plan of the site
+    :rtype: BeautifulSoupBackend|LxmlBackend
+    """
+    if name not in backends:
+        raise ValueError('Unknown parser backend: {0}'.format(name))
+    return backends[name](plan)
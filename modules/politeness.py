@@ -0,0 +1,230 @@
+import time
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+class _HostState:
+    """
+    Rate and in-flight requests of a single host.
+    """
+
+    def __init__(self, rate, max_in_flight):
+        self.rate = rate
+        self.crawl_delay = 0
+        # monotonic time of the next free request slot and of the end of a Retry-After
+        self.next_slot = 0
+        self.blocked_until = 0
+        self.in_flight = 0
+        self.slots = threading.Condition()
+        self.max_in_flight = max_in_flight
+        self.robots_loaded = False
+        # held while robots.txt is read, the first requests wait for its Crawl-delay
+        self.robots_lock = threading.Lock()
+
+
+class PolitenessScheduler:
+    """
+    Per host request scheduler. Every host gets its own requests per second and in-flight limits (from the "politeness"
+    key of the site config), honours Retry-After and the robots.txt Crawl-delay, and adapts its rate: halved on 429/503,
+    slowly raised back to the configured rate on fast successful responses.
+    """
+
+    # config keys and their default
+    defaults = {
+        'rps': 2.0,
+        'max_in_flight': 4,
+        'min_rps': 0.1,
+        'adaptive': True,
+        'respect_robots': True,
+        'fast_response': 1.0
+    }
+
+    def __init__(self, rps=2.0, max_in_flight=4, min_rps=0.1, adaptive=True, respect_robots=True, fast_response=1.0, user_agent='*'):
+        if rps <= 0 or min_rps <= 0:
+            raise ValueError('rps and min_rps are expected to be positive')
+        if not isinstance(max_in_flight, int) or max_in_flight < 1:
+            raise ValueError('max_in_flight is expected to be a positive int')
+        self.rps = float(rps)
+        self.max_in_flight = max_in_flight
+        self.min_rps = min(float(min_rps), self.rps)
+        self.adaptive = adaptive
+        self.respect_robots = respect_robots
+        # a successful response faster than this (seconds) raises the rate
+        self.fast_response = fast_response
+        self.user_agent = user_agent
+        # Fetcher whose sessions read robots.txt (set by the Fetcher given this scheduler)
+        self.fetcher = None
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, user_agent='*'):
+        """
+        Create the scheduler of a site from the "politeness" key of its config.
+        :param config dict: site config
+        :param user_agent str: user agent matched against robots.txt
+        :rtype: PolitenessScheduler
+        """
+        settings = dict(cls.defaults)
+        settings.update(config.get('politeness', {}))
+        unknown = set(settings).difference(cls.defaults)
+        if unknown:
+            raise KeyError('Unknown politeness setting: {0}'.format(', '.join(sorted(unknown))))
+        return cls(user_agent=user_agent, **settings)
+
+    def acquire(self, url):
+        """
+        Block until a request to the url host is allowed, then count it as in flight.
+        Call release() once the response is received.
+        :param url str: url to request
+        """
+        host = self._host(url)
+        with host.slots:
+            while host.in_flight >= host.max_in_flight:
+                host.slots.wait()
+            host.in_flight += 1
+        time.sleep(self.reserve(url))
+
+    def release(self, url, status=None, headers=None, elapsed=None):
+        """
+        Mark a request acquired with acquire() as finished and adapt the rate to its response.
+        :param url str: requested url
+        :param status int: response status, None when the request failed
+        :param headers dict: response headers
+        :param elapsed float: response time in seconds
+        """
+        host = self._host(url)
+        with host.slots:
+            host.in_flight -= 1
+            host.slots.notify()
+        self.feedback(url, status, headers, elapsed)
+
+    def reserve(self, url):
+        """
+        Book the next request slot of the url host, without in-flight accounting (used by the async fetcher).
+        :param url str: url to request
+        :rtype: float, seconds to wait before sending the request
+        """
+        host = self._host(url)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, host.next_slot, host.blocked_until)
+            host.next_slot = slot + max(1 / host.rate, host.crawl_delay)
+        return slot - now
+
+    def feedback(self, url, status=None, headers=None, elapsed=None):
+        """
+        Adapt the rate of the url host to a response.
+        :param url str: requested url
+        :param status int: response status, None when the request failed
+        :param headers dict: response headers
+        :param elapsed float: response time in seconds
+        """
+        if status is None:
+            return
+        host = self._host(url)
+        with self._lock:
+            if status in (429, 503):
+                retry_after = self._retry_after(headers)
+                if retry_after is not None:
+                    host.blocked_until = max(host.blocked_until, time.monotonic() + retry_after)
+                if self.adaptive:
+                    # multiplicative decrease
+                    host.rate = max(self.min_rps, host.rate / 2)
+            elif status < 400 and self.adaptive and elapsed is not None and elapsed < self.fast_response:
+                # additive increase, up to the configured rate
+                host.rate = min(self.rps, host.rate + self.rps / 20)
+
+    def rate(self, url):
+        """
+        Current requests per second of the url host.
+        :rtype: float
+        """
+        return self._host(url).rate
+
+    def _host(self, url):
+        parsed = urlparse(url)
+        with self._lock:
+            if parsed.netloc not in self._hosts:
+                self._hosts[parsed.netloc] = _HostState(self.rps, self.max_in_flight)
+            host = self._hosts[parsed.netloc]
+        if self.respect_robots and not host.robots_loaded:
+            with host.robots_lock:
+                if not host.robots_loaded:
+                    crawl_delay = self._get_crawl_delay(parsed.scheme + '://' + parsed.netloc + '/robots.txt')
+                    if crawl_delay is not None:
+                        host.crawl_delay = crawl_delay
+                    host.robots_loaded = True
+        return host
+
+    def _get_crawl_delay(self, robots_url):
+        """
+        Read the Crawl-delay of robots.txt.
+        :param robots_url str: robots.txt url
+        :rtype: float or None
+        """
+        try:
+            if self.fetcher is not None:
+                # same session, proxies, retries and metrics as the pages of the host
+                resp = self.fetcher.get(robots_url, scheduled=False, archive=False, timeout=10, headers={'User-Agent': self.user_agent})
+            else:
+                resp = requests.get(robots_url, timeout=10, headers={'User-Agent': self.user_agent})
+        except requests.RequestException:
+            return None
+        if resp.status_code != 200:
+            return None
+        return self._parse_crawl_delay(resp.text)
+
+    def _parse_crawl_delay(self, robots):
+        """
+        Find the Crawl-delay of the group matching the user agent (or of the * group) in a robots.txt.
+        urllib.robotparser is not used, it ignores fractional delays.
+        :param robots str: robots.txt content
+        :rtype: float or None
+        """
+        delays = {}
+        agents = []
+        in_rules = False
+        for line in robots.splitlines():
+            line = line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            key, value = [part.strip() for part in line.split(':', 1)]
+            key = key.lower()
+            if key == 'user-agent':
+                if in_rules:
+                    # a user-agent line after rules starts a new group
+                    agents = []
+                    in_rules = False
+                agents.append(value.lower())
+            else:
+                in_rules = True
+                if key == 'crawl-delay':
+                    try:
+                        delay = float(value)
+                    except ValueError:
+                        continue
+                    for agent in agents:
+                        delays.setdefault(agent, delay)
+        user_agent = self.user_agent.lower()
+        for agent, delay in delays.items():
+            if agent != '*' and agent in user_agent:
+                return delay
+        return delays.get('*')
+
+    def _retry_after(self, headers):
+        """
+        Parse the Retry-After header, either seconds or a http date.
+        :rtype: float or None
+        """
+        if headers is None or headers.get('Retry-After') is None:
+            return None
+        value = headers.get('Retry-After').strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,237 @@
+import base64
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+class ResponseArchive:
+    """
+    On-disk archive of the fetched pages, so the news can be extracted again (e.g. after a config change) without fetching.
+    Responses are written as WARC/1.0 records, one gzip member each, to a segment file per archive instance. Payloads are
+    content-addressed by their sha1: a payload already archived is written as a small revisit record pointing at the first
+    copy. A SQLite index maps every url to the record holding its payload.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS `responses` ('
+        '`id` INTEGER PRIMARY KEY AUTOINCREMENT, '
+        '`url` TEXT NOT NULL, '
+        '`archived_at` REAL NOT NULL, '
+        '`digest` TEXT NOT NULL, '
+        '`file` TEXT NOT NULL, '
+        '`offset` INTEGER NOT NULL, '
+        '`length` INTEGER NOT NULL)'
+    )
+
+    _revisit_profile = 'http://netpreserve.org/warc/1.0/revisit/identical-payload-digest'
+
+    # the archived body is already decoded, these headers do not describe it anymore
+    _dropped_headers = ('content-encoding', 'transfer-encoding', 'content-length')
+
+    def __init__(self, path, max_segment_size=1 << 30):
+        if not isinstance(path, str):
+            raise TypeError('path parameter is expected to be str')
+        self.path = path
+        self.max_segment_size = max_segment_size
+        os.makedirs(path, exist_ok=True)
+        # the fetcher may be shared by several threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'index.db'), timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(self._schema)
+        self._db.execute('CREATE INDEX IF NOT EXISTS `responses_url` ON `responses` (`url`, `archived_at`)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS `responses_digest` ON `responses` (`digest`)')
+        self._db.commit()
+        self._segment = None
+        self._segment_name = None
+        # number of responses written as a full record and as a revisit
+        self.written = 0
+        self.revisits = 0
+
+    def write(self, url, status, reason, headers, body):
+        """
+        Archive a response.
+        :param url str: requested url
+        :param status int: response status
+        :param reason str: response reason phrase
+        :param headers dict: response headers
+        :param body bytes: decoded response body
+        """
+        digest = 'sha1:' + base64.b32encode(hashlib.sha1(body).digest()).decode()
+        now = time.time()
+        http_head = 'HTTP/1.1 {0} {1}\r\n'.format(status, reason or '')
+        for name, value in headers.items():
+            if name.lower() not in self._dropped_headers:
+                http_head += '{0}: {1}\r\n'.format(name, value)
+        http_head += 'Content-Length: {0}\r\n\r\n'.format(len(body))
+
+        with self._lock:
+            original = self._db.execute(
+                'SELECT `url`, `archived_at`, `file`, `offset`, `length` FROM `responses` WHERE `digest` = ? LIMIT 1', (digest,)).fetchone()
+            warc_headers = [
+                ('WARC-Target-URI', url),
+                ('WARC-Date', self._warc_date(now)),
+                ('WARC-Record-ID', '<urn:uuid:{0}>'.format(uuid.uuid4())),
+                ('WARC-Payload-Digest', digest)
+            ]
+            if original is None:
+                block = http_head.encode('utf8') + body
+                offset, length = self._append([('WARC-Type', 'response')] + warc_headers, block)
+                location = (self._segment_name, offset, length)
+                self.written += 1
+            else:
+                # the payload is already archived, only record the headers
+                warc_headers += [
+                    ('WARC-Profile', self._revisit_profile),
+                    ('WARC-Refers-To-Target-URI', original[0]),
+                    ('WARC-Refers-To-Date', self._warc_date(original[1]))
+                ]
+                self._append([('WARC-Type', 'revisit')] + warc_headers, http_head.encode('utf8'))
+                location = original[2:]
+                self.revisits += 1
+            self._db.execute(
+                'INSERT INTO `responses` (`url`, `archived_at`, `digest`, `file`, `offset`, `length`) VALUES (?, ?, ?, ?, ?, ?)',
+                (url, now, digest) + tuple(location))
+            # every crawl process writes to the same index, commit right away so the write lock is never held
+            # across requests
+            self._commit()
+
+    def write_response(self, url, resp):
+        """
+        Archive a requests response (its body must have been read).
+        :param url str: requested url, the archive is looked up by it (resp.url is the url after redirects)
+        :param resp Response: response to archive
+        """
+        self.write(url, resp.status_code, resp.reason, resp.headers, resp.content)
+
+    def get(self, url):
+        """
+        Return the latest archived response of a url.
+        :param url str: archived url
+        :rtype: requests.models.Response or None when the url is not archived
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT `file`, `offset`, `length` FROM `responses` WHERE `url` = ? ORDER BY `archived_at` DESC LIMIT 1', (url,)).fetchone()
+            if row is not None and row[0] == self._segment_name:
+                # the record may still be in the write buffer
+                self._segment.flush()
+        if row is None:
+            return None
+        status, reason, headers, body = self._read(*row)
+        resp = Response()
+        resp.url = url
+        resp.status_code = status
+        resp.reason = reason
+        resp.headers = headers
+        resp.encoding = get_encoding_from_headers(headers)
+        resp._content = body
+        return resp
+
+    def urls(self, since=None, until=None):
+        """
+        Return the archived urls, in archiving order.
+        :param since float: only urls archived after this unix time
+        :param until float: only urls archived before this unix time
+        :rtype: list
+        """
+        sql = 'SELECT `url` FROM `responses` WHERE `archived_at` >= ? AND `archived_at` < ? GROUP BY `url` ORDER BY MIN(`id`)'
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql, (since or 0, until or float('inf'))).fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+                self._segment_name = None
+            self._db.close()
+
+    def _append(self, warc_headers, block):
+        """
+        Append a record to the current segment, as its own gzip member so it can be read alone.
+        :param warc_headers list: (name, value) WARC headers
+        :param block bytes: record block
+        :rtype: tuple of (offset, length) of the compressed record
+        """
+        if self._segment is None or self._segment.tell() >= self.max_segment_size:
+            self._open_segment()
+        head = 'WARC/1.0\r\n'
+        for name, value in warc_headers:
+            head += '{0}: {1}\r\n'.format(name, value)
+        head += 'Content-Type: application/http; msgtype=response\r\n'
+        head += 'Content-Length: {0}\r\n\r\n'.format(len(block))
+        record = gzip.compress(head.encode('utf8') + block + b'\r\n\r\n')
+        offset = self._segment.tell()
+        self._segment.write(record)
+        return offset, len(record)
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        # one segment per archive instance, several crawls may write to the archive at the same time
+        self._segment_name = 'responses-{0}-{1}.warc.gz'.format(time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:12])
+        self._segment = open(os.path.join(self.path, self._segment_name), 'ab')
+
+    def _commit(self):
+        # the record is flushed to the segment before its index row is visible
+        if self._segment is not None:
+            self._segment.flush()
+        self._db.commit()
+
+    def _read(self, filename, offset, length):
+        """
+        Read a response record.
+        :rtype: tuple of (status, reason, headers, body)
+        """
+        with open(os.path.join(self.path, filename), 'rb') as f:
+            f.seek(offset)
+            record = gzip.decompress(f.read(length))
+        # skip the WARC headers, then split the http headers from the body
+        block = record.split(b'\r\n\r\n', 1)[1]
+        http_head, body = block.split(b'\r\n\r\n', 1)
+        lines = http_head.decode('utf8').split('\r\n')
+        status_line = lines[0].split(' ', 2)
+        headers = CaseInsensitiveDict()
+        for line in lines[1:]:
+            name, value = line.split(':', 1)
+            headers[name.strip()] = value.strip()
+        return int(status_line[1]), status_line[2] if len(status_line) > 2 else '', headers, body[:int(headers['Content-Length'])]
+
+    def _warc_date(self, timestamp):
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+class ArchiveFetcher:
+    """
+    Fetcher answering from a ResponseArchive instead of the network, used to extract the archived pages again.
+    Urls missing from the archive get a 404 response.
+    """
+
+    def __init__(self, archive):
+        self._archive = archive
+        # same attributes as Fetcher, the archived pages are not archived again
+        self.archive = None
+        self.headers = {}
+        self.scheduler = None
+
+    def get(self, url, **kwargs):
+        resp = self._archive.get(url)
+        if resp is None:
+            resp = Response()
+            resp.url = url
+            resp.status_code = 404
+            resp.reason = 'Not Archived'
+            resp._content = b''
+        return resp
+
+    def close(self):
+        pass
@@ -0,0 +1,182 @@
+import os
+import re
+import mmap
+import heapq
+import struct
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class SeenIndex:
+    """
+    Local index of the url hashes already stored in the Noox database, so known articles are skipped without asking the database.
+    The file holds a header (magic, id of the last news read) followed by the sorted 16 bytes md5 digests,
+    it is memory mapped and looked up with a binary search. Hashes added since the file was written are kept in memory until save().
+    Several crawlers (processes or threads) may share the file, refresh() and save() hold a lock on "<path>.lock".
+    """
+
+    _magic = b'NOOXSEEN'
+    _header = struct.Struct('<8sQ')
+    _digest_size = 16
+
+    def __init__(self, path):
+        if not isinstance(path, str):
+            raise TypeError('path parameter is expected to be str')
+        self.path = path
+        # id of the last news row read from the database
+        self.last_id = 0
+        self._added = set()
+        self._file = None
+        self._mm = None
+        self._count = 0
+        self._open()
+
+    def __contains__(self, url):
+        return self.contains_hash(self._get_md5(url))
+
+    def __len__(self):
+        return self._count + len(self._added)
+
+    def contains_hash(self, url_hash):
+        """
+        Check whether a url hash is in the index.
+        :param url_hash str: hex md5 of the url without protocol
+        :rtype: bool
+        """
+        digest = bytes.fromhex(url_hash)
+        if digest in self._added:
+            return True
+        return self._contains_digest(digest)
+
+    def _contains_digest(self, digest):
+        """
+        Binary search of a digest in the file.
+        :param digest bytes: md5 digest
+        :rtype: bool
+        """
+        lo = 0
+        hi = self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self._digest(mid)
+            if value < digest:
+                lo = mid + 1
+            elif value > digest:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def add(self, url):
+        self.add_hash(self._get_md5(url))
+
+    def add_hash(self, url_hash):
+        if not self.contains_hash(url_hash):
+            self._added.add(bytes.fromhex(url_hash))
+
+    def refresh(self, cursor, fetch_size=10000):
+        """
+        Add the url hashes of the news inserted since the last refresh, then save the index.
+        :param cursor Cursor: database cursor of the Noox database
+        :param fetch_size int: rows fetched at a time
+        :rtype: int, number of rows read
+        """
+        with self._lock():
+            # start from the rows another crawler already added to the file
+            self._reopen()
+            cursor.execute('SELECT `id`, `url_hash` FROM `news` WHERE `id` > %s ORDER BY `id`', (self.last_id,))
+            read = 0
+            rows = cursor.fetchmany(fetch_size)
+            while rows:
+                for id, url_hash in rows:
+                    self.add_hash(url_hash)
+                    self.last_id = id
+                read += len(rows)
+                rows = cursor.fetchmany(fetch_size)
+            if read > 0:
+                self._save()
+        return read
+
+    def save(self):
+        """
+        Merge the added hashes into the sorted file (written to a temporary file and renamed).
+        """
+        with self._lock():
+            self._reopen()
+            self._save()
+
+    def _save(self):
+        # a temporary file of its own, the other crawlers may be saving the index too
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._header.pack(self._magic, self.last_id))
+                for digest in heapq.merge((self._digest(i) for i in range(self._count)), sorted(self._added)):
+                    f.write(digest)
+            self.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._added = set()
+        self._open()
+
+    def _reopen(self):
+        """
+        Map the file again, it may have been replaced by another crawler. The added hashes are kept.
+        """
+        last_id = self.last_id
+        self.close()
+        self._open()
+        self.last_id = max(last_id, self.last_id)
+        # the hashes added by another crawler are now in the file
+        self._added = set(digest for digest in self._added if not self._contains_digest(digest))
+
+    @contextmanager
+    def _lock(self):
+        """
+        Hold the lock file of the index, without locking on platforms lacking fcntl.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._count = 0
+
+    def _open(self):
+        if not os.path.isfile(self.path):
+            return
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.last_id = self._header.unpack_from(self._mm)
+        if magic != self._magic:
+            self.close()
+            raise ValueError('{0} is not a seen url index'.format(self.path))
+        self._count = (len(self._mm) - self._header.size) // self._digest_size
+
+    def _digest(self, i):
+        start = self._header.size + i * self._digest_size
+        return self._mm[start:start + self._digest_size]
+
+    def _get_md5(self, url):
+        return hashlib.md5(re.sub(r'https?://', '', url).encode('utf8')).hexdigest()
@@ -0,0 +1,117 @@
+import gzip
+import io
+import re
+from lxml import etree
+
+
+class _PrefixedStream(io.RawIOBase):
+    """
+    Readable stream that serves already consumed bytes before the rest of the underlying stream.
+    """
+
+    def __init__(self, prefix, stream):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._prefix + self._stream.read()
+            self._prefix = b''
+            return data
+        if self._prefix:
+            data = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return data
+        return self._stream.read(size)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class SitemapReader:
+    """
+    Incrementally read a sitemap or a sitemap index from a byte stream.
+    Gzipped sitemaps (.xml.gz) are decompressed on the fly. The document is never fully loaded in memory,
+    every <url>/<sitemap> element is discarded as soon as its <loc> and <lastmod> are yielded.
+    """
+
+    _sniff_size = 2048
+    _root_regex = re.compile(rb'<(?:[\w\-]+:)?(urlset|sitemapindex)[\s>]')
+
+    def __init__(self, stream):
+        stream, head = self._open(stream)
+        self._stream = stream
+        match = self._root_regex.search(head)
+        # 'sitemapindex', 'urlset' or None when the document is not a sitemap
+        self.kind = match.group(1).decode() if match else None
+
+    def is_sitemap(self):
+        return self.kind == 'urlset'
+
+    def is_sitemap_index(self):
+        return self.kind == 'sitemapindex'
+
+    def read(self):
+        """
+        Read the rest of the stream as it is, used when the document is not a sitemap.
+        :rtype: bytes
+        """
+        return self._stream.read()
+
+    def __iter__(self):
+        """
+        Yield (loc, lastmod) of each entry, lastmod is None when the entry has none.
+        """
+        if self.kind is None:
+            return
+        # recover from malformed entries (e.g. a bare & in a <loc>), like the BeautifulSoup parser did
+        context = etree.iterparse(self._stream, events=('end',), resolve_entities=False, no_network=True, huge_tree=True, recover=True)
+        loc = None
+        lastmod = None
+        for event, el in context:
+            if not isinstance(el.tag, str):
+                continue
+            name = etree.QName(el).localname
+            if name == 'loc':
+                loc = (el.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = (el.text or '').strip() or None
+            elif name in ('url', 'sitemap'):
+                if loc:
+                    yield loc, lastmod
+                loc = None
+                lastmod = None
+                # free the finished entry and its already processed siblings
+                el.clear()
+                while el.getprevious() is not None:
+                    del el.getparent()[0]
+
+    def _open(self, stream):
+        """
+        Sniff the beginning of the stream, transparently decompressing gzip content.
+        :param stream file: byte stream
+        :rtype: tuple of (stream, head bytes)
+        """
+        head = stream.read(self._sniff_size)
+        stream = _PrefixedStream(head, stream)
+        if head[:2] == b'\x1f\x8b':
+            stream = gzip.GzipFile(fileobj=stream)
+            head = stream.read(self._sniff_size)
+            stream = _PrefixedStream(head, stream)
+        return stream, head
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Create a reader over a streamed requests response (requested with stream=True).
+        :param response Response: streamed response
+        :rtype: SitemapReader
+        """
+        # let urllib3 undo the Content-Encoding, .xml.gz files themselves are handled by _open
+        response.raw.decode_content = True
+        return cls(response.raw)
@@ -0,0 +1,85 @@
+import re
+
+# whitespace removed from every cleaned content, on top of the "replace" keys of the rule
+spc_chars = {"\n": "", "\t": "", "\r": "", "\r\n": ""}
+
+# remove script, style and comment
+base_clean_regex = r'(?:<script[\s\S]*?<\/script>)|(?:<style[\s\S]*?<\/style>)|(?:<!--[\s\S]*?-->)'
+
+# any tag, from "<" to the first ">"
+tag_regex = r'<[^>]*>'
+
+# a line break of the cleaned content, 3 or more in a row are collapsed to 2
+br_split_regex = re.compile(r'(<br\/?>)')
+
+
+class TextCleaner:
+    """
+    Cleaning of the raw html of a format rule, compiled once per site and applied in a single pass.
+    Script, style, comments and the "regex_remove" matches are dropped, the "replace" keys are replaced and every
+    other tag is stripped, then runs of 3 or more line breaks are collapsed to 2. All of it is one alternation
+    scanned left to right: every alternative starts with a known character ("<", "(", "\\n"...) so the regex engine
+    skips the plain text instead of trying every rule at every position.
+    The "regex_remove" patterns are the site's own regexes, they are kept as they are and take precedence over the
+    other rules, as they did in the separate remove pass.
+    """
+
+    def __init__(self, remove=(), replace=None):
+        if isinstance(remove, str):
+            raise TypeError('remove parameter is expected to be a list of regexes')
+        remove_regex = base_clean_regex + ''.join('|' + regex for regex in remove)
+        self.replace = dict(replace) if replace is not None else {}
+        self.replace.update(spc_chars)
+
+        # longer keys first, so '\r\n' is not replaced as '\r' then '\n'
+        keys = '|'.join(map(re.escape, sorted(self.replace, key=len, reverse=True)))
+        # no capturing group around the alternatives, it would keep the regex engine from skipping to the next candidate
+        self.regex = re.compile('{0}|{1}|{2}'.format(remove_regex, keys, tag_regex))
+        self._remove = re.compile(remove_regex)
+
+        # every replacement split into line breaks and the text between them, which ends a run of line breaks
+        self._pieces = {}
+        for key, value in self.replace.items():
+            self._pieces[key] = tuple((piece, br_split_regex.fullmatch(piece) is not None) for piece in br_split_regex.split(value) if piece)
+
+    def clean(self, text):
+        """
+        Clean raw html content.
+        :param text str: html content
+        :rtype: str
+        """
+        out = []
+        # line breaks not written yet, the run may still grow
+        breaks = []
+        pos = 0
+        pieces = self._pieces
+        remove = self._remove
+        for match in self.regex.finditer(text):
+            start = match.start()
+            if start > pos:
+                if breaks:
+                    out.append('<br><br>' if len(breaks) >= 3 else ''.join(breaks))
+                    breaks = []
+                out.append(text[pos:start])
+            pos = match.end()
+            replacement = pieces.get(match.group())
+            # removed content and stripped tags do not end a run of line breaks, the removal rules come first
+            # (a match equal to a replace key is still removed when a removal rule matches there)
+            if replacement is None or remove.match(text, start) is not None:
+                continue
+            for piece, is_break in replacement:
+                if is_break:
+                    breaks.append(piece)
+                else:
+                    if breaks:
+                        out.append('<br><br>' if len(breaks) >= 3 else ''.join(breaks))
+                        breaks = []
+                    out.append(piece)
+        if pos < len(text):
+            if breaks:
+                out.append('<br><br>' if len(breaks) >= 3 else ''.join(breaks))
+                breaks = []
+            out.append(text[pos:])
+        if breaks:
+            out.append('<br><br>' if len(breaks) >= 3 else ''.join(breaks))
+        return ''.join(out)
@@ -0,0 +1,138 @@
+import re
+import hashlib
+import pymysql
+from modules.metrics import get_metrics
+
+
+class UrlDedup:
+    """
+    Skip the urls already stored in the Noox database before their articles are fetched.
+    Urls are checked in large batches over a single connection that is kept open (and reconnected when dropped) for the whole crawl.
+    """
+
+    def __init__(self, config, batch_size=1000, debug=False, index=None):
+        if not isinstance(config, dict):
+            raise TypeError('config parameter is expected to be dict instance')
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError('batch_size is expected to be a positive int')
+
+        self.config = config
+        self.batch_size = batch_size
+        self._is_debug = debug
+        # local SeenIndex of the stored url hashes, urls found in it are skipped without a query
+        self._index = index
+        self._db = None
+        # the database is not reachable, every url passes
+        self._disabled = False
+        # number of urls checked and skipped so far
+        self.checked = 0
+        self.skipped = 0
+
+    def filter(self, urls):
+        """
+        Yield the urls that are not in the database yet, urls are checked a batch at a time.
+        :param urls iterable: urls to check
+        :rtype: generator of str
+        """
+        batch = []
+        for url in urls:
+            batch.append(url)
+            if len(batch) >= self.batch_size:
+                yield from self.check(batch)
+                batch = []
+        if batch:
+            yield from self.check(batch)
+
+    def check(self, urls):
+        """
+        Return the urls of a batch that are not in the database yet.
+        :param urls list: urls to check
+        :rtype: list
+        """
+        metrics = get_metrics()
+        self.checked += len(urls)
+        metrics.inc('noox_dedup_checked_total', len(urls))
+        hashes = [self._get_md5(url) for url in urls]
+        if self._index is not None:
+            unknown = [url_hash for url_hash in hashes if not self._index.contains_hash(url_hash)]
+            existing = set(hashes).difference(unknown)
+            metrics.inc('noox_dedup_skipped_total', len(existing), source='index')
+            if unknown:
+                # only the news stored since the index refresh need a query
+                stored = self._get_existing(unknown)
+                metrics.inc('noox_dedup_skipped_total', len(stored), source='db')
+                existing.update(stored)
+        else:
+            existing = self._get_existing(hashes)
+            metrics.inc('noox_dedup_skipped_total', len(existing), source='db')
+        ret = [url for url, url_hash in zip(urls, hashes) if url_hash not in existing]
+        self.skipped += len(urls) - len(ret)
+        return ret
+
+    def refresh_index(self):
+        """
+        Add the news stored since the last run to the seen url index.
+        :rtype: int, number of news added
+        """
+        if self._index is None:
+            return 0
+        db = self._connect()
+        if db is None:
+            return 0
+        return self._index.refresh(db.cursor())
+
+    def reset(self):
+        """
+        Start a new run: clear the counters and try the database again if it was not reachable.
+        """
+        self.checked = 0
+        self.skipped = 0
+        self._disabled = False
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _get_existing(self, hashes):
+        """
+        Query which url hashes are already stored.
+        :param hashes list: url hashes
+        :rtype: set
+        """
+        db = self._connect()
+        if db is None:
+            return set()
+        cursor = db.cursor()
+        cursor.execute('SELECT `url_hash` FROM `news` WHERE `url_hash` IN ({0})'.format(', '.join(['%s'] * len(hashes))), hashes)
+        return set(row[0] for row in cursor.fetchall())
+
+    def _connect(self):
+        """
+        Return the open connection, connecting on the first use and reconnecting when it has been dropped.
+        :rtype: Connection or None when the database is not reachable
+        """
+        if self._disabled:
+            return None
+        try:
+            if self._db is None:
+                self._db = pymysql.connect(
+                    host=self.config['db_url'],
+                    user=self.config['db_username'],
+                    password=self.config['db_password'],
+                    database=self.config['db_name'],
+                    charset='utf8')
+            else:
+                self._db.ping(reconnect=True)
+        except pymysql.MySQLError as e:
+            if self._is_debug:
+                raise
+            # warn once instead of silently fetching every url again
+            print('[WARNING] url dedup is disabled, unable to connect to the database cause: {0}'.format(str(e)))
+            self._disabled = True
+            self._db = None
+            return None
+        return self._db
+
+    def _get_md5(self, url):
+        return hashlib.md5(re.sub(r'https?://', '', url).encode('utf8')).hexdigest()
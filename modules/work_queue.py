@@ -0,0 +1,200 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+# a leased url, acknowledge it with its id once it is processed
+Task = namedtuple('Task', ['id', 'site', 'url', 'lastmod'])
+
+
+class BaseWorkQueue(ABC):
+    """
+    Queue of discovered urls shared by a coordinator (which pushes them) and any number of workers (which lease them).
+    A leased url is invisible to the other workers until its lease expires, so the url of a crashed worker is processed again.
+    """
+
+    @abstractmethod
+    def push(self, site, urls, lastmods=None):
+        """
+        add urls of a site to the queue, urls already queued are ignored unless they were processed with another
+        lastmod or given up.
+        """
+
+    @abstractmethod
+    def lease(self, count, sites=None):
+        """
+        lease up to count urls (of the given sites) for the visibility timeout.
+        """
+
+    @abstractmethod
+    def ack(self, ids):
+        """
+        mark leased urls as processed.
+        """
+
+    @abstractmethod
+    def release(self, ids):
+        """
+        make leased urls visible again before their lease expires.
+        """
+
+    @abstractmethod
+    def purge(self, max_age):
+        """
+        remove the urls processed or given up more than max_age seconds ago.
+        """
+
+    @abstractmethod
+    def close(self):
+        """close the queue."""
+
+
+class SqliteWorkQueue(BaseWorkQueue):
+    """
+    Work queue stored in a SQLite file, shared by the processes of a host or by nodes mounting the same file.
+    """
+
+    _schema = (
+        'CREATE TABLE IF NOT EXISTS `work_queue` ('
+        '`id` INTEGER PRIMARY KEY AUTOINCREMENT, '
+        '`site` TEXT NOT NULL, '
+        '`url` TEXT NOT NULL, '
+        '`lastmod` TEXT, '
+        '`done` INTEGER NOT NULL DEFAULT 0, '
+        '`lease_until` REAL NOT NULL DEFAULT 0, '
+        '`attempts` INTEGER NOT NULL DEFAULT 0, '
+        '`done_at` REAL, '
+        'UNIQUE (`site`, `url`))'
+    )
+
+    # a url processed with another lastmod, or given up (e.g. during an outage), is queued again with new attempts.
+    # The lease of a url given up while a worker still holds it is kept
+    _push_sql = (
+        'INSERT INTO `work_queue` (`site`, `url`, `lastmod`) VALUES (?, ?, ?) '
+        'ON CONFLICT (`site`, `url`) DO UPDATE SET `lastmod` = excluded.`lastmod`, `attempts` = 0, '
+        '`lease_until` = CASE WHEN `done` = 1 THEN 0 ELSE `lease_until` END, `done` = 0, `done_at` = NULL '
+        'WHERE (`done` = 1 AND `lastmod` IS NOT excluded.`lastmod`) OR (`done` = 0 AND `attempts` >= ?)'
+    )
+
+    def __init__(self, path, visibility_timeout=300, max_attempts=3):
+        if not isinstance(path, str):
+            raise TypeError('path parameter is expected to be str')
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        # a url leased this many times without being acknowledged is given up
+        self.max_attempts = max_attempts
+        # autocommit, transactions are started explicitly
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        with self._transaction():
+            self._db.execute(self._schema)
+            # queue files created before done_at
+            if 'done_at' not in [row[1] for row in self._db.execute('PRAGMA table_info(`work_queue`)')]:
+                self._db.execute('ALTER TABLE `work_queue` ADD COLUMN `done_at` REAL')
+        self._db.execute('CREATE INDEX IF NOT EXISTS `work_queue_pending` ON `work_queue` (`done`, `lease_until`)')
+
+    def push(self, site, urls, lastmods=None):
+        """
+        Add urls of a site to the queue. Urls already queued are ignored, unless they were processed with another
+        sitemap <lastmod> (the article changed) or given up after max_attempts: they are queued again.
+        :param site str: site name of the urls
+        :param urls list: urls to add
+        :param lastmods dict: sitemap <lastmod> of the urls
+        :rtype: int, number of urls added or queued again
+        """
+        if lastmods is None:
+            lastmods = {}
+        before = self._db.total_changes
+        with self._transaction():
+            self._db.executemany(self._push_sql, [(site, url, lastmods.get(url), self.max_attempts) for url in urls])
+        return self._db.total_changes - before
+
+    def lease(self, count, sites=None):
+        """
+        Lease up to count urls for the visibility timeout.
+        :param count int: max urls to lease
+        :param sites list: only lease urls of these sites, default is any site
+        :rtype: list of Task
+        """
+        now = time.time()
+        sql = 'SELECT `id`, `site`, `url`, `lastmod` FROM `work_queue` WHERE `done` = 0 AND `lease_until` <= ? AND `attempts` < ?'
+        params = [now, self.max_attempts]
+        if sites is not None:
+            sql += ' AND `site` IN ({0})'.format(', '.join(['?'] * len(sites)))
+            params += list(sites)
+        sql += ' ORDER BY `id` LIMIT ?'
+        params.append(count)
+
+        # the write lock is taken before reading, so two workers never lease the same url
+        with self._transaction():
+            tasks = [Task(*row) for row in self._db.execute(sql, params).fetchall()]
+            self._db.executemany(
+                'UPDATE `work_queue` SET `lease_until` = ?, `attempts` = `attempts` + 1 WHERE `id` = ?',
+                [(now + self.visibility_timeout, task.id) for task in tasks])
+        return tasks
+
+    def ack(self, ids):
+        """
+        Mark leased urls as processed.
+        :param ids list: task ids
+        """
+        with self._transaction():
+            now = time.time()
+            self._db.executemany('UPDATE `work_queue` SET `done` = 1, `done_at` = ? WHERE `id` = ?', [(now, id) for id in ids])
+
+    def release(self, ids):
+        """
+        Make leased urls visible again before their lease expires.
+        :param ids list: task ids
+        """
+        with self._transaction():
+            self._db.executemany('UPDATE `work_queue` SET `lease_until` = 0 WHERE `id` = ? AND `done` = 0', [(id,) for id in ids])
+
+    def pending(self, sites=None):
+        """
+        Count the urls not processed yet (leased or not), the given up urls are not counted.
+        :param sites list: only count urls of these sites, default is any site
+        :rtype: int
+        """
+        sql = 'SELECT COUNT(*) FROM `work_queue` WHERE `done` = 0 AND `attempts` < ?'
+        params = [self.max_attempts]
+        if sites is not None:
+            sql += ' AND `site` IN ({0})'.format(', '.join(['?'] * len(sites)))
+            params += list(sites)
+        return self._db.execute(sql, params).fetchone()[0]
+
+    def purge(self, max_age):
+        """
+        Remove the urls processed or given up more than max_age seconds ago, they are queued again by the next push.
+        :param max_age float: seconds
+        :rtype: int, number of urls removed
+        """
+        before = time.time() - max_age
+        before_changes = self._db.total_changes
+        with self._transaction():
+            self._db.execute(
+                'DELETE FROM `work_queue` WHERE (`done` = 1 AND COALESCE(`done_at`, 0) < ?) OR (`done` = 0 AND `attempts` >= ? AND `lease_until` < ?)',
+                (before, self.max_attempts, before))
+        return self._db.total_changes - before_changes
+
+    def close(self):
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Run the block in a transaction holding the write lock of the file.
+        """
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except Exception:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
+
+
+work_queues = {
+    'sqlite': SqliteWorkQueue
+}
@@ -1,38 +1,48 @@
 import os
 import glob
 import json
-import hashlib
-import pymysql
 import argparse
 import re
+import time
+import signal
+import socket
+import threading
 from urllib.parse import urlparse
 from multiprocessing import Pool
 from functools import partial
-from modules import LinkExtractor, NewsGrabber
-from output_providers import NooxSqlProvider, JsonProvider
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from modules import LinkExtractor, NewsGrabber, Fetcher, CrawlState, UrlDedup, SeenIndex, ResponseArchive, ArchiveFetcher, NearDupIndex
+from modules.fetcher import DEFAULT_HEADERS
+from modules.politeness import PolitenessScheduler
+from modules.work_queue import work_queues
+from modules.metrics import get_metrics
+from output_providers import NooxSqlProvider, JsonProvider, ParquetProvider, OutputDispatcher
 
 o_providers = {
     'json': JsonProvider,
+    'jsonl': JsonProvider,
+    'parquet': ParquetProvider,
     'NooxDB': NooxSqlProvider
 }
 
 
-def check_with_db(urls):
+# database of the NooxDB output provider and of the url dedup
+db_config = {'db_url': 'localhost', 'db_username': 'root', 'db_password': '', 'db_name': 'nooxdbapi'}
+
+
+def batched(iterable, size):
     """
-    Callback to check for existing url in db.
-    :param urls list: urls to check
-    :rtype: list
+    Split an iterable into lists of at most size items.
+    :param iterable iterable: items to split
+    :param size int: batch size
+    :rtype: generator of list
     """
-    try:
-        db = pymysql.connect('localhost', 'root', '', 'nooxdbapi')
-    except Exception as e:
-        return []
-    cursor = db.cursor()
-    sql = 'SELECT `url` FROM `news` WHERE `url_hash` IN ({0})'
-    in_p = ', '.join(map(lambda x: "'" + hashlib.md5(re.sub(r'https?://', '', x).encode('utf-8')).hexdigest() + "'", urls))
-    sql = sql.format(in_p)
-    cursor.execute(sql)
-    return [re.sub(r'https?://', '', row[0]) for row in cursor.fetchall()]
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
 
 
 def get_domain_name(url):
@@ -45,6 +55,47 @@ def get_domain_name(url):
     return url_parts[1 if len(url_parts) == 3 else 0]
 
 
+def create_fetcher(args, config):
+    """
+    Create the http fetcher shared by the link extractor, the grabber and the output providers.
+    Requests to every host are rate limited according to the "politeness" key of the site config.
+    The fetched pages are archived when --archive is given.
+    :param args Namespace: parsed arguments
+    :param config dict: site config
+    :rtype: Fetcher
+    """
+    scheduler = PolitenessScheduler.from_config(config, user_agent=DEFAULT_HEADERS['User-Agent'])
+    archive = ResponseArchive(args.archive) if args.archive is not None else None
+    return Fetcher(pool_size=max(args.pool_size, args.concurrency), retries=args.retries, scheduler=scheduler, archive=archive)
+
+
+def create_dispatcher(args, outputs):
+    """
+    Feed the output providers from their own queue and thread, see OutputDispatcher.
+    :param args Namespace: parsed arguments
+    :param outputs list: output providers
+    :rtype: OutputDispatcher
+    """
+    return OutputDispatcher(outputs, queue_size=args.output_queue_size, retries=args.output_retries, debug=args.debug)
+
+
+def start_metrics(args):
+    """
+    Expose the crawl metrics on the prometheus endpoint and/or dump them to a json file periodically.
+    :param args Namespace: parsed arguments
+    :rtype: tuple of (threading.Event stopping the dumps, dump thread or None)
+    """
+    metrics = get_metrics()
+    stop = threading.Event()
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+        print('Serving metrics on port {0}...'.format(args.metrics_port))
+    thread = None
+    if args.metrics_file is not None:
+        thread = metrics.dump_periodically(args.metrics_file, args.metrics_interval, stop)
+    return stop, thread
+
+
 def parse_args():
     """
     Parse supplied arguments.
@@ -52,39 +103,216 @@ def parse_args():
     :rtype: Namespace
     """
     parser = argparse.ArgumentParser(description='Noox crawler driver.')
-    parser.set_defaults(debug=False, verbose=False, limit=500)
-    parser.add_argument('-o', '--output', action='append', type=str, help='output providers (default = json), can be multiple (-o json -o other)')
+    parser.set_defaults(debug=False, verbose=False, limit=500, concurrency=1, host_concurrency=None, pool_size=10, retries=3, state=None, batch_size=50, workers=1, dedup_batch_size=1000, seen_index=None, mode='standalone', queue='queue.db', queue_backend='sqlite', visibility_timeout=300, idle_timeout=60, queue_retention=7 * 24 * 3600, daemon=False, interval=3600, metrics_port=None, metrics_file=None, metrics_interval=30, archive=None, replay=None, since=None, near_dup_index=None, near_dup_distance=3, jsonl_compression=None, output_queue_size=4, output_retries=3)
+    parser.add_argument('-o', '--output', action='append', type=str, help='output providers (default = json, jsonl in worker mode), can be multiple (-o json -o other), jsonl appends to <sitename>.jsonl while the crawl runs, a worker only supports jsonl and NooxDB')
+    parser.add_argument('--output-queue-size', type=int, help='batches queued per output provider, the grabbing waits when a provider falls behind (default = 4)')
+    parser.add_argument('--output-retries', type=int, help='retries of a batch an output provider failed to save, e.g. on a lost database connection (default = 3)')
+    parser.add_argument('--jsonl-compression', choices=['gzip', 'zstd'], help='compress the output of the jsonl provider (zstd requires zstandard)')
     parser.add_argument('-l', '--limit', type=int, help='limit links to be scanned')
+    parser.add_argument('-c', '--concurrency', type=int, help='max concurrent requests when extracting links and grabbing news (default = 1, grabbing requires aiohttp when more than 1)')
+    parser.add_argument('-w', '--workers', type=int, help='extraction worker processes per site, parsing runs alongside downloading when more than 1 (default = 1)')
+    parser.add_argument('--host-concurrency', type=int, help='max concurrent requests per host (default = same as --concurrency)')
+    parser.add_argument('--pool-size', type=int, help='max pooled keep-alive connections per host (default = 10)')
+    parser.add_argument('--retries', type=int, help='retries with backoff on server errors and timeouts (default = 3)')
+    parser.add_argument('--state', type=str, help='crawl state file (sqlite), enables incremental crawling with conditional requests')
+    parser.add_argument('-b', '--batch-size', type=int, help='news passed to the output providers at a time (default = 50)')
+    parser.add_argument('--dedup-batch-size', type=int, help='urls checked against the database at a time (default = 1000)')
+    parser.add_argument('--seen-index', type=str, help='local index file of the urls already in the database, known articles are skipped during url scanning')
+    parser.add_argument('--near-dup-index', type=str, help='fingerprint index file (sqlite) of the saved news, news with a near-duplicate content under another url are not output')
+    parser.add_argument('--near-dup-distance', type=int, help='max differing bits of the content fingerprints of near-duplicates, from 0 to 15 (default = 3)')
+    parser.add_argument('-m', '--mode', choices=['standalone', 'coordinator', 'worker'], help='standalone crawls alone, a coordinator queues the links for any number of workers, whose output files are named <sitename>-<host>-<pid> (default = standalone)')
+    parser.add_argument('--queue', type=str, help='work queue shared by the coordinator and the workers (default = queue.db)')
+    parser.add_argument('--queue-backend', choices=list(work_queues), help='work queue implementation (default = sqlite)')
+    parser.add_argument('--visibility-timeout', type=int, help='seconds a worker may hold links before other workers can lease them again (default = 300)')
+    parser.add_argument('--queue-retention', type=int, help='seconds the coordinator keeps the processed and given up links in the work queue, a link is queued again once removed (default = 604800)')
+    parser.add_argument('--idle-timeout', type=int, help='seconds a worker waits for new links before exiting (default = 60)')
+    parser.add_argument('--daemon', action='store_true', help='keep running and crawl every site again after its interval, stop with SIGTERM (a worker keeps waiting for links)')
+    parser.add_argument('--interval', type=int, help='seconds between the crawls of a site in daemon mode when its config has no "crawl_interval" (default = 3600)')
+    parser.add_argument('--archive', type=str, help='archive the fetched pages (WARC) in this directory, see --replay')
+    parser.add_argument('--replay', type=str, help='extract the news again from the pages archived in this directory instead of fetching them')
+    parser.add_argument('--since', type=str, help='only replay the pages archived since this date (YYYY-MM-DD)')
+    parser.add_argument('--metrics-port', type=int, help='serve the crawl metrics (prometheus text format) on this port')
+    parser.add_argument('--metrics-file', type=str, help='dump the crawl metrics to this json file periodically and when the crawl ends')
+    parser.add_argument('--metrics-interval', type=int, help='seconds between the dumps of --metrics-file (default = 30)')
     parser.add_argument('--debug', action='store_true', help='exit immediately when error occured')
     parser.add_argument('-v', '--verbose', action='store_true', help='message verbosity')
     parser.add_argument('target', help='site to be scanned (enter "all" to scan all sites)')
     return parser.parse_args()
 
 
-def process_output_providers(destinations, config):
+def process_output_providers(destinations, config, fetcher=None, jsonl_compression=None, file_suffix=''):
     """
     Initialize all output providers.
     :param destinations list: user provided destination key
     :param config dict: loaded config file
+    :param fetcher Fetcher: shared http fetcher
+    :param jsonl_compression str: compression of the jsonl output (gzip or zstd)
+    :param file_suffix str: appended to the site name of the output files, e.g. to tell the queue workers apart
     :rtype: list
     """
     o_destinations = []
+    filename = config['sitename'] + file_suffix
     if destinations is None:
-        o_destinations.append(o_providers['json'](config['sitename']+'.json', True))
+        initialized = o_providers['json'](filename+'.json', True)
+        initialized.name = 'json'
+        o_destinations.append(initialized)
     else:
         for dest in destinations:
             if dest not in o_providers:
                 raise ImportError('Provider for {0} not found.'.format(dest))
 
             if dest == 'json':
-                initialized = o_providers[dest](config['sitename']+'.json', True)
+                initialized = o_providers[dest](filename+'.json', True)
+            elif dest == 'jsonl':
+                # news are appended as they are saved, the file can be read while the crawl runs
+                extension = {None: '', 'gzip': '.gz', 'zstd': '.zst'}[jsonl_compression]
+                initialized = o_providers[dest](filename+'.jsonl'+extension, lines=True, compression=jsonl_compression)
+            elif dest == 'parquet':
+                initialized = o_providers[dest](filename+'.parquet', site=config['sitename'], noox_config=config.get('noox_config'))
             elif dest == 'NooxDB':
-                initialized = o_providers[dest]({'db_url': 'localhost', 'db_username': 'root', 'db_password': '', 'db_name': 'nooxdbapi'}, config['noox_config'])
+                initialized = o_providers[dest](dict(db_config), config['noox_config'], fetcher=fetcher)
 
+            initialized.name = dest
             o_destinations.append(initialized)
     return o_destinations
 
 
+class SiteCrawler:
+    """
+    Crawler of a single site. The fetcher, the grabber (with the compiled config), the database connections and
+    the output providers are created once and kept between runs, so the daemon only pays their setup once.
+    """
+
+    def __init__(self, config: dict, args, stop=None, parse_in_worker=False):
+        self.config = config
+        self.args = args
+        # set to stop the run after the current batch
+        self._stop = stop if stop is not None else threading.Event()
+        self.__verboseprint = print if args.verbose or args.debug else lambda *a, **k: None
+
+        self.fetcher = create_fetcher(args, config)
+        self.state = CrawlState(args.state) if args.state is not None else None
+        self.seen = SeenIndex(args.seen_index) if args.seen_index is not None else None
+        # skip the urls already in the database before fetching them
+        self.dedup = UrlDedup(db_config, batch_size=args.dedup_batch_size, debug=args.debug, index=self.seen)
+        # and the news already saved under another url after extracting them
+        self.near_dups = create_near_dup_index(args)
+        if args.mode == 'coordinator':
+            # the workers grab the news, only push the new links to the work queue
+            self.queue = create_work_queue(args)
+        else:
+            self.grabber = NewsGrabber(config, debug=args.debug, verbose=args.verbose, concurrency=args.concurrency, host_concurrency=args.host_concurrency, fetcher=self.fetcher, state=self.state, workers=args.workers, parse_in_worker=parse_in_worker, defer_state=True)
+            self.outputs = process_output_providers(args.output, config, self.fetcher, args.jsonl_compression)
+            for output in self.outputs:
+                self.__verboseprint('Using output provider: {0}'.format(output.__class__.__name__))
+
+    def run(self):
+        """
+        Crawl the site once.
+        :rtype: int, number of news saved (links queued in coordinator mode)
+        """
+        args = self.args
+        verboseprint = self.__verboseprint
+        verboseprint('Scanning site: {0}'.format(self.config['sitename'].title()))
+
+        self.dedup.reset()
+        if self.seen is not None:
+            verboseprint('Added {0} stored news to the seen url index...'.format(self.dedup.refresh_index()))
+
+        verboseprint('Starting url scanning...')
+        a = LinkExtractor(self.config, debug=args.debug, verbose=args.verbose, concurrency=args.concurrency, fetcher=self.fetcher, state=self.state, seen=self.seen)
+        # links are grabbed as soon as they are found and the news are output a batch at a time,
+        # so a crawl never holds more than a batch of news in memory
+        found = a.iter_urls(max_link=args.limit)
+        links = islice(found, args.limit) if args.limit > 0 else found
+
+        count = 0
+        # the sitemaps are saved to the crawl state once all their links are grabbed (or queued), a crawl stopped
+        # early reads them again on the next run
+        complete = True
+        if args.mode == 'coordinator':
+            verboseprint('Queueing links...')
+            for batch in batched(self.dedup.filter(links), args.batch_size):
+                count += self.queue.push(self.config['sitename'], batch, a.lastmods)
+                if self._stop.is_set():
+                    complete = False
+                    break
+            found.close()
+            verboseprint('Queued '+str(count)+' new links...')
+            verboseprint('Removed {0} old links from the work queue...'.format(self.queue.purge(args.queue_retention)))
+        else:
+            self.grabber.url_count = 0
+            self.grabber.fetch_errors = 0
+            self.grabber.failed_urls = []
+            news = self.grabber.iter_process(self.dedup.filter(links), lastmods=a.lastmods)
+            if self.near_dups is not None:
+                duplicates = self.near_dups.duplicates
+                news = self.near_dups.filter(news, self.config['sitename'], on_duplicate=self._commit_duplicate)
+
+            verboseprint('Grabbing news data...')
+            # every provider saves the batches in its own thread, a full queue holds the grabbing back
+            dispatcher = create_dispatcher(args, self.outputs)
+            try:
+                for batch in batched(news, args.batch_size):
+                    # the crawl state of the news is saved once every provider saved them, a dropped news is grabbed again
+                    dispatcher.save_batch(batch, on_saved=partial(self._commit_saved, [item['url'] for item in batch]))
+                    count += len(batch)
+                    verboseprint('Passed {0} news to the output providers...'.format(count))
+                    if self._stop.is_set():
+                        verboseprint('Stopping the crawl...')
+                        complete = False
+                        break
+                news.close()
+                found.close()
+                # wait for the queued batches, the providers are closed by their thread
+                errors = dispatcher.close()
+            finally:
+                # a failed crawl stops the provider threads and removes the incomplete output files, so the next run
+                # starts them again
+                dispatcher.abort()
+                self.grabber.discard_state()
+                if self.near_dups is not None:
+                    self.near_dups.discard()
+            # the news that could not be retrieved or saved are retried with their sitemap
+            complete = complete and self.grabber.fetch_errors == 0 and not errors
+            if self.near_dups is not None:
+                verboseprint('Skipped '+str(self.near_dups.duplicates - duplicates)+' near-duplicate news...')
+            verboseprint('Scanned '+str(count)+' out of '+str(self.grabber.url_count)+' links...')
+            if count < 1:
+                print('No data to output...')
+
+        if complete:
+            a.commit_edges()
+        if self.seen is not None:
+            verboseprint('Skipped '+str(a.seen_skipped)+' links found in the seen url index...')
+        verboseprint('Skipped '+str(self.dedup.skipped)+' out of '+str(self.dedup.checked)+' links already in the database...')
+        return count
+
+    def _commit_saved(self, urls):
+        # the fingerprints of the saved news suppress their later near-duplicates
+        if self.near_dups is not None:
+            self.near_dups.add(urls)
+        self.grabber.commit_state(urls)
+
+    def _commit_duplicate(self, item):
+        # a near-duplicate is never saved, its state is saved right away so it is not grabbed again
+        self.grabber.commit_state([item['url']])
+
+    def close(self):
+        if self.args.mode == 'coordinator':
+            self.queue.close()
+        else:
+            self.grabber.close()
+        self.dedup.close()
+        if self.seen is not None:
+            self.seen.close()
+        if self.near_dups is not None:
+            self.near_dups.close()
+        self.fetcher.close()
+        if self.state is not None:
+            self.state.close()
+
+
 def crawler(config: dict, args):
     """
     Crawl the sites based on supplied config
@@ -92,32 +320,246 @@ def crawler(config: dict, args):
     :param args Namespace: parsed arguments
     :rtype: None
     """
+    site = SiteCrawler(config, args)
+    try:
+        site.run()
+    finally:
+        site.close()
+    return
+
+
+def daemon(configs, args):
+    """
+    Keep crawling the sites, every site is crawled again after its interval ("crawl_interval" config key, in seconds).
+    Stops gracefully on SIGTERM or SIGINT: running crawls finish their current batch.
+    :param configs dict: configuration of the sites to crawl {sitename: config}
+    :param args Namespace: parsed arguments
+    :rtype: None
+    """
+    stop = stop_on_signal()
+    # the sites share this process, each one parses its pages in worker processes of its own
+    parse_in_worker = len(configs) > 1
+    sites = dict((sitename, SiteCrawler(config, args, stop, parse_in_worker)) for sitename, config in configs.items())
+    next_run = dict((sitename, 0) for sitename in sites)
+    running = {}
+    # sites are crawled in parallel, every site has its own thread
+    with ThreadPoolExecutor(max_workers=len(sites)) as executor:
+        while not stop.is_set():
+            now = time.monotonic()
+            for sitename, site in sites.items():
+                if sitename not in running and next_run[sitename] <= now:
+                    running[sitename] = executor.submit(site.run)
+                    next_run[sitename] = now + configs[sitename].get('crawl_interval', args.interval)
+            for sitename in [sitename for sitename, future in running.items() if future.done()]:
+                error = running.pop(sitename).exception()
+                if error is not None:
+                    if args.debug:
+                        stop.set()
+                        raise error
+                    print('[ERROR] crawl of "{0}" failed cause: {1}'.format(sitename, str(error)))
+            stop.wait(1)
+    for site in sites.values():
+        site.close()
+
+
+def stop_on_signal():
+    """
+    Return an event set by SIGTERM or SIGINT.
+    :rtype: threading.Event
+    """
+    stop = threading.Event()
+
+    def handler(signum, frame):
+        print('Stopping, waiting for the running crawls...')
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    return stop
+
+
+def worker(configs, args):
+    """
+    Grab the news of the links queued by the coordinators until the work queue stays empty for the idle timeout
+    (in daemon mode, until SIGTERM or SIGINT).
+    :param configs dict: configuration of the sites to work on {sitename: config}
+    :param args Namespace: parsed arguments
+    :rtype: None
+    """
     verboseprint = print if args.verbose or args.debug else lambda *a, **k: None
 
-    verboseprint('Scanning site: {0}'.format(config['sitename'].title()))
+    stop = stop_on_signal()
+    state = CrawlState(args.state) if args.state is not None else None
+    near_dups = create_near_dup_index(args)
+    queue = create_work_queue(args)
 
-    verboseprint('Starting url scanning...')
-    a = LinkExtractor(config, debug=args.debug, verbose=args.verbose)
-    links = a.get_urls(max_link=args.limit)
-    verboseprint('Found '+str(len(links))+' links...')
-    verboseprint('Link extract finished...')
+    def commit_saved(grabber, urls):
+        # the fingerprints of the saved news suppress their later near-duplicates
+        if near_dups is not None:
+            near_dups.add(urls)
+        grabber.commit_state(urls)
 
-    verboseprint('Grabbing news data...')
-    grabber = NewsGrabber(config, debug=args.debug, verbose=args.verbose)
-    if args.limit > 0:
-        news = grabber.process(links[:args.limit], url_check_callback=check_with_db)
-    else:
-        news = grabber.process(links, url_check_callback=check_with_db)
-    verboseprint('Scanned '+str(len(news))+' out of '+str(len(links))+' links...')
+    # every site has its own fetcher, rate limited by the site config
+    fetchers = {}
+    grabbers = {}
+    dispatchers = {}
+    # several workers may run on the same host, each one writes its own output files
+    file_suffix = '-{0}-{1}'.format(socket.gethostname(), os.getpid())
+    count = 0
+    idle_since = time.time()
+    # site whose batch failed, its dispatcher drops the queued news instead of saving them
+    failed_site = None
+    try:
+        while not stop.is_set():
+            tasks = queue.lease(args.batch_size, sites=list(configs))
+            if not tasks:
+                if not args.daemon and time.time() - idle_since >= args.idle_timeout:
+                    break
+                stop.wait(1)
+                continue
 
-    if len(news) > 0:
-        for output in process_output_providers(args.output, config):
-            verboseprint('Using output provider: {0}'.format(output.__class__.__name__))
-            output.save(news)
-    else:
-        print('No data to output...')
+            for sitename in sorted(set(task.site for task in tasks)):
+                site_tasks = [task for task in tasks if task.site == sitename]
+                try:
+                    if sitename not in grabbers:
+                        fetchers[sitename] = create_fetcher(args, configs[sitename])
+                        grabbers[sitename] = NewsGrabber(configs[sitename], debug=args.debug, verbose=args.verbose, concurrency=args.concurrency, host_concurrency=args.host_concurrency, fetcher=fetchers[sitename], state=state, workers=args.workers, defer_state=True)
+                        outputs = process_output_providers(args.output if args.output is not None else ['jsonl'], configs[sitename], fetchers[sitename], args.jsonl_compression, file_suffix)
+                        # the links are acked once their news are persisted, a file only persisted when the worker exits (json,
+                        # parquet) would lose the news of the acked links when the worker crashes
+                        unsupported = [output.name for output in outputs if not output.durable]
+                        if unsupported:
+                            for output in outputs:
+                                output.abort()
+                            raise ValueError('{0} output is not supported in worker mode, use jsonl or NooxDB'.format(', '.join(unsupported)))
+                        dispatchers[sitename] = create_dispatcher(args, outputs)
+                    lastmods = dict((task.url, task.lastmod) for task in site_tasks if task.lastmod is not None)
+                    grabbers[sitename].failed_urls = []
+                    news = grabbers[sitename].iter_process([task.url for task in site_tasks], lastmods=lastmods)
+                    if near_dups is not None:
+                        news = near_dups.filter(news, sitename, on_duplicate=lambda item: grabbers[sitename].commit_state([item['url']]))
+                    news = list(news)
+                    if len(news) > 0:
+                        dispatchers[sitename].save_batch(news, on_saved=partial(commit_saved, grabbers[sitename], [item['url'] for item in news]))
+                        # the links are acked once the providers saved or dropped their news
+                        errors = dispatchers[sitename].join()
+                        grabbers[sitename].discard_state()
+                        if near_dups is not None:
+                            near_dups.discard()
+                        if errors:
+                            print('[ERROR] {0} out of {1} output providers failed to save {2} news of "{3}"'.format(len(errors), len(dispatchers[sitename].outputs), len(news), sitename))
+                            if args.debug:
+                                raise errors[0]
+                            if len(errors) >= len(dispatchers[sitename].outputs):
+                                # no provider saved the news, let another worker retry the links
+                                queue.release([task.id for task in site_tasks])
+                                continue
+                            # retrying the links would save the news again to the providers that did save them
+                except Exception:
+                    # let another worker retry the links of this site and of the sites not processed yet right away
+                    failed_site = sitename
+                    queue.release([task.id for task in tasks if task.site >= sitename])
+                    raise
+                # the links that could not be retrieved (e.g. timeout) are leased again, until the queue gives them up
+                failed = set(grabbers[sitename].failed_urls)
+                queue.release([task.id for task in site_tasks if task.url in failed])
+                # the others are processed even when some of them have no news (e.g. missing required element)
+                queue.ack([task.id for task in site_tasks if task.url not in failed])
+                count += len(news)
+                verboseprint('Saved {0} news...'.format(count))
+            idle_since = time.time()
+    finally:
+        try:
+            if failed_site in dispatchers:
+                dispatchers[failed_site].abort()
+            for sitename, dispatcher in dispatchers.items():
+                if sitename != failed_site:
+                    dispatcher.close()
+        finally:
+            # stop the providers left open when closing one of them raised (--debug)
+            for dispatcher in dispatchers.values():
+                dispatcher.abort()
+            for grabber in grabbers.values():
+                grabber.close()
+            queue.close()
+            for fetcher in fetchers.values():
+                fetcher.close()
+            if state is not None:
+                state.close()
+            if near_dups is not None:
+                near_dups.close()
+    verboseprint('Worker finished, saved {0} news...'.format(count))
 
-    return
+
+def replay(configs, args):
+    """
+    Extract the news of the archived pages (see --archive) without fetching them, e.g. after a change of the
+    "to_extract" rules. The crawl state and the url dedup are not used, every archived page is extracted again.
+    :param configs dict: configuration of the sites to extract {sitename: config}
+    :param args Namespace: parsed arguments
+    :rtype: None
+    """
+    verboseprint = print if args.verbose or args.debug else lambda *a, **k: None
+    since = time.mktime(time.strptime(args.since, '%Y-%m-%d')) if args.since is not None else None
+    archive = ResponseArchive(args.replay)
+    fetcher = ArchiveFetcher(archive)
+    urls = archive.urls(since=since)
+    verboseprint('Replaying {0} archived pages...'.format(len(urls)))
+    for sitename, config in sorted(configs.items()):
+        grabber = NewsGrabber(config, debug=args.debug, verbose=args.verbose, fetcher=fetcher, workers=args.workers)
+        # the output providers still download the news images
+        output_fetcher = create_fetcher(args, config)
+        dispatcher = create_dispatcher(args, process_output_providers(args.output, config, output_fetcher, args.jsonl_compression))
+        count = 0
+        # pages of the other sites are skipped by the grabber
+        for batch in batched(grabber.iter_process(urls), args.batch_size):
+            dispatcher.save_batch(batch)
+            count += len(batch)
+        dispatcher.close()
+        grabber.close()
+        output_fetcher.close()
+        print('Extracted {0} news of {1}...'.format(count, sitename))
+    archive.close()
+
+
+def create_near_dup_index(args):
+    """
+    Open the fingerprint index of the saved news when --near-dup-index is given.
+    :param args Namespace: parsed arguments
+    :rtype: NearDupIndex or None
+    """
+    if args.near_dup_index is None:
+        return None
+    return NearDupIndex(args.near_dup_index, max_distance=args.near_dup_distance)
+
+
+def create_work_queue(args):
+    """
+    Open the work queue shared by the coordinator and the workers.
+    :param args Namespace: parsed arguments
+    :rtype: BaseWorkQueue
+    """
+    return work_queues[args.queue_backend](args.queue, visibility_timeout=args.visibility_timeout)
+
+
+def load_configs(target):
+    """
+    Load the config of a site, or of every site when target is "all".
+    :param target str: site name or "all"
+    :rtype: dict {sitename: config}
+    """
+    if target == 'all':
+        filenames = sorted(glob.glob('./config/*.conf.json'))
+    else:
+        filenames = ['./config/{0}.conf.json'.format(target)]
+    configs = {}
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            raise OSError(2, 'Configuration file not found', filename)
+        with open(filename) as conf_file:
+            config = json.load(conf_file)
+            configs[config['sitename']] = config
+    return configs
 
 
 def extract_url(config, url, args):
@@ -128,7 +570,7 @@ def extract_url(config, url, args):
     :param args Namespace: parsed arguments
     :rtype: dict
     """
-    grabber = NewsGrabber(config, debug=args.debug, verbose=args.verbose)
+    grabber = NewsGrabber(config, debug=args.debug, verbose=args.verbose, fetcher=create_fetcher(args, config))
     news = grabber.process([url])
     if len(news) > 0:
         return news[0]
@@ -138,18 +580,52 @@ def extract_url(config, url, args):
 
 def main():
     args = parse_args()
+    metrics_stop, metrics_thread = start_metrics(args)
+    try:
+        run(args)
+    finally:
+        metrics_stop.set()
+        if metrics_thread is not None:
+            # wait for the final dump
+            metrics_thread.join()
+
+
+def run(args):
+    """
+    Run the crawl requested by the arguments.
+    :param args Namespace: parsed arguments
+    :rtype: None
+    """
     alnum_re = re.compile(r'^[A-Za-z0-9]{3,}$')
     url_re = re.compile(r'(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:\'".,<>?«»“”‘’]))')
 
     partial_crawler = partial(crawler, args=args)
-    if args.target == 'all':
+    if args.mode == 'worker':
+        # run more workers (on this or other hosts) to add capacity
+        configs = load_configs(args.target)
+        print('Working on site(s): {0}'.format(', '.join(sorted(configs)).title()))
+        worker(configs, args)
+        print('Operation finished...')
+    elif args.replay is not None:
+        configs = load_configs(args.target)
+        replay(configs, args)
+        print('Operation finished...')
+    elif args.daemon:
+        configs = load_configs(args.target)
+        print('Crawling site(s) until stopped: {0}'.format(', '.join(sorted(configs)).title()))
+        daemon(configs, args)
+        print('Operation finished...')
+    elif args.target == 'all':
         print('Scanning all sites in config folder...')
-        configs = []
-        for filename in glob.glob('./config/*.conf.json'):
-            f = open(filename)
-            configs.append(json.load(f))
-        pool = Pool()
-        pool.map(partial_crawler, configs)
+        configs = list(load_configs(args.target).values())
+        if args.workers > 1 or args.metrics_port is not None or args.metrics_file is not None:
+            # every site already uses the worker processes (a pool process cannot start its own workers),
+            # and the metrics are only recorded in this process
+            for config in configs:
+                partial_crawler(config)
+        else:
+            pool = Pool()
+            pool.map(partial_crawler, configs)
         print('Operation finished...')
     elif alnum_re.match(args.target):
         print('Scanning site: {0}'.format(args.target.title()))
@@ -1,3 +1,5 @@
 from output_providers.base_provider import BaseProvider
 from output_providers.nooxsql_provider import NooxSqlProvider
 from output_providers.json_provider import JsonProvider
+from output_providers.parquet_provider import ParquetProvider
+from output_providers.output_dispatcher import OutputDispatcher
@@ -2,7 +2,23 @@ from abc import ABC, abstractmethod
 
 
 class BaseProvider(ABC):
-    """docstring for BaseProvider"""
+    """
+    Output of the crawled news.
+    A crawl streams the news to the provider: save_batch() is called once for every batch, then close() once the last
+    batch is saved. The OutputDispatcher calls both from the worker thread of the provider, one batch at a time.
+    """
+
+    # a batch failing with one of these is saved again by the OutputDispatcher, save_batch() must then be safe to
+    # call again with the same batch (nothing is retried by default)
+    retry_errors = ()
+
+    # whether a batch is persisted once save_batch() returns (e.g. committed to a database). Otherwise the batches are
+    # only persisted by close() (e.g. a file renamed once complete) and abort() drops them
+    durable = True
+
+    # name of the provider in the metrics and messages of the OutputDispatcher (e.g. its -o key), default is the class name
+    name = None
+
     def __init__(self, data):
         self.data = data
         super(BaseProvider, self).__init__()
@@ -21,3 +37,18 @@ class BaseProvider(ABC):
     @abstractmethod
     def save(self):
         """execute the output."""
+
+    def save_batch(self, data):
+        """
+        output a batch of a streamed crawl, called once for every batch.
+        """
+        return self.save(data)
+
+    def close(self):
+        """finish the output once the last batch is saved."""
+
+    def abort(self):
+        """
+        drop the output of a failed crawl instead of finishing it, by default the output is closed.
+        """
+        self.close()
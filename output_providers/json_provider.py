@@ -1,24 +1,66 @@
 from output_providers import BaseProvider
 import io
+import os
+import gzip
 import json
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compression of the output file inferred from its extension
+compression_extensions = {'.gz': 'gzip', '.zst': 'zstd'}
 
 
 class JsonProvider(BaseProvider):
+    """
+    Write the news to a json file, as a single array or as JSON Lines (one news per line, lines=True).
+    A json array is written to "<output_file>.part" and renamed when it is complete, so an earlier output is only
+    replaced by a finished one. JSON Lines are appended to output_file itself, every run (e.g. of the daemon) adds its
+    news to the same file and is flushed after every batch, it can be read (e.g. tail -f) while the crawl runs. A stream
+    output is flushed every flush_every news or flush_interval seconds. The file may be compressed with gzip or zstd (requires the zstandard
+    package), by default according to the extension: every run appends a new gzip member or zstd frame.
+    """
 
-    def __init__(self, output_file, pretty_print=False, data=None):
+    def __init__(self, output_file, pretty_print=False, data=None, lines=False, compression=None, flush_every=50, flush_interval=5):
         if not isinstance(output_file, io.IOBase) and not isinstance(output_file, str):
             raise TypeError('output_file parameter is expected to be an io interface or str')
 
         if not isinstance(pretty_print, bool):
             raise TypeError('pretty_print parameter is expected to be bool instance')
+        if pretty_print and lines:
+            raise ValueError('JSON Lines output cannot be pretty printed')
 
         if isinstance(output_file, str):
-            self._file = open(output_file, 'w')
+            # opened on the first write, so a crawl with nothing to output leaves the previous file intact
+            self._path = output_file
+            self._file = None
+            if compression is None:
+                compression = compression_extensions.get(os.path.splitext(output_file)[1])
         else:
+            if compression is not None:
+                raise ValueError('compression requires an output file path')
+            self._path = None
             self._file = output_file
+        if compression not in (None, 'gzip', 'zstd'):
+            raise ValueError('compression is expected to be "gzip" or "zstd"')
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstandard is required for zstd compressed output (pip install zstandard)')
 
         self.pretty_print = pretty_print
+        self.lines = lines
+        self.compression = compression
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
         self.data = data
+        # the json array file is only persisted once close() renames it
+        self.durable = lines or self._path is None
+        # number of items written by save_batch, the json array is opened by the first batch
+        self._streamed = 0
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
 
     def size(self):
         if self.data is not None:
@@ -36,10 +78,96 @@ class JsonProvider(BaseProvider):
         if len(data) < 1:
             raise ValueError('No data to output!')
 
-        if self.pretty_print:
-            json.dump(data, self._file, indent=4)
+        if self.lines:
+            self._write_lines(data)
+        elif self.pretty_print:
+            json.dump(data, self._open(), indent=4)
         else:
-            json.dump(data, self._file)
+            json.dump(data, self._open())
+        self._finish()
+
+    def save_batch(self, data):
+        """
+        Write a batch of items into a single json array (closed by close()) or as JSON Lines.
+        The output is the same as save() with every item at once.
+        """
+        if self.lines:
+            self._write_lines(data)
+        else:
+            for item in data:
+                if self.pretty_print:
+                    # indent the item one level deeper, like json.dump does for the items of a list
+                    text = '\n    ' + json.dumps(item, indent=4).replace('\n', '\n    ')
+                    separator = ','
+                else:
+                    text = json.dumps(item)
+                    separator = ', '
+                self._open().write(('[' if self._streamed == 0 else separator) + text)
+                self._streamed += 1
+        self._unflushed += len(data)
+        if self._file is not None and (self.lines or self._unflushed >= self.flush_every or time.monotonic() - self._flushed_at >= self.flush_interval):
+            self._flush()
+
+    def close(self):
+        if self._streamed > 0 and not self.lines:
+            self._file.write('\n]' if self.pretty_print else ']')
+        self._streamed = 0
+        self._finish()
+
+    def abort(self):
+        """
+        Remove the incomplete file of a failed crawl, the previous output stays intact and the next batch starts a new
+        file. A stream output and JSON Lines are closed instead, the lines already written are kept.
+        """
+        if self._path is None or self.lines:
+            self.close()
+            return
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._path + '.part')
+        self._streamed = 0
+        self._unflushed = 0
+
+    def _write_lines(self, data):
+        file = self._open()
+        for item in data:
+            file.write(json.dumps(item) + '\n')
+            self._streamed += 1
+
+    def _open(self):
+        if self._file is None:
+            # JSON Lines are appended to the final file, a json array replaces it once complete
+            path, mode = (self._path, 'a') if self.lines else (self._path + '.part', 'w')
+            if self.compression == 'gzip':
+                self._file = gzip.open(path, mode + 't', encoding='utf8')
+            elif self.compression == 'zstd':
+                self._file = io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, mode + 'b')), encoding='utf8')
+            else:
+                self._file = open(path, mode, encoding='utf8')
+        return self._file
+
+    def _flush(self):
+        # the compressors flush a complete block, the written news can be decompressed while the file grows
+        self._file.flush()
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def _finish(self):
+        """
+        Complete the output, a json array file is renamed to its final name.
+        """
+        if self._file is None:
+            return
+        if self._path is None:
+            self._flush()
+            return
+        # the next batch opens the output file again (e.g. the next run of the daemon)
+        self._file.close()
+        self._file = None
+        if not self.lines:
+            os.replace(self._path + '.part', self._path)
+        self._unflushed = 0
 
 
 # if __name__ == '__main__':
@@ -1,14 +1,24 @@
 import pymysql
 import hashlib
 import re
-import requests
 import os
 from output_providers import BaseProvider
+from modules.fetcher import get_default_fetcher
+from modules.image_downloader import ImageDownloader
 
 
 class NooxSqlProvider(BaseProvider):
 
-    def __init__(self, config, noox_config=None, data=None):
+    # a batch interrupted by a lost connection is saved again on a new connection, rows it already inserted are ignored
+    retry_errors = (pymysql.OperationalError, pymysql.InterfaceError)
+
+    # server gone away, lost connection, cannot connect, these errors are not caused by the rows
+    _connection_errors = (2003, 2006, 2013, 2055)
+
+    # rows already in the table (same url_hash, which has a unique index) are skipped
+    _insert_sql = 'INSERT IGNORE INTO `news` (`title`, `source_id`, `cat_id`, `url`, `url_hash`, `author`, `pubtime`, `content`) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)'
+
+    def __init__(self, config, noox_config=None, data=None, fetcher=None, chunk_size=100, image_concurrency=4):
         if not isinstance(config, dict):
             raise TypeError('config parameter is expected to be dict instance')
         if not all(key in ('db_url', 'db_username', 'db_password', 'db_name') for key in config):
@@ -21,13 +31,23 @@ class NooxSqlProvider(BaseProvider):
         else:
             self.config.update({'db_charset': 'latin-1'})
 
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError('chunk_size is expected to be a positive int')
+        # rows inserted per statement and transaction
+        self.chunk_size = chunk_size
+
         self.data = data
+        # the connection was lost, reconnect before the next save
+        self._reconnect = False
+        self._fetcher = fetcher if fetcher is not None else get_default_fetcher()
+        self._image_concurrency = image_concurrency
+        self._images = None
 
         self._db = pymysql.connect(
-            self.config['db_url'],
-            self.config['db_username'],
-            self.config['db_password'],
-            self.config['db_name'],
+            host=self.config['db_url'],
+            user=self.config['db_username'],
+            password=self.config['db_password'],
+            database=self.config['db_name'],
             charset='utf8')
 
         if noox_config is not None:
@@ -54,19 +74,56 @@ class NooxSqlProvider(BaseProvider):
         if len(data) < 1:
             raise ValueError('No data to output!')
 
-        filteredData = [item for item in data if self._get_category_id(item['url']) is not None]
-        if len(filteredData) < 1:
+        items = self._get_category_rows(data)
+        if len(items) < 1:
             raise RuntimeError('Output data is zero after skipping data with no category.')
+        return self._insert(items)
 
-        cursor = self._db.cursor()
-        baseSql = 'INSERT INTO `news` (`title`, `source_id`, `cat_id`, `url`, `url_hash`, `author`, `pubtime`, `content`) VALUES {0};'
-        in_p = ', '.join([item for item in map(self._format_sql, filteredData)])
-        sql = baseSql.format(in_p)
-        # print(sql)
-        cursor.execute(sql)
-        self._db.commit()
-        self.lastinsertids = [i for i in range(cursor.lastrowid, cursor.lastrowid + len(filteredData))]
-        self._download_news_images([(id, filteredData[i]['img_url']) for i, id in enumerate(self.lastinsertids)])
+    def save_batch(self, data):
+        """
+        Insert a batch of a streamed crawl. Unlike save(), a batch left empty after skipping the
+        items with no category is not an error, the next batch may still have some.
+        """
+        if self.noox_config is None:
+            raise RuntimeError('Noox config (noox_config) is not initialized.')
+        return self._insert(self._get_category_rows(data))
+
+    def _get_category_rows(self, data):
+        """
+        Format the rows of the news with a category, the others are skipped.
+        :param data list: news to save
+        :rtype: list of (news, row)
+        """
+        items = []
+        for item in data:
+            category_id = self._get_category_id(item['url'])
+            if category_id is not None:
+                items.append((item, self._format_row(item, category_id)))
+        return items
+
+    def _insert(self, items):
+        """
+        Insert the rows a chunk at a time and queue the images of the inserted news.
+        :param items list: (news, row) returned by _get_category_rows
+        :rtype: list, id of the inserted news
+        """
+        if self._reconnect:
+            self._db.ping(reconnect=True)
+            self._reconnect = False
+
+        self.lastinsertids = []
+        for start in range(0, len(items), self.chunk_size):
+            chunk = items[start:start + self.chunk_size]
+            ids = self._insert_chunk([row for _, row in chunk])
+            images = []
+            for item, row in chunk:
+                # pop, so a url repeated in the data gets its id (and image) once
+                id = ids.pop(row[4], None)
+                if id is not None:
+                    self.lastinsertids.append(id)
+                    images.append((id, item['img_url']))
+            # queued once the chunk is committed, a retried batch does not insert (nor download) the chunk again
+            self._download_news_images(images)
         return self.lastinsertids
 
     def set_noox_config(self, noox_config):
@@ -77,6 +134,10 @@ class NooxSqlProvider(BaseProvider):
         self._source_id = self._get_noox_news_source_id()
         self._noox_categories = self._get_noox_categories()
         self._url_regex = re.compile(self.noox_config['url_regex'])
+        if self._images is not None:
+            self._images.close()
+        # images are downloaded in the background, save() does not wait for them
+        self._images = ImageDownloader(os.path.join(self.noox_config['img_dir'], '.store'), fetcher=self._fetcher, concurrency=self._image_concurrency)
 
     def _get_md5(self, string: str):
         m = hashlib.md5()
@@ -111,20 +172,57 @@ class NooxSqlProvider(BaseProvider):
         else:
             raise Exception('Source id could not be found from database. Check your configuration file.')
 
-    def _format_sql(self, item):
-        category_id = self._get_category_id(item['url'])
-        if category_id is not None:
-            return "('"+self._db.escape_string(item['title'])+"', '"+str(self._source_id)+"', '"+str(category_id)+"', '"+self._db.escape_string(item['url'])+"', '"+self._get_md5(item['url'])+"', '"+self._db.escape_string(item['author'])+"', '"+self._db.escape_string(item['pubtime'])+"', '"+self._db.escape_string(item['content'])+"')"
-        else:
-            raise Exception('No categories reached _format_sql')
+    def _format_row(self, item, category_id):
+        return (item['title'], self._source_id, category_id, item['url'], self._get_md5(item['url']), item['author'], item['pubtime'], item['content'])
+
+    def _insert_chunk(self, rows):
+        """
+        Insert rows in a single transaction. When the chunk fails, the rows are inserted one by one so only the bad rows are lost.
+        :param rows list: rows formatted by _format_row
+        :rtype: dict, id of the newly inserted rows {url_hash: id}
+        """
+        hashes = [row[4] for row in rows]
+        cursor = self._db.cursor()
+        try:
+            existing = self._get_news_ids(cursor, hashes)
+            cursor.executemany(self._insert_sql, rows)
+            # ignored rows keep the id they already had, only report the rows this chunk inserted. Looked up before the
+            # commit: a chunk interrupted by a lost connection is rolled back, its retry does not see its own rows as existing
+            ids = dict((url_hash, id) for url_hash, id in self._get_news_ids(cursor, hashes).items() if url_hash not in existing)
+            self._db.commit()
+        except pymysql.MySQLError as e:
+            if isinstance(e, pymysql.InterfaceError) or (isinstance(e, pymysql.OperationalError) and e.args and e.args[0] in self._connection_errors):
+                # inserting the rows one by one would fail the same way, let the caller save the batch again
+                self._reconnect = True
+                raise
+            self._db.rollback()
+            if len(rows) == 1:
+                print('Unable to insert "{0}" cause: {1}'.format(rows[0][3], str(e)))
+                return {}
+            ids = {}
+            for row in rows:
+                ids.update(self._insert_chunk([row]))
+            return ids
+        return ids
+
+    def _get_news_ids(self, cursor, hashes):
+        """
+        Look up the id of the news with the given url hashes.
+        :param cursor Cursor: database cursor
+        :param hashes list: url hashes
+        :rtype: dict {url_hash: id}
+        """
+        cursor.execute('SELECT `url_hash`, `id` FROM `news` WHERE `url_hash` IN ({0})'.format(', '.join(['%s'] * len(hashes))), hashes)
+        return dict(cursor.fetchall())
+
+    def close(self):
+        """
+        Wait for the queued image downloads, the provider stays usable (e.g. for the next run of the daemon).
+        """
+        if self._images is not None:
+            self._images.wait()
 
     def _download_news_images(self, items: list):
-        for item in items:
-            with open(self.noox_config['img_dir']+str(item[0])+'.jpg', 'wb') as file:
-                try:
-                    img = requests.get(item[1])
-                    file.write(img.content)
-                    file.close()
-                except Exception as e:
-                    print('Unable to download "{0}" cause: {1}'.format(item[1], str(e)))
-                    os.unlink(file.name)
+        for id, url in items:
+            if url is not None:
+                self._images.submit(url, self.noox_config['img_dir']+str(id)+'.jpg')
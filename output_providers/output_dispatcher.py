@@ -0,0 +1,217 @@
+import queue
+import threading
+import time
+from modules.metrics import get_metrics
+
+
+class OutputDispatcher:
+    """
+    Fan the batches of news out to the output providers. Every provider is fed from its own bounded queue by its own
+    worker thread, so a slow provider (e.g. a MySQL commit) does not hold back the others, and save_batch() blocks while
+    a queue is full: the grabber slows down to the pace of the slowest provider instead of piling up news in memory.
+    A batch failing with one of the retry_errors of its provider is saved again after a backoff. A batch that still
+    fails, or fails with any other error, is dropped for that provider only, the other providers and the next batches
+    are not affected. The batches of a provider that is not durable (e.g. a file renamed once complete) are only
+    persisted once it is closed.
+    """
+
+    def __init__(self, outputs, queue_size=4, retries=3, backoff=1, debug=False):
+        if not isinstance(queue_size, int) or queue_size < 1:
+            raise ValueError('queue_size is expected to be a positive int')
+        self._debug = debug
+        self.outputs = outputs
+        self._sinks = [_Sink(output, queue_size, retries, backoff) for output in outputs]
+
+    def save_batch(self, batch, on_saved=None):
+        """
+        Queue a batch for every provider, blocks while a queue is full.
+        :param batch list: news to save
+        :param on_saved function: called without arguments once every provider persisted the batch (from the worker
+                                  thread of the last one): when its save_batch() returns, or when it is closed if it is
+                                  not durable. Not called when a provider dropped the batch or was aborted
+        """
+        self._raise_error()
+        queued = _Batch(batch, len(self._sinks), on_saved)
+        for sink in self._sinks:
+            sink.queue.put(queued)
+
+    def join(self):
+        """
+        Wait until every queued batch is saved or dropped, the batches of a provider that is not durable are persisted
+        by close().
+        :rtype: list of the errors of the dropped batches since the last join
+        """
+        errors = []
+        for sink in self._sinks:
+            sink.queue.join()
+            errors += sink.take_errors()
+        return errors
+
+    def close(self):
+        """
+        Save the queued batches then close every provider (in its worker thread).
+        In debug mode, the first error of a dropped batch is raised.
+        :rtype: list of the errors of the dropped batches since the last join
+        """
+        for sink in self._sinks:
+            sink.queue.put(None)
+        for sink in self._sinks:
+            sink.thread.join()
+        self._raise_error()
+        errors = []
+        for sink in self._sinks:
+            errors += sink.take_errors()
+        return errors
+
+    def abort(self):
+        """
+        Stop the providers of a failed crawl: the queued batches are dropped and every provider is aborted (in its
+        worker thread), e.g. an incomplete output file is removed. Does nothing once the dispatcher is closed.
+        """
+        sinks = [sink for sink in self._sinks if sink.thread.is_alive()]
+        for sink in sinks:
+            sink.aborted = True
+            sink.queue.put(None)
+        for sink in sinks:
+            sink.thread.join()
+
+    def _raise_error(self):
+        # with --debug the crawl stops on the first dropped batch, like it did when the providers were called directly
+        if not self._debug:
+            return
+        for sink in self._sinks:
+            errors = sink.take_errors()
+            if errors:
+                raise errors[0]
+
+
+class _Batch:
+    """
+    Batch queued for every provider, on_saved is called once all of them saved it.
+    """
+
+    def __init__(self, items, sinks, on_saved):
+        self.items = items
+        self._remaining = sinks
+        self._dropped = False
+        self._on_saved = on_saved
+        self._lock = threading.Lock()
+        if sinks == 0:
+            self._saved()
+
+    def done(self, saved):
+        """
+        :param saved bool: whether the provider saved the batch
+        """
+        with self._lock:
+            self._remaining -= 1
+            self._dropped = self._dropped or not saved
+            complete = self._remaining == 0 and not self._dropped
+        if complete:
+            self._saved()
+
+    def _saved(self):
+        if self._on_saved is None:
+            return
+        try:
+            self._on_saved()
+        except Exception as e:
+            print('[ERROR] failed to complete a batch of {0} news cause: {1}'.format(len(self.items), str(e)))
+
+
+class _Sink:
+    """
+    Queue and worker thread of an output provider.
+    """
+
+    def __init__(self, output, queue_size, retries, backoff):
+        self.output = output
+        # json and jsonl are both a JsonProvider, their metrics are told apart by the name
+        self.name = output.name if output.name is not None else output.__class__.__name__
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._retries = retries
+        self._backoff = backoff
+        self._lock = threading.Lock()
+        self._errors = []
+        # batches saved by a provider that is not durable, persisted once it is closed
+        self._unpersisted = []
+        # set by OutputDispatcher.abort(), the remaining batches are skipped
+        self.aborted = False
+        # daemon, a crawl stopped by an exception does not wait for the providers
+        self.thread = threading.Thread(target=self._run, name='output-' + self.name, daemon=True)
+        self.thread.start()
+
+    def take_errors(self):
+        with self._lock:
+            errors = self._errors
+            self._errors = []
+        return errors
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    persisted = not self.aborted and self._close()
+                    if self.aborted:
+                        self._abort()
+                    for unpersisted in self._unpersisted:
+                        unpersisted.done(persisted)
+                    self._unpersisted = []
+                    return
+                saved = not self.aborted and self._save(batch.items)
+                if saved and not self.output.durable:
+                    self._unpersisted.append(batch)
+                else:
+                    batch.done(saved)
+            finally:
+                self.queue.task_done()
+
+    def _save(self, batch):
+        """
+        :rtype: bool, whether the batch is saved
+        """
+        metrics = get_metrics()
+        attempt = 0
+        while True:
+            try:
+                with metrics.timer('noox_output_seconds', provider=self.name):
+                    self.output.save_batch(batch)
+                metrics.inc('noox_output_items_total', len(batch), provider=self.name)
+                return True
+            except self.output.retry_errors as e:
+                if attempt >= self._retries:
+                    self._drop(batch, e)
+                    return False
+                print('[WARNING] {0} failed to save {1} news cause: {2}, retrying...'.format(self.name, len(batch), str(e)))
+                metrics.inc('noox_output_retries_total', provider=self.name)
+                time.sleep(self._backoff * 2 ** attempt)
+                attempt += 1
+            except Exception as e:
+                self._drop(batch, e)
+                return False
+
+    def _close(self):
+        """
+        :rtype: bool, whether the provider is closed
+        """
+        try:
+            self.output.close()
+            return True
+        except Exception as e:
+            print('[ERROR] {0} failed to close cause: {1}'.format(self.name, str(e)))
+            with self._lock:
+                self._errors.append(e)
+            return False
+
+    def _abort(self):
+        try:
+            self.output.abort()
+        except Exception as e:
+            print('[ERROR] {0} failed to abort cause: {1}'.format(self.name, str(e)))
+
+    def _drop(self, batch, error):
+        print('[ERROR] {0} dropped {1} news cause: {2}'.format(self.name, len(batch), str(error)))
+        get_metrics().inc('noox_output_dropped_total', len(batch), provider=self.name)
+        with self._lock:
+            self._errors.append(error)
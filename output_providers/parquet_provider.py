@@ -0,0 +1,167 @@
+from output_providers import BaseProvider
+import os
+import re
+from datetime import datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# columns of repeated values, stored with a dictionary of their distinct values
+dictionary_columns = ['url', 'author', 'category', 'site']
+
+# format of the dates written by the DateParser
+pubtime_format = '%Y-%m-%d %H:%M:%S'
+
+
+class ParquetProvider(BaseProvider):
+    """
+    Write the news to a Parquet file for analytics, a batch at a time: the news are buffered and written
+    row_group_size at a time, or sooner once their text reaches row_group_bytes, so the memory used does not grow
+    with the crawl.
+    The columns are the keys of the news (the "as" names of the site config) plus "site" and "category" (from the
+    "url_regex" and "categories" of the noox config). pubtime is a timestamp, every other column a string. url,
+    author, category and site are dictionary encoded, every column is compressed (content makes most of the file).
+    Like JsonProvider, the file is written to "<output_file>.part" and renamed when it is complete.
+    """
+
+    # the news are only persisted once close() renames the file
+    durable = False
+
+    def __init__(self, output_file, data=None, site=None, noox_config=None, row_group_size=1000, row_group_bytes=16 * 1024 * 1024, compression='zstd'):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required for the parquet output (pip install pyarrow)')
+        if not isinstance(output_file, str):
+            raise TypeError('output_file parameter is expected to be str')
+        if not isinstance(row_group_size, int) or row_group_size < 1:
+            raise ValueError('row_group_size is expected to be a positive int')
+
+        self._path = output_file
+        self.data = data
+        self.site = site
+        self.row_group_size = row_group_size
+        self.row_group_bytes = row_group_bytes
+        self.compression = compression
+        if noox_config is not None:
+            self._url_regex = re.compile(noox_config['url_regex'])
+            self._categories = noox_config['categories']
+            self._default_category = noox_config['default_category'] if noox_config.get('allow_default_category') else None
+        else:
+            self._url_regex = None
+        # the schema is fixed by the first batch, the writer is opened by the first row group
+        self._schema = None
+        self._writer = None
+        self._rows = []
+        # characters of the buffered news, the content makes most of it
+        self._buffered = 0
+
+    def size(self):
+        if self.data is not None:
+            return len(self.data)
+        else:
+            return 0
+
+    def put(self, data):
+        self.data = data
+        return self
+
+    def save(self, data=None):
+        if data is None:
+            data = self.data
+        if len(data) < 1:
+            raise ValueError('No data to output!')
+        self.save_batch(data)
+        self.close()
+
+    def save_batch(self, data):
+        """
+        Buffer a batch of news, every full row group is written.
+        """
+        if self._schema is None and len(data) > 0:
+            self._schema = self._create_schema(data[0])
+        for item in data:
+            self._rows.append(item)
+            self._buffered += sum(len(value) for value in item.values() if isinstance(value, str))
+            if len(self._rows) >= self.row_group_size or self._buffered >= self.row_group_bytes:
+                self._write_rows()
+
+    def close(self):
+        """
+        Write the last row group and complete the file, the next batch starts a new file (e.g. the next run of the daemon).
+        """
+        if self._rows:
+            self._write_rows()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.replace(self._path + '.part', self._path)
+        self._schema = None
+
+    def abort(self):
+        """
+        Drop the buffered news and remove the incomplete file of a failed crawl, the previous output stays intact.
+        """
+        self._rows = []
+        self._buffered = 0
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self._path + '.part')
+        self._schema = None
+
+    def _create_schema(self, item):
+        """
+        :param item dict: first news of the output
+        :rtype: pyarrow.Schema
+        """
+        fields = []
+        for name in list(item) + ['site', 'category']:
+            if name == 'pubtime':
+                fields.append(pyarrow.field(name, pyarrow.timestamp('s')))
+            elif name not in [field.name for field in fields]:
+                fields.append(pyarrow.field(name, pyarrow.string()))
+        return pyarrow.schema(fields)
+
+    def _write_rows(self):
+        columns = dict((name, []) for name in self._schema.names)
+        for item in self._rows:
+            for name, values in columns.items():
+                if name == 'site':
+                    values.append(self.site)
+                elif name == 'category':
+                    values.append(self._get_category(item.get('url')))
+                elif name == 'pubtime':
+                    values.append(self._parse_pubtime(item.get('pubtime')))
+                else:
+                    value = item.get(name)
+                    values.append(value if value is None or isinstance(value, str) else str(value))
+        table = pyarrow.Table.from_pydict(columns, schema=self._schema)
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self._path + '.part', self._schema, compression=self.compression,
+                use_dictionary=[name for name in dictionary_columns if name in self._schema.names])
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._rows = []
+        self._buffered = 0
+
+    def _get_category(self, url):
+        """
+        Category name of a news, as NooxSqlProvider resolves it.
+        :rtype: str or None
+        """
+        if self._url_regex is None or url is None:
+            return None
+        match = self._url_regex.search(url)
+        if match is None:
+            return self._default_category
+        return self._categories.get(match.group(1), self._default_category)
+
+    def _parse_pubtime(self, pubtime):
+        if not isinstance(pubtime, str):
+            return None
+        try:
+            return datetime.strptime(pubtime, pubtime_format)
+        except ValueError:
+            return None
@@ -0,0 +1,173 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from modules import CrawlState, LinkExtractor, NewsGrabber
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixture_dir = os.path.join(root_dir, 'benchmark', 'fixtures', 'detik')
+
+
+def load_fixture(name):
+    with open(os.path.join(fixture_dir, name), 'rb') as f:
+        return f.read()
+
+
+class StubFetcher:
+    """
+    Fetcher answering from a dict {url: (status, headers, body)}, keeps the headers of every request.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, headers or {}))
+        if url not in self.responses:
+            raise ConnectionError('timed out')
+        status, resp_headers, body = self.responses[url]
+        resp = Response()
+        resp.url = url
+        resp.status_code = status
+        resp.headers = CaseInsensitiveDict(resp_headers)
+        resp.encoding = 'utf-8'
+        resp.raw = io.BytesIO(body)
+        if not kwargs.get('stream', False):
+            resp._content = body
+        return resp
+
+    def headers_of(self, url):
+        return [headers for requested, headers in self.requests if requested == url]
+
+
+class StateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state = CrawlState(os.path.join(self.dir, 'state.db'))
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.dir)
+
+
+class TestCrawlState(StateTestCase):
+
+    def test_conditional_headers(self):
+        self.assertEqual(self.state.conditional_headers('http://a/1'), {})
+        self.state.update('http://a/1', {'ETag': '"v1"', 'Last-Modified': 'Sat, 29 Apr 2017 10:00:00 GMT'})
+        self.assertEqual(self.state.conditional_headers('http://a/1'), {'If-None-Match': '"v1"', 'If-Modified-Since': 'Sat, 29 Apr 2017 10:00:00 GMT'})
+        # the validators are replaced by the next response
+        self.state.update('http://a/1', {'ETag': '"v2"'})
+        self.assertEqual(self.state.conditional_headers('http://a/1'), {'If-None-Match': '"v2"'})
+
+    def test_is_unchanged(self):
+        self.state.update('http://a/1', {}, lastmod='2017-04-27')
+        # a url whose news was never saved is not unchanged
+        self.assertFalse(self.state.is_unchanged('http://a/1', '2017-04-27'))
+        self.state.update('http://a/1', {}, content_hash='hash')
+        self.assertTrue(self.state.is_unchanged('http://a/1', '2017-04-27'))
+        self.assertFalse(self.state.is_unchanged('http://a/1', '2017-04-28'))
+        self.assertFalse(self.state.is_unchanged('http://a/1', None))
+        self.assertFalse(self.state.is_unchanged('http://a/2', '2017-04-27'))
+
+    def test_update_keeps_lastmod_and_hash(self):
+        self.state.update('http://a/1', {}, lastmod='2017-04-27', content_hash='hash')
+        self.state.update('http://a/1', {'ETag': '"v1"'})
+        self.assertEqual(self.state.get('http://a/1'), {'etag': '"v1"', 'last_modified': None, 'lastmod': '2017-04-27', 'content_hash': 'hash'})
+
+
+class TestDeferredState(StateTestCase):
+    """
+    With defer_state, the state of a news is only saved by commit_state(), once the output saved it.
+    """
+
+    urls = ['http://news.detik.com/berita/d-4000000/article-0', 'http://news.detik.com/berita/d-4000001/article-1']
+
+    def setUp(self):
+        super(TestDeferredState, self).setUp()
+        with open(os.path.join(root_dir, 'config', 'detik.conf.json')) as f:
+            self.config = json.load(f)
+        self.fetcher = StubFetcher(dict(
+            (url, (200, {'ETag': '"{0}"'.format(i)}, load_fixture('article-{0}.html'.format(i)))) for i, url in enumerate(self.urls)))
+
+    def grab(self, defer_state=True):
+        grabber = NewsGrabber(self.config, fetcher=self.fetcher, state=self.state, defer_state=defer_state)
+        news = grabber.process(self.urls, lastmods={self.urls[0]: '2017-04-27'})
+        self.assertEqual([item['url'] for item in news], self.urls)
+        return grabber
+
+    def test_commit_state(self):
+        grabber = self.grab()
+        self.assertIsNone(self.state.get(self.urls[0]))
+        grabber.commit_state([self.urls[0]])
+        state = self.state.get(self.urls[0])
+        self.assertEqual((state['etag'], state['lastmod']), ('"0"', '2017-04-27'))
+        self.assertIsNotNone(state['content_hash'])
+        self.assertIsNone(self.state.get(self.urls[1]))
+
+    def test_discard_state(self):
+        grabber = self.grab()
+        grabber.discard_state()
+        grabber.commit_state(self.urls)
+        # the dropped news are grabbed again on the next crawl
+        self.assertIsNone(self.state.get(self.urls[0]))
+        self.assertIsNone(self.state.get(self.urls[1]))
+
+    def test_saved_right_away(self):
+        self.grab(defer_state=False)
+        self.assertEqual(self.state.get(self.urls[1])['etag'], '"1"')
+
+    def test_failed_urls(self):
+        grabber = NewsGrabber(self.config, fetcher=self.fetcher, state=self.state, defer_state=True)
+        missing = 'http://news.detik.com/berita/d-4000009/missing'
+        news = grabber.process([missing] + self.urls)
+        self.assertEqual(len(news), 2)
+        self.assertEqual(grabber.fetch_errors, 1)
+        self.assertEqual(grabber.failed_urls, [missing])
+
+
+class TestSitemapIndexState(StateTestCase):
+    """
+    The start url and the sitemap indexes are always requested in full, their sitemaps may change while they do not.
+    """
+
+    def setUp(self):
+        super(TestSitemapIndexState, self).setUp()
+        with open(os.path.join(root_dir, 'config', 'detik.conf.json')) as f:
+            self.config = json.load(f)
+        self.fetcher = StubFetcher({
+            'http://detik.com': (200, {'ETag': '"index"'}, load_fixture('sitemap-index.xml')),
+            'http://detik.com/sitemap.xml': (200, {'ETag': '"sitemap"'}, load_fixture('sitemap.xml'))
+        })
+
+    def crawl(self):
+        extractor = LinkExtractor(self.config, fetcher=self.fetcher, state=self.state)
+        links = extractor.get_urls()
+        extractor.commit_edges()
+        return links
+
+    def test_start_url(self):
+        self.assertEqual(len(self.crawl()), 10)
+        self.assertIsNone(self.state.get('http://detik.com'))
+        self.assertEqual(self.state.get('http://detik.com/sitemap.xml')['etag'], '"sitemap"')
+        # a state saved before still does not make the start url conditional
+        self.state.update('http://detik.com', {'ETag': '"index"'})
+        self.crawl()
+        self.assertEqual(self.fetcher.headers_of('http://detik.com'), [{}, {}])
+
+    def test_changed_sitemap(self):
+        self.crawl()
+        # the sitemap changed but the index did not (it has no <lastmod>)
+        self.fetcher.responses['http://detik.com'] = (200, {'ETag': '"index"'}, load_fixture('sitemap-index.xml').replace(b'<lastmod>2017-04-27T18:55:02+07:00</lastmod>', b''))
+        self.crawl()
+        self.assertEqual(self.fetcher.headers_of('http://detik.com/sitemap.xml')[-1], {'If-None-Match': '"sitemap"'})
+
+
+if __name__ == '__main__':
+    unittest.main()
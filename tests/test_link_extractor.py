@@ -0,0 +1,83 @@
+import io
+import os
+import json
+import unittest
+from requests.models import Response
+from modules import LinkExtractor
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+fixture_dir = os.path.join(root_dir, 'benchmark', 'fixtures', 'detik')
+
+
+class BrokenStream(io.BytesIO):
+
+    def read(self, size=-1):
+        raise IOError('connection reset')
+
+
+class StubFetcher:
+    """
+    Fetcher answering from a dict {url: body}, a None body fails while reading. Keeps every response.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.pages = []
+
+    def get(self, url, **kwargs):
+        body = self.responses[url]
+        resp = Response()
+        resp.url = url
+        resp.status_code = 200
+        resp.raw = BrokenStream() if body is None else io.BytesIO(body)
+        self.pages.append(resp)
+        return resp
+
+
+class TestConcurrentLinkExtractor(unittest.TestCase):
+    """
+    The concurrent crawl extracts the same links as the serial one, and closes every page it fetched.
+    """
+
+    def setUp(self):
+        with open(os.path.join(root_dir, 'config', 'detik.conf.json')) as f:
+            self.config = json.load(f)
+        with open(os.path.join(fixture_dir, 'sitemap.xml'), 'rb') as f:
+            sitemap = f.read()
+        with open(os.path.join(fixture_dir, 'sitemap-index.xml'), 'rb') as f:
+            index = f.read().replace(b'</sitemapindex>', b'<sitemap><loc>http://detik.com/sitemap-2.xml</loc></sitemap></sitemapindex>')
+        self.responses = {
+            'http://detik.com': index,
+            'http://detik.com/sitemap.xml': sitemap,
+            'http://detik.com/sitemap-2.xml': sitemap.replace(b'/article-', b'/other-')
+        }
+
+    def crawl(self, concurrency, max_link, seen=None):
+        fetcher = StubFetcher(self.responses)
+        links = LinkExtractor(self.config, concurrency=concurrency, fetcher=fetcher, seen=seen).get_urls(crawl_depth_override=0, max_link=max_link)
+        for page in fetcher.pages:
+            self.assertTrue(page.raw.closed, page.url)
+        return links
+
+    def test_same_links(self):
+        for max_link in (None, 3, 12):
+            self.assertEqual(self.crawl(4, max_link), self.crawl(1, max_link))
+
+    def test_filtered_links_read_further(self):
+        # the links skipped as already seen do not count towards max_link
+        seen = set('http://news.detik.com/berita/d-400000{0}/article-{0}'.format(i) for i in range(4))
+        links = self.crawl(4, 3, seen=seen)
+        self.assertEqual(links, self.crawl(1, 3, seen=seen))
+        self.assertEqual(len(links), 3)
+
+    def test_read_error_closes_page(self):
+        self.responses['http://detik.com/sitemap-2.xml'] = None
+        fetcher = StubFetcher(self.responses)
+        with self.assertRaises(IOError):
+            LinkExtractor(self.config, concurrency=4, fetcher=fetcher).get_urls(crawl_depth_override=0)
+        for page in fetcher.pages:
+            self.assertTrue(page.raw.closed, page.url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from output_providers import BaseProvider, OutputDispatcher, JsonProvider
+
+
+class RecordingProvider(BaseProvider):
+    """
+    Provider keeping the saved batches, failing the first save attempts with the given errors.
+    """
+
+    retry_errors = (ConnectionError,)
+
+    def __init__(self, failures=(), hold=None, durable=True):
+        super(RecordingProvider, self).__init__(None)
+        self.durable = durable
+        self.failures = list(failures)
+        # save_batch() waits for this event when given, once it set saving
+        self.hold = hold
+        self.saving = threading.Event()
+        self.attempts = 0
+        self.batches = []
+        self.closed = False
+        self.aborted = False
+
+    def put(self, data):
+        return self
+
+    def size(self):
+        return 0
+
+    def save(self, data=None):
+        if self.hold is not None:
+            self.saving.set()
+            self.hold.wait(5)
+        self.attempts += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def abort(self):
+        self.aborted = True
+
+
+class TestOutputDispatcher(unittest.TestCase):
+
+    def test_save(self):
+        outputs = [RecordingProvider(), RecordingProvider()]
+        dispatcher = OutputDispatcher(outputs, backoff=0)
+        dispatcher.save_batch([{'url': 'a'}])
+        dispatcher.save_batch([{'url': 'b'}])
+        self.assertEqual(dispatcher.close(), [])
+        for output in outputs:
+            self.assertEqual(output.batches, [[{'url': 'a'}], [{'url': 'b'}]])
+            self.assertTrue(output.closed)
+
+    def test_retry(self):
+        output = RecordingProvider(failures=[ConnectionError('lost'), ConnectionError('lost')])
+        dispatcher = OutputDispatcher([output], retries=2, backoff=0)
+        dispatcher.save_batch([{'url': 'a'}])
+        self.assertEqual(dispatcher.join(), [])
+        self.assertEqual(output.attempts, 3)
+        self.assertEqual(output.batches, [[{'url': 'a'}]])
+        dispatcher.close()
+
+    def test_drop(self):
+        error = ValueError('bad news')
+        failing = RecordingProvider(failures=[error])
+        exhausted = RecordingProvider(failures=[ConnectionError('lost')] * 2)
+        other = RecordingProvider()
+        dispatcher = OutputDispatcher([failing, exhausted, other], retries=1, backoff=0)
+        dispatcher.save_batch([{'url': 'a'}])
+        dispatcher.save_batch([{'url': 'b'}])
+        errors = dispatcher.join()
+        # an error outside of retry_errors is not retried
+        self.assertEqual(failing.attempts, 2)
+        self.assertEqual(len(errors), 2)
+        self.assertIn(error, errors)
+        # the dropped batch only concerns its provider, the next batches are saved
+        self.assertEqual(failing.batches, [[{'url': 'b'}]])
+        self.assertEqual(exhausted.batches, [[{'url': 'b'}]])
+        self.assertEqual(other.batches, [[{'url': 'a'}], [{'url': 'b'}]])
+        self.assertEqual(dispatcher.close(), [])
+
+    def test_debug_raises_dropped_batch_error(self):
+        error = ValueError('bad news')
+        dispatcher = OutputDispatcher([RecordingProvider(failures=[error])], backoff=0, debug=True)
+        dispatcher.save_batch([{'url': 'a'}])
+        with self.assertRaises(ValueError):
+            dispatcher.close()
+
+    def test_on_saved(self):
+        saved = []
+        outputs = [RecordingProvider(), RecordingProvider(failures=[ValueError('bad news')])]
+        dispatcher = OutputDispatcher(outputs, backoff=0)
+        dispatcher.save_batch([{'url': 'a'}], on_saved=lambda: saved.append('a'))
+        dispatcher.save_batch([{'url': 'b'}], on_saved=lambda: saved.append('b'))
+        dispatcher.close()
+        # called once every provider saved the batch, not when one of them dropped it
+        self.assertEqual(saved, ['b'])
+
+    def test_on_saved_without_providers(self):
+        saved = []
+        dispatcher = OutputDispatcher([])
+        dispatcher.save_batch([{'url': 'a'}], on_saved=lambda: saved.append('a'))
+        self.assertEqual(saved, ['a'])
+        self.assertEqual(dispatcher.close(), [])
+
+    def test_on_saved_once_closed(self):
+        saved = []
+        output = RecordingProvider(durable=False)
+        dispatcher = OutputDispatcher([output, RecordingProvider()], backoff=0)
+        dispatcher.save_batch([{'url': 'a'}], on_saved=lambda: saved.append('a'))
+        dispatcher.join()
+        # the provider only persists the batch when it is closed
+        self.assertEqual(output.batches, [[{'url': 'a'}]])
+        self.assertEqual(saved, [])
+        dispatcher.close()
+        self.assertEqual(saved, ['a'])
+
+    def test_abort(self):
+        hold = threading.Event()
+        output = RecordingProvider(hold=hold, durable=False)
+        saved = []
+        dispatcher = OutputDispatcher([output], queue_size=4, backoff=0)
+        for url in ('a', 'b', 'c'):
+            dispatcher.save_batch([{'url': url}], on_saved=lambda url=url: saved.append(url))
+        # the first batch is being saved when the crawl fails
+        self.assertTrue(output.saving.wait(5))
+        aborting = threading.Thread(target=dispatcher.abort)
+        aborting.start()
+        time.sleep(0.1)
+        hold.set()
+        aborting.join(5)
+        self.assertFalse(aborting.is_alive())
+        # the queued batches are dropped and the provider is aborted instead of closed, before persisting the first one
+        self.assertTrue(output.aborted)
+        self.assertFalse(output.closed)
+        self.assertEqual(output.batches, [[{'url': 'a'}]])
+        self.assertEqual(saved, [])
+
+    def test_abort_json_provider(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'site.json')
+            saved = []
+            dispatcher = OutputDispatcher([JsonProvider(path, True)])
+            dispatcher.save_batch([{'url': 'a'}], on_saved=lambda: saved.append('a'))
+            dispatcher.join()
+            dispatcher.abort()
+            self.assertEqual(saved, [])
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_json_lines_provider(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'site.jsonl')
+            saved = []
+            dispatcher = OutputDispatcher([JsonProvider(path, lines=True)])
+            dispatcher.save_batch([{'url': 'a'}], on_saved=lambda: saved.append('a'))
+            dispatcher.join()
+            # the lines are appended to the file as they are saved
+            self.assertEqual(saved, ['a'])
+            with open(path) as f:
+                self.assertEqual(f.read(), '{"url": "a"}\n')
+            dispatcher.abort()
+            self.assertTrue(os.path.exists(path))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_abort_after_close(self):
+        output = RecordingProvider()
+        dispatcher = OutputDispatcher([output])
+        dispatcher.save_batch([{'url': 'a'}])
+        dispatcher.close()
+        dispatcher.abort()
+        self.assertTrue(output.closed)
+        self.assertFalse(output.aborted)
+
+    def test_queue_size(self):
+        with self.assertRaises(ValueError):
+            OutputDispatcher([RecordingProvider()], queue_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
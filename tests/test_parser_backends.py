@@ -0,0 +1,45 @@
+import re
+import unittest
+from collections import namedtuple
+from modules.parser_backends import BeautifulSoupBackend, LxmlBackend
+from modules.extraction_plan import Selector
+
+Plan = namedtuple('Plan', ['tags'])
+
+
+class TestParserBackends(unittest.TestCase):
+    """
+    The lxml backend gives the same text and html as the BeautifulSoup backend.
+    """
+
+    pages = [
+        # the strings of a template are not part of the text, even inside its children
+        '<div class="content">By <template><span>t</span> &amp; x</template><span>Reporter</span></div>',
+        '<div class="content">x<template><p class="q">t&amp;<b>u &lt; v</b></p>w</template>Reporter</div>',
+        '<div class="content">x<template><template>in</template>o</template>y</div>',
+        '<div class="content">x<script>if(a<b&&c>d){}</script><style>p>a{}</style>y</div>'
+    ]
+
+    def setUp(self):
+        plan = Plan(tags=('div', 'p', 'span', 'template'))
+        self.bs4 = BeautifulSoupBackend(plan)
+        self.lxml = LxmlBackend(plan)
+
+    def assertSameOutput(self, selector):
+        for page in self.pages:
+            expected = self.bs4.find(self.bs4.parse(page), selector)
+            actual = self.lxml.find(self.lxml.parse(page), selector)
+            if expected is None:
+                self.assertIsNone(actual)
+                continue
+            self.assertEqual(self.bs4.get_text(expected), self.lxml.get_text(actual), page)
+            self.assertEqual(self.bs4.to_string(expected), self.lxml.to_string(actual), page)
+
+    def test_template(self):
+        self.assertSameOutput(Selector('div', 'class', re.compile('content')))
+        self.assertSameOutput(Selector('template', None, None))
+        self.assertSameOutput(Selector('p', None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
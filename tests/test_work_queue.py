@@ -0,0 +1,117 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from modules.work_queue import SqliteWorkQueue
+
+
+class TestSqliteWorkQueue(unittest.TestCase):
+    """
+    A url is leased by a single worker until it is acked, released or its lease expires.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'queue.db')
+        self.queue = SqliteWorkQueue(self.path, visibility_timeout=300)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.dir)
+
+    def test_push_ignores_queued_urls(self):
+        self.assertEqual(self.queue.push('detik', ['http://a/1', 'http://a/2']), 2)
+        self.assertEqual(self.queue.push('detik', ['http://a/2', 'http://a/3']), 1)
+        # the same url of another site is another task
+        self.assertEqual(self.queue.push('kompas', ['http://a/1']), 1)
+        self.assertEqual(self.queue.pending(), 4)
+
+    def test_lease(self):
+        self.queue.push('detik', ['http://a/1', 'http://a/2'], lastmods={'http://a/1': '2024-01-01'})
+        self.queue.push('kompas', ['http://b/1'])
+        tasks = self.queue.lease(10, sites=['detik'])
+        self.assertEqual([(task.site, task.url, task.lastmod) for task in tasks], [('detik', 'http://a/1', '2024-01-01'), ('detik', 'http://a/2', None)])
+        # a leased url is not leased again, even by another worker
+        other = SqliteWorkQueue(self.path)
+        try:
+            self.assertEqual([task.url for task in other.lease(10)], ['http://b/1'])
+        finally:
+            other.close()
+        self.assertEqual(self.queue.lease(10), [])
+
+    def test_ack(self):
+        self.queue.push('detik', ['http://a/1', 'http://a/2'])
+        tasks = self.queue.lease(10)
+        self.queue.ack([tasks[0].id])
+        self.assertEqual(self.queue.pending(), 1)
+        # an acked url is neither leased nor queued again
+        self.queue.release([task.id for task in tasks])
+        self.assertEqual([task.url for task in self.queue.lease(10)], ['http://a/2'])
+        self.assertEqual(self.queue.push('detik', ['http://a/1']), 0)
+
+    def test_push_changed_lastmod(self):
+        self.queue.push('detik', ['http://a/1', 'http://a/2'], lastmods={'http://a/1': '2024-01-01', 'http://a/2': '2024-01-01'})
+        self.queue.ack([task.id for task in self.queue.lease(10)])
+        # an article whose sitemap <lastmod> changed is queued again
+        self.assertEqual(self.queue.push('detik', ['http://a/1', 'http://a/2'], lastmods={'http://a/1': '2024-01-02', 'http://a/2': '2024-01-01'}), 1)
+        self.assertEqual([(task.url, task.lastmod) for task in self.queue.lease(10)], [('http://a/1', '2024-01-02')])
+
+    def test_push_given_up(self):
+        queue = SqliteWorkQueue(self.path, max_attempts=1)
+        try:
+            queue.push('detik', ['http://a/1'])
+            tasks = queue.lease(10)
+            queue.release([task.id for task in tasks])
+            self.assertEqual(queue.lease(10), [])
+            # a url given up (e.g. during an outage) is queued again with new attempts
+            self.assertEqual(queue.push('detik', ['http://a/1']), 1)
+            self.assertEqual([task.url for task in queue.lease(10)], ['http://a/1'])
+        finally:
+            queue.close()
+
+    def test_purge(self):
+        self.queue.push('detik', ['http://a/1', 'http://a/2'])
+        tasks = self.queue.lease(1)
+        self.queue.ack([task.id for task in tasks])
+        self.assertEqual(self.queue.purge(60), 0)
+        self.assertEqual(self.queue.purge(0), 1)
+        # the pending url is kept, the purged one can be queued again
+        self.assertEqual(self.queue.pending(), 1)
+        self.assertEqual(self.queue.push('detik', ['http://a/1']), 1)
+
+    def test_release(self):
+        self.queue.push('detik', ['http://a/1'])
+        tasks = self.queue.lease(10)
+        self.queue.release([task.id for task in tasks])
+        self.assertEqual([task.url for task in self.queue.lease(10)], ['http://a/1'])
+
+    def test_visibility_timeout(self):
+        queue = SqliteWorkQueue(self.path, visibility_timeout=0.2)
+        try:
+            queue.push('detik', ['http://a/1'])
+            self.assertEqual(len(queue.lease(10)), 1)
+            self.assertEqual(queue.lease(10), [])
+            # the lease of a crashed worker expires
+            time.sleep(0.3)
+            self.assertEqual([task.url for task in queue.lease(10)], ['http://a/1'])
+        finally:
+            queue.close()
+
+    def test_max_attempts(self):
+        queue = SqliteWorkQueue(self.path, max_attempts=2)
+        try:
+            queue.push('detik', ['http://a/1'])
+            for _ in range(2):
+                tasks = queue.lease(10)
+                self.assertEqual(len(tasks), 1)
+                queue.release([task.id for task in tasks])
+            # the url is given up
+            self.assertEqual(queue.lease(10), [])
+            self.assertEqual(queue.pending(), 0)
+        finally:
+            queue.close()
+
+
+if __name__ == '__main__':
+    unittest.main()